@@ -10,8 +10,11 @@ const char *WIFI_SSID = "izzatiayb";
 const char *WIFI_PASSWORD = "izzati1234";
 
 const char *MQTT_SERVER = "136.111.56.9";
-const char *MQTT_TOPIC = "iot";
+// Each stop publishes to its own topic: iot/<stop_id>/telemetry
+const char *MQTT_TOPIC = "iot/stop-01/telemetry";
 const int MQTT_PORT = 1883;
+// true: publish the 8-byte binary reading instead of JSON (the bridge accepts both, per message)
+const bool BINARY_PAYLOAD = false;
 
 WiFiClient espClient;
 PubSubClient client(espClient);
@@ -318,23 +321,46 @@ void loop()
   {
     lastMsgTime = millis();
 
-    StaticJsonDocument<256> doc;
-    doc["smoke"] = smokeValue;
-    doc["air"] = airValue;
-    doc["light"] = lightLevel;
-    doc["rain"] = rainDetected;
-    doc["motion"] = isSystemActive;
-    doc["window"] = isWindowClosed ? "CLOSED" : "OPEN";
-    doc["emergency"] = emergencyActive ? "true" : "false";
-
-    char buffer[512];
-    serializeJson(doc, buffer);
-
-    if (client.connected())
+    if (BINARY_PAYLOAD)
+    {
+      // Layout of payloads.py: 0xB1, smoke, air, light (uint16 little-endian), flag bits
+      uint8_t packet[8];
+      packet[0] = 0xB1;
+      packet[1] = smokeValue & 0xFF;
+      packet[2] = smokeValue >> 8;
+      packet[3] = airValue & 0xFF;
+      packet[4] = airValue >> 8;
+      packet[5] = lightLevel & 0xFF;
+      packet[6] = lightLevel >> 8;
+      packet[7] = (rainDetected ? 0x01 : 0) | (isSystemActive ? 0x02 : 0) |
+                  (isWindowClosed ? 0x04 : 0) | (emergencyActive ? 0x08 : 0);
+
+      if (client.connected())
+      {
+        Serial.println("📡 MQTT Publish: 8-byte binary reading");
+        client.publish(MQTT_TOPIC, packet, sizeof(packet));
+      }
+    }
+    else
     {
-      Serial.print("📡 MQTT Publish: ");
-      Serial.println(buffer);
-      client.publish(MQTT_TOPIC, buffer);
+      StaticJsonDocument<256> doc;
+      doc["smoke"] = smokeValue;
+      doc["air"] = airValue;
+      doc["light"] = lightLevel;
+      doc["rain"] = rainDetected;
+      doc["motion"] = isSystemActive;
+      doc["window"] = isWindowClosed ? "CLOSED" : "OPEN";
+      doc["emergency"] = emergencyActive ? "true" : "false";
+
+      char buffer[512];
+      serializeJson(doc, buffer);
+
+      if (client.connected())
+      {
+        Serial.print("📡 MQTT Publish: ");
+        Serial.println(buffer);
+        client.publish(MQTT_TOPIC, buffer);
+      }
     }
   }
   // Removed delay(1000) to keep loop responsive
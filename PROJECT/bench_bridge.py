@@ -0,0 +1,574 @@
+# Benchmark for the MQTT -> Firestore bridge (runs without Firebase or a broker)
+# python bench_bridge.py --messages 2000 --latency-ms 20
+# python bench_bridge.py --stop-counts 1 10 100 1000 --error-rate 0.01 --results bench_bridge_results.json
+# python bench_bridge.py --broker 127.0.0.1:1883   # through a local broker instead of calling on_message
+# python bench_bridge.py --stop-counts   # skip the sweep; the metrics overhead run is always included
+# python bench_bridge.py --encoding mixed   # stops publish JSON, struct and MessagePack side by side
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from itertools import zip_longest
+
+import numpy as np
+
+import mqtt as bridge
+import synthetic
+from metrics import BridgeMetrics
+from payloads import DECODERS, decode_payload, encode_struct
+from schema import Reading, from_columns
+from spool import Spool, SpoolReplayer
+from hotstore import HotStoreWriter
+from rollups import RollupAggregator
+from rules import ALERTS_COLLECTION, RULES, RuleEngine
+
+# ================= FAKE FIRESTORE =================
+FIRESTORE_BATCH_LIMIT = 500  # writes per commit; a bigger batch is rejected whole
+
+class FakeDocument:
+    def __init__(self, collection, doc_id):
+        self.collection_ref = collection
+        self.id = doc_id
+        self.path = f"{collection.name}/{doc_id}"
+
+    def collection(self, name):
+        return FakeCollection(self.collection_ref.db, f"{self.path}/{name}")
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self.writes.append((doc_ref, data, merge))
+
+    def commit(self):
+        if len(self.writes) > FIRESTORE_BATCH_LIMIT:
+            raise RuntimeError(f"400 maximum {FIRESTORE_BATCH_LIMIT} writes allowed per request")
+        self.db.rpc()
+        now = datetime.now(timezone.utc)
+        with self.db.lock:
+            for doc_ref, data, merge in self.writes:
+                old = self.db.docs.get(doc_ref.path, {}) if merge else {}
+                self.db.docs[doc_ref.path] = {**old, **data}
+                if is_reading(doc_ref.path):
+                    self.db.reading_writes += 1
+                    # on_message stamps each reading right after decoding its JSON
+                    self.db.commit_latencies.append((now - data["timestamp"]).total_seconds())
+            self.db.batch_sizes.append(len(self.writes))
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = self.db.next_id()
+        return FakeDocument(self, doc_id)
+
+    def add(self, data):
+        doc_ref = self.document()
+        self.db.rpc()
+        with self.db.lock:
+            self.db.docs[doc_ref.path] = dict(data)
+        return None, doc_ref
+
+    def where(self, field, op, value):
+        """Equality filters only, which is all the bridge queries"""
+        return FakeFilter(self, field, value)
+
+class FakeFilter:
+    def __init__(self, collection, field, value):
+        self.collection = collection
+        self.field = field
+        self.value = value
+
+    def stream(self):
+        db, prefix = self.collection.db, self.collection.name + "/"
+        db.rpc()
+        with db.lock:
+            return [FakeSnapshot(path[len(prefix):], dict(data)) for path, data in db.docs.items()
+                    if path.startswith(prefix) and "/" not in path[len(prefix):] and data.get(self.field) == self.value]
+
+class FakeFirestore:
+    """In-process stand-in for firestore.client(): one sleep per RPC, optionally failing some of them"""
+
+    def __init__(self, latency=0.02, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate  # share of RPCs that raise, on top of fail_until
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.docs = {}
+        self.batch_sizes = []
+        self.reading_writes = 0
+        self.commit_latencies = []  # decode -> commit seconds of every reading write, replays included
+        self.rpcs = 0
+        self.errors = 0
+        self.id_counter = 0
+        self.fail_until = 0.0  # monotonic time until which every RPC raises
+
+    def next_id(self):
+        with self.lock:
+            self.id_counter += 1
+            return f"doc{self.id_counter}"
+
+    def rpc(self):
+        with self.lock:
+            self.rpcs += 1
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail or time.monotonic() < self.fail_until:
+            with self.lock:
+                self.errors += 1
+            raise RuntimeError("503 The service is currently unavailable.")
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def readings(self):
+        """Stored sensor readings, excluding the per-stop parent documents"""
+        with self.lock:
+            return sum(1 for path in self.docs if is_reading(path))
+
+def is_reading(path):
+    return path.startswith(bridge.COLLECTION + "/") or f"/{bridge.COLLECTION}/" in path
+
+# ================= PAYLOADS =================
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+def available_encodings():
+    return [name for name, _, _ in DECODERS if name in ("json", "struct", "msgpack")]
+
+def make_payloads(count, stops=1, seed=0, encoding="json"):
+    """(topic, payload) pairs from synthetic.py, shaped like the ESP32 publish block in arduino.cpp"""
+    # "mixed": stop i uses the i-th available encoding in turn, like a fleet part-way through a migration
+    encodings = available_encodings() if encoding == "mixed" else [encoding]
+    # Each stop sends its most recent readings at the firmware's 5 s interval, interleaved in time
+    # order as a broker would deliver them
+    per_stop = -(-count // stops)
+    end = datetime.now()
+    start = end - timedelta(seconds=per_stop * synthetic.SAMPLE_INTERVAL)
+    streams = [synthetic.to_payloads(columns, stop_id, encodings[i % len(encodings)])[:per_stop]
+               for i, (stop_id, columns) in enumerate(synthetic.iter_stops(stops, start, end, seed=seed))]
+    return [payload for group in zip_longest(*streams) for payload in group if payload is not None][:count]
+
+def struct_mismatches(count, stops=1, seed=0):
+    """(readings checked, readings where to_payloads()'s vectorized struct packing differs from encode_struct())"""
+    per_stop = -(-count // stops)
+    end = datetime.now()
+    start = end - timedelta(seconds=per_stop * synthetic.SAMPLE_INTERVAL)
+    checked = mismatches = 0
+    for stop_id, columns in synthetic.iter_stops(stops, start, end, seed=seed):
+        fields = zip(columns["smoke"].tolist(), columns["air"].tolist(), columns["ldr"].tolist(), columns["rain"].tolist(),
+                     columns["motion_detected"].tolist(), columns["window_closed"].tolist(), columns["panic"].tolist())
+        for (_, payload), reading in zip(synthetic.to_payloads(columns, stop_id, "struct"), fields):
+            checked += 1
+            mismatches += payload != encode_struct(*reading)
+    return checked, mismatches
+
+def percentiles(values):
+    """(p50, p99) of values in milliseconds, or (None, None) when empty"""
+    if not values:
+        return None, None
+    p50, p99 = np.percentile(np.asarray(values) * 1000, [50, 99])
+    return float(p50), float(p99)
+
+# ================= RUNS =================
+def run_per_message(db, payloads):
+    """Baseline: one collection.add() round trip per message (the old on_message)"""
+    start = time.perf_counter()
+    for _, payload in payloads:
+        data = decode_payload(payload)[1]
+        data["timestamp"] = datetime.now(timezone.utc)
+        db.collection(bridge.COLLECTION).add(data)
+    return time.perf_counter() - start
+
+def run_batched(db, payloads, max_size, max_linger):
+    """Batch writer only, fed inline (no queue)"""
+    writer = bridge.BatchWriter(db, max_size=max_size, max_linger=max_linger)
+    start = time.perf_counter()
+    for topic, payload in payloads:
+        data = decode_payload(payload)[1]
+        data["timestamp"] = datetime.now(timezone.utc)
+        data["stop_id"] = bridge.stop_id_from_topic(topic)
+        writer.add(data)
+    writer.close()
+    return time.perf_counter() - start
+
+def temp_spool():
+    return Spool(os.path.join(tempfile.mkdtemp(prefix="bench_bridge_"), "spool.db"))
+
+def deliver_direct(userdata, payloads, handler_times):
+    """Call the bridge's on_message for every payload, as paho's network thread would"""
+    for topic, payload in payloads:
+        t0 = time.perf_counter()
+        bridge.on_message(None, userdata, FakeMessage(topic, payload))
+        handler_times.append(time.perf_counter() - t0)
+
+def deliver_broker(userdata, payloads, handler_times, host, port, timeout=30):
+    """Publish every payload to a broker and let a bridge client subscribed with on_connect receive them"""
+    import paho.mqtt.client as mqtt
+
+    subscribed = threading.Event()
+
+    def on_message(client, userdata, msg):
+        t0 = time.perf_counter()
+        bridge.on_message(client, userdata, msg)
+        handler_times.append(time.perf_counter() - t0)
+
+    subscriber = mqtt.Client(userdata=userdata)
+    subscriber.on_connect = bridge.on_connect
+    subscriber.on_subscribe = lambda *args: subscribed.set()
+    subscriber.on_message = on_message
+    subscriber.connect(host, port, 60)
+    subscriber.loop_start()
+    publisher = mqtt.Client()
+    publisher.connect(host, port, 60)
+    publisher.loop_start()
+    try:
+        if not subscribed.wait(10):
+            raise RuntimeError(f"no subscription acknowledged by {host}:{port}")
+        for topic, payload in payloads:
+            info = publisher.publish(topic, payload, qos=1)
+        info.wait_for_publish(timeout)
+        # The bridge subscribes at QoS 0: stop waiting once deliveries dry up
+        received, idle_since = len(handler_times), time.monotonic()
+        while len(handler_times) < len(payloads) and time.monotonic() - idle_since < 5:
+            time.sleep(0.05)
+            if len(handler_times) != received:
+                received, idle_since = len(handler_times), time.monotonic()
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+        subscriber.loop_stop()
+        subscriber.disconnect()
+
+def run_queued(db, payloads, max_size, max_linger, workers, policy, queue_size, broker=None, trace_memory=False,
+               metrics=None):
+    """Current bridge: on_message -> spool + IngestQueue -> worker pool -> BatchWriter"""
+    if trace_memory:
+        tracemalloc.start()
+    spool = temp_spool()
+    writer = bridge.BatchWriter(db, max_size=max_size, max_linger=max_linger, spool=spool, metrics=metrics)
+    queue = bridge.IngestQueue(writer, spool=spool, max_size=queue_size, workers=workers, policy=policy)
+    replayer = SpoolReplayer(spool, writer, interval=0.2)
+    hotstore = HotStoreWriter(tempfile.mkdtemp(prefix="bench_hotstore_"))
+    rollups = RollupAggregator(db)
+    rules = RuleEngine(db)
+    userdata = {"queue": queue, "spool": spool, "hotstore": hotstore, "rollups": rollups, "rules": rules,
+                "metrics": metrics}
+    if metrics is not None:
+        metrics.watch(queue=queue, spool=spool, replayer=replayer)
+    handler_times = []
+    start = time.perf_counter()
+    try:
+        if broker is None:
+            deliver_direct(userdata, payloads, handler_times)
+        else:
+            deliver_broker(userdata, payloads, handler_times, *broker)
+    finally:
+        queue.close()
+        writer.close()
+        # Dropped/spilled/failed readings are only done once the replayer has emptied the spool
+        while spool.stats()['rows']:
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        replayer.stop()
+        spool.close()
+        hotstore.close()
+        rollups.close()
+        rules.close()
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+    handler_times.sort()
+    p50, p99 = percentiles(db.commit_latencies)
+    return {
+        'elapsed': elapsed, 'received': len(handler_times), 'stored': db.readings(),
+        'msgs_per_s': len(handler_times) / elapsed, 'rpcs': db.rpcs, 'rpc_errors': db.errors,
+        'handler_p50_us': handler_times[len(handler_times) // 2] * 1e6 if handler_times else None,
+        'handler_p99_us': handler_times[max(0, int(len(handler_times) * 0.99) - 1)] * 1e6 if handler_times else None,
+        'latency_p50_ms': p50, 'latency_p99_ms': p99,
+        'peak_memory_mb': peak / 1e6 if peak is not None else None,
+        'queue': queue.stats(),
+    }
+
+def run_sweep(args, latency, stop_counts):
+    """run_queued() at increasing stop counts: one timed pass, then one pass under tracemalloc for memory"""
+    sweep = []
+    for stops in stop_counts:
+        payloads = make_payloads(args.messages, stops, args.seed)
+        db = FakeFirestore(latency, args.error_rate, args.seed)
+        result = run_queued(db, payloads, args.batch_size, args.linger, args.workers, args.policy,
+                            args.queue_size, args.broker)
+        # tracemalloc slows Python down, so memory comes from a separate pass
+        db = FakeFirestore(latency, args.error_rate, args.seed)
+        result['peak_memory_mb'] = run_queued(db, payloads, args.batch_size, args.linger, args.workers, args.policy,
+                                              args.queue_size, args.broker, trace_memory=True)['peak_memory_mb']
+        result['stops'] = stops
+        sweep.append(result)
+    return sweep
+
+def run_metrics_overhead(args, payloads, latency, calls=200000):
+    """Cost of the bridge metrics: per call in isolation, and on_message/throughput with them on and off"""
+    metrics = BridgeMetrics()
+    stop_ids = [f"stop-{i % 100:02d}" for i in range(calls)]
+    start = time.perf_counter()
+    for stop_id in stop_ids:
+        metrics.message(stop_id)
+    message_ns = (time.perf_counter() - start) / calls * 1e9
+    latencies = [0.05] * bridge.BATCH_MAX_SIZE
+    batches = calls // 100
+    start = time.perf_counter()
+    for _ in range(batches):
+        metrics.batch_committed(0.02, latencies)
+    batch_us = (time.perf_counter() - start) / batches * 1e6
+    runs = {}
+    # Alternate the two configurations so drift on a shared machine hits both alike
+    for _ in range(3):
+        for name, run_metrics in (("off", None), ("on", BridgeMetrics())):
+            db = FakeFirestore(latency, 0.0, args.seed)
+            result = run_queued(db, payloads, args.batch_size, args.linger, args.workers, args.policy,
+                                args.queue_size, args.broker, metrics=run_metrics)
+            if run_metrics is not None:
+                result['scrape_bytes'] = len(run_metrics.render())
+            runs.setdefault(name, []).append(result)
+    best = {name: min(results, key=lambda r: r['handler_p50_us']) for name, results in runs.items()}
+    return {
+        'message_ns': message_ns, 'batch_committed_us': batch_us,
+        'handler_p50_us': {name: r['handler_p50_us'] for name, r in best.items()},
+        'handler_p99_us': {name: r['handler_p99_us'] for name, r in best.items()},
+        'msgs_per_s': {name: max(r['msgs_per_s'] for r in results) for name, results in runs.items()},
+        'scrape_bytes': best['on']['scrape_bytes'],
+    }
+
+def run_decode(args, latency, reps=5):
+    """Per encoding: payload size, decode_payload() and decode + schema time, and the queued bridge end to end"""
+    results = []
+    now = datetime.now(timezone.utc)
+    for encoding in available_encodings():
+        messages = make_payloads(args.messages, args.stops, args.seed, encoding)
+        raw = [payload for _, payload in messages]
+        decode = schema = float("inf")
+        for _ in range(reps):
+            start = time.perf_counter()
+            for payload in raw:
+                decode_payload(payload)
+            decode = min(decode, time.perf_counter() - start)
+            start = time.perf_counter()
+            for payload in raw:
+                Reading.from_payload(decode_payload(payload)[1], "stop-01", now)
+            schema = min(schema, time.perf_counter() - start)
+        db = FakeFirestore(latency, 0.0, args.seed)
+        queued = run_queued(db, messages, args.batch_size, args.linger, args.workers, args.policy, args.queue_size)
+        results.append({
+            'encoding': encoding, 'bytes': sum(map(len, raw)) / len(raw),
+            'decode_us': decode / len(raw) * 1e6, 'decode_schema_us': schema / len(raw) * 1e6,
+            'handler_p50_us': queued['handler_p50_us'], 'msgs_per_s': queued['msgs_per_s'], 'stored': queued['stored'],
+        })
+    return results
+
+def run_rules(args, readings=20000):
+    """RuleEngine.evaluate() per reading (in memory, no writes) and the alerts it raised"""
+    stops = max(args.stops, 1)
+    per_stop = -(-readings // stops)
+    end = datetime.now()
+    start = end - timedelta(seconds=per_stop * synthetic.SAMPLE_INTERVAL)
+    batch = []
+    for stop_id, columns in synthetic.iter_stops(stops, start, end, seed=args.seed):
+        batch += from_columns(columns, stop_id)
+    engine = RuleEngine()
+    started = time.perf_counter()
+    for reading in batch:
+        engine.evaluate(reading)
+    elapsed = time.perf_counter() - started
+    return {'readings': len(batch), 'stops': stops, 'evaluate_us': elapsed / len(batch) * 1e6, **engine.stats()}
+
+def run_alert_burst(latency, stops=600):
+    """Every stop raises at once (more alert writes than one batch holds), the bridge crashes, a restart closes up"""
+    db = FakeFirestore(latency)
+    now = datetime.now(timezone.utc)
+    engine = RuleEngine(db, flush_interval=3600)
+    for stop in range(stops):
+        engine.evaluate(Reading(now, synthetic.stop_name(stop), panic=True))
+    engine.flush()
+    burst = engine.stats()
+    # The crash: the engine is dropped without close(), its alerts are still active in Firestore
+    engine.stop_flag.set()
+    restarted = RuleEngine(db, flush_interval=3600)
+    later = now + timedelta(seconds=synthetic.SAMPLE_INTERVAL)
+    for stop in range(stops):
+        # Half the stops raise again after the restart and are still raised at shutdown
+        restarted.evaluate(Reading(later, synthetic.stop_name(stop), panic=stop % 2 == 0))
+    restarted.close()
+    with db.lock:
+        alerts = [data for path, data in db.docs.items() if f"/{ALERTS_COLLECTION}/" in path]
+    return {'stops': stops, 'burst': burst, 'restart': restarted.stats(), 'alerts': len(alerts),
+            'active_left': sum(bool(alert.get('active')) for alert in alerts)}
+
+def run_outage(db, payloads, outage):
+    """Firestore down for the first `outage` seconds, bridge restarted mid-way: nothing lost or duplicated"""
+    spool = temp_spool()
+    hotstore = HotStoreWriter(tempfile.mkdtemp(prefix="bench_hotstore_"))
+    rollups = RollupAggregator(db)
+    rules = RuleEngine(db)
+    db.fail_until = time.monotonic() + outage
+    half = len(payloads) // 2
+    for part in (payloads[:half], payloads[half:]):
+        # Each pass is one bridge process sharing the same spool file
+        spool = Spool(spool.path)
+        writer = bridge.BatchWriter(db, max_size=50, max_linger=0.1, spool=spool)
+        queue = bridge.IngestQueue(writer, spool=spool, workers=2)
+        replayer = SpoolReplayer(spool, writer, interval=0.1)
+        userdata = {"queue": queue, "spool": spool, "hotstore": hotstore, "rollups": rollups, "rules": rules}
+        for topic, payload in part:
+            bridge.on_message(None, userdata, FakeMessage(topic, payload))
+        queue.close()
+        writer.close()
+        replayer.stop()
+        spool.close()
+    spool = Spool(spool.path)
+    replayer = SpoolReplayer(spool, writer, interval=0.1)
+    writer.spool = spool
+    while spool.stats()['rows']:
+        time.sleep(0.05)
+    replayer.stop()
+    spool.close()
+    hotstore.close()
+    rollups.close()
+    rules.close()
+
+def parse_broker(value):
+    host, _, port = value.partition(":")
+    return host, int(port or 1883)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge ingest benchmark against a fake Firestore")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--stops", type=int, default=1, help="number of bus stops the messages are spread over")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated Firestore RPC latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of Firestore RPCs that fail (queued runs)")
+    parser.add_argument("--batch-size", type=int, default=bridge.BATCH_MAX_SIZE)
+    parser.add_argument("--linger", type=float, default=bridge.BATCH_MAX_LINGER)
+    parser.add_argument("--workers", type=int, default=bridge.QUEUE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=bridge.QUEUE_MAX_SIZE)
+    parser.add_argument("--policy", default="block", choices=["block", "drop_oldest", "spill"])
+    parser.add_argument("--outage", type=float, default=1.0, help="seconds of Firestore errors in the outage run")
+    parser.add_argument("--stop-counts", type=int, nargs="*", default=[1, 10, 100, 1000],
+                        help="stop counts for the queued sweep (none to skip it)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic payloads and injected errors")
+    parser.add_argument("--encoding", default="json", choices=["json", "struct", "msgpack", "mixed"],
+                        help="payload format the stops publish (msgpack needs pip install msgpack)")
+    parser.add_argument("--broker", type=parse_broker, help="HOST[:PORT] of a broker to send the queued runs through")
+    parser.add_argument("--results", help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    if args.encoding != "mixed" and args.encoding not in available_encodings():
+        parser.error(f"{args.encoding} payloads need the msgpack package")
+    payloads = make_payloads(args.messages, args.stops, args.seed, args.encoding)
+    latency = args.latency_ms / 1000
+    results = []
+    # The bridge prints per message; keep that out of the timings, the memory figures and the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        db = FakeFirestore(latency)
+        elapsed = run_per_message(db, payloads)
+        results.append(("per-message add()", args.messages / elapsed, db.rpcs, db.readings()))
+
+        db = FakeFirestore(latency)
+        elapsed = run_batched(db, payloads, args.batch_size, args.linger)
+        results.append((f"batched (size={args.batch_size}, linger={args.linger}s)", args.messages / elapsed, db.rpcs, db.readings()))
+
+        db = FakeFirestore(latency, args.error_rate, args.seed)
+        queued = run_queued(db, payloads, args.batch_size, args.linger, args.workers, args.policy,
+                            args.queue_size, args.broker)
+        results.append((f"queued ({args.workers} workers, {args.policy})", queued['msgs_per_s'], db.rpcs, db.readings()))
+
+        db = FakeFirestore(latency)
+        run_outage(db, payloads, args.outage)
+        outage = {'seconds': args.outage, 'stored': db.readings(), 'rewrites': db.reading_writes - db.readings()}
+
+        sweep = run_sweep(args, latency, args.stop_counts)
+        overhead = run_metrics_overhead(args, payloads, latency)
+        decoding = run_decode(args, latency)
+        packers = struct_mismatches(args.messages, args.stops, args.seed)
+        rules = run_rules(args)
+        burst = run_alert_burst(latency)
+
+    transport = f"broker {args.broker[0]}:{args.broker[1]}" if args.broker else "on_message called directly"
+    print(f"{args.messages} {args.encoding} messages from {args.stops} stops, simulated RPC latency {args.latency_ms:.1f} ms, "
+          f"error rate {args.error_rate:.1%} (queued runs), {transport}")
+    for name, rate, rpcs, stored in results:
+        print(f"  {name:<38} {rate:>10.1f} msgs/s  rpcs={rpcs:<6} stored={stored}")
+    queue_stats = queued['queue']
+    print(f"  queued: on_message p99 {queued['handler_p99_us']:.1f} us, max depth {queue_stats['max_depth']}, "
+          f"avg wait {queue_stats['avg_wait_ms']:.2f} ms, dropped {queue_stats['dropped']}, spilled {queue_stats['spilled']}, "
+          f"decode->commit p50/p99 {queued['latency_p50_ms']:.0f}/{queued['latency_p99_ms']:.0f} ms")
+    print(f"  outage {args.outage:.1f}s + restart: {outage['stored']}/{args.messages} readings stored "
+          f"({outage['rewrites']} rewrites of the same document)")
+    print(f"Metrics overhead: message() {overhead['message_ns']:.0f} ns, "
+          f"batch_committed({bridge.BATCH_MAX_SIZE}) {overhead['batch_committed_us']:.1f} us, "
+          f"/metrics page {overhead['scrape_bytes']} bytes")
+    for name in ("off", "on"):
+        print(f"  metrics {name:<3} on_message p50/p99 {overhead['handler_p50_us'][name]:.1f}/"
+              f"{overhead['handler_p99_us'][name]:.1f} us, {overhead['msgs_per_s'][name]:.1f} msgs/s")
+    print("Payload encodings (decode = decode_payload(); + schema = Reading.from_payload() too; on_message p50 queued)")
+    for r in decoding:
+        print(f"  {r['encoding']:<8} {r['bytes']:>6.1f} bytes  decode {r['decode_us']:>5.2f} us  + schema {r['decode_schema_us']:>5.2f} us  "
+              f"on_message p50 {r['handler_p50_us']:>6.1f} us  {r['msgs_per_s']:>8.1f} msgs/s  stored={r['stored']}")
+    print(f"  struct packers (to_payloads vs encode_struct): {packers[1]} mismatches over {packers[0]} readings")
+    print(f"Rule engine: {rules['evaluate_us']:.2f} us per reading ({len(RULES)} rules, {rules['stops']} stops), "
+          f"{rules['raised']} alerts raised over {rules['readings']} synthetic readings")
+    print(f"  alert burst ({burst['stops']} stops at once): written={burst['burst']['written']} "
+          f"failed={burst['burst']['failed']} pending={burst['burst']['pending']}; after a crash and a restart "
+          f"{burst['restart']['cleared']} alerts closed, {burst['active_left']}/{burst['alerts']} still active")
+    if sweep:
+        print(f"Stop-count sweep (queued, {args.workers} workers, {args.policy})")
+        print(f"  {'stops':>6} {'msgs/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8} {'rpc errors':>10} {'stored':>8}")
+        for r in sweep:
+            print(f"  {r['stops']:>6} {r['msgs_per_s']:>10.1f} {r['latency_p50_ms']:>8.0f} {r['latency_p99_ms']:>8.0f} "
+                  f"{r['peak_memory_mb']:>8.1f} {r['rpc_errors']:>10} {r['stored']:>8}")
+
+    if args.results:
+        report = {
+            'timestamp': datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {**vars(args), 'broker': ":".join(map(str, args.broker)) if args.broker else None},
+            'runs': [{'name': name, 'msgs_per_s': rate, 'rpcs': rpcs, 'stored': stored} for name, rate, rpcs, stored in results],
+            'queued': queued,
+            'outage': outage,
+            'sweep': sweep,
+            'metrics_overhead': overhead,
+            'encodings': decoding,
+            'rules': rules,
+            'alert_burst': burst,
+        }
+        with open(args.results, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.results}")
+
+if __name__ == "__main__":
+    main()
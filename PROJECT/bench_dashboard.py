@@ -0,0 +1,624 @@
+# Benchmark for the dashboard: the camera pipeline (runs without a camera) and whole-script reruns
+# rendered headless with Streamlit's AppTest against synthetic datasets, and the snapshot listener fed by a
+# fake watch and the direct MQTT live feed fed by a fake client or a local broker (no Firebase needed)
+# python bench_dashboard.py --sessions 10 --capture-seconds 8
+# python bench_dashboard.py --capture-seconds 0 --resolutions 720p --render-rows 50 10000 1000000
+# python bench_dashboard.py --capture-seconds 0 --render-rows --listener-seconds 0 --broker 127.0.0.1:1883
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import camera as camera_module
+import hotstore
+import payloads
+import synthetic
+from camera import CameraService, PREVIEW_WIDTH
+from recorder import RECORD_FPS, EmergencyRecorder
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+def make_frame(width, height, seed=0):
+    """Test frame: gradients plus sensor-like noise, so JPEG has real work to do"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      np.full((height, width), 128, np.float32)], axis=-1)
+    frame += rng.normal(0, 8, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def pil_preview(frame):
+    """The previous per-rerun path: PIL image -> JPEG q85 in a BytesIO"""
+    pil_image = Image.fromarray(frame.astype('uint8'))
+    img_bytes = io.BytesIO()
+    pil_image.save(img_bytes, format='JPEG', quality=85)
+    img_bytes.seek(0)
+    return img_bytes
+
+def timed(fn, repeat):
+    """Mean seconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def run_resolution(width, height, sessions, repeat):
+    frame = make_frame(width, height)
+    pil = timed(lambda: pil_preview(frame), repeat)
+
+    camera = CameraService(0, width, height)
+
+    def encode_new_frame():
+        camera._publish(frame)  # a new frame_id forces an encode
+        camera.preview()
+
+    cached_encode = timed(encode_new_frame, repeat)
+    # Per captured frame (~30/s) before the dual-resolution pipeline: BGR -> RGB for everyone
+    convert = timed(lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), repeat)
+    # A rerun with no new frame since the last one: every session reuses the cached bytes
+    camera.preview()
+    cached_hit = timed(camera.preview, repeat * 100)
+    size_pil = len(pil_preview(frame).getvalue())
+    size_cv2 = len(camera.preview()[1])
+    return {
+        'pil_ms': pil * 1000, 'encode_ms': cached_encode * 1000, 'hit_us': cached_hit * 1e6, 'convert_ms': convert * 1000,
+        'pil_rerun_ms': pil * sessions * 1000, 'cached_rerun_ms': (cached_encode + cached_hit * (sessions - 1)) * 1000,
+        'size_pil': size_pil, 'size_cv2': size_cv2,
+    }
+
+# ================= ADAPTIVE CAPTURE =================
+class FakeCapture:
+    """cv2.VideoCapture stand-in delivering `frames` in a loop at `fps`; counts decodes, can fail like an unplugged device"""
+
+    def __init__(self, frames, fps=30, fail_after=None):
+        self.frames = frames
+        self.fail_after = fail_after  # grabs before the device is lost
+        self.interval = 1 / fps
+        self.index = 0
+        self.retrieved = 0
+        self.next_frame = time.monotonic()
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def grab(self):
+        if self.fail_after is not None and self.index >= self.fail_after:
+            raise RuntimeError("device lost")
+        self.next_frame += self.interval
+        time.sleep(max(0.0, self.next_frame - time.monotonic()))
+        self.index += 1
+        return True
+
+    def retrieve(self):
+        self.retrieved += 1
+        return True, self.frames[self.index % len(self.frames)].copy()
+
+    def read(self):
+        self.grab()
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+def scene_frames(width, height, moving, count=30):
+    """A static shelter (sensor noise only) or one with an object crossing it"""
+    rng = np.random.default_rng(1)
+    base = make_frame(width, height).astype(np.int16)
+    frames = []
+    for i in range(count):
+        frame = base + rng.normal(0, 4, base.shape).astype(np.int16)
+        if moving:
+            x = int(i / count * (width - width // 5))
+            frame[height // 3:height // 3 * 2, x:x + width // 5] = 30
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+def run_capture(width, height, moving, seconds):
+    """One subscribed session for `seconds`, then an emergency recording of `seconds`"""
+    capture = FakeCapture(scene_frames(width, height, moving))
+    original = camera_module.CameraService._open
+    camera_module.CameraService._open = lambda self: capture
+    try:
+        camera = CameraService(0, width, height)
+        camera.subscribe("bench")
+        time.sleep(camera_module.ACTIVE_HOLD + 1)  # the first frame always counts as a change
+        cpu, first_id, decoded = time.process_time(), camera.frame_id, capture.retrieved
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu
+        published = camera.frame_id - first_id
+        decoded = capture.retrieved - decoded
+        recorder = EmergencyRecorder(camera, tempfile.mkdtemp(prefix="bench_recordings_"))
+        recorder.start(seconds)
+        while recorder.status() is not None:
+            camera.subscribe("bench")
+            time.sleep(0.2)
+        ended = time.time()
+        recording = recorder.history()[0]
+        camera.unsubscribe("bench")
+    finally:
+        camera_module.CameraService._open = original
+    return {
+        'cpu_pct': cpu / seconds * 100, 'decoded': decoded, 'published': published,
+        'fps': published / seconds, 'frames': recording['frame_count'],
+        'video_kb': os.path.getsize(recording['filepath']) / 1024,
+        # Real-time playback: the file's length at RECORD_FPS against the capture time it covers
+        'playback_s': recording['frame_count'] / RECORD_FPS, 'captured_s': ended - recording['first_timestamp'],
+    }
+
+def run_camera_loss(width, height, seconds):
+    """The device fails a second into an emergency recording of `seconds`: recorder CPU until the recording ends"""
+    capture = FakeCapture(scene_frames(width, height, False), fail_after=30)
+    original = camera_module.CameraService._open
+    camera_module.CameraService._open = lambda self: capture
+    try:
+        camera = CameraService(0, width, height)
+        recorder = EmergencyRecorder(camera, tempfile.mkdtemp(prefix="bench_recordings_"))
+        started, cpu = time.monotonic(), time.process_time()
+        recorder.start(seconds)
+        while recorder.status() is not None and time.monotonic() - started < seconds + 5:
+            time.sleep(0.1)
+        elapsed, cpu = time.monotonic() - started, time.process_time() - cpu
+        recording = recorder.history()[0] if recorder.history() else None
+    finally:
+        camera_module.CameraService._open = original
+    return {'elapsed_s': elapsed, 'cpu_pct': cpu / elapsed * 100, 'frames': recording['frame_count'] if recording else 0}
+
+# ================= RERUN RENDER =================
+DASHBOARD_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard.py")
+BACKFILL_ROWS = 500  # dashboard INITIAL_BACKFILL
+
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.data = data
+
+    def to_dict(self):
+        return dict(self.data)
+
+class FakeChange:
+    def __init__(self, kind, document):
+        self.type = types.SimpleNamespace(name=kind)
+        self.document = document
+
+class FakeWatch:
+    """Query.on_snapshot stand-in: pushes a new reading every `interval` seconds as an ADDED change,
+    re-sends every fifth one as MODIFIED (a spool replay rewriting it) and every tenth adds a late
+    reading from ten minutes ago with the panic flag set (a replay committed after newer readings)"""
+
+    def __init__(self, callback, stop_id, interval):
+        self.callback = callback
+        self.stop_id = stop_id
+        self.interval = interval
+        self.sent = {}  # doc id -> reading timestamp of every ADDED change
+        self.is_active = True
+        self.stop_flag = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def unsubscribe(self):
+        self.is_active = False
+        self.stop_flag.set()
+
+    def _doc(self, doc_id, timestamp, panic=False):
+        row = {"timestamp": timestamp, "stop_id": self.stop_id, "smoke": 600, "air": 1200, "ldr": 3000, "rain": False,
+               "motion_detected": False, "panic": panic, "window": "OPEN", "committed_at": datetime.now(timezone.utc)}
+        return FakeDoc(doc_id, row)
+
+    def _loop(self):
+        count = 0
+        previous = None
+        while not self.stop_flag.wait(self.interval):
+            count += 1
+            now = datetime.now(timezone.utc).replace(tzinfo=None)  # naive UTC, as the VM bridge stamps readings
+            doc = self._doc(f"live{count}", now)
+            changes = [FakeChange("ADDED", doc)]
+            if count % 5 == 0 and previous is not None:
+                changes.append(FakeChange("MODIFIED", previous))
+            if count % 10 == 0:
+                late = self._doc(f"late{count}", now - timedelta(minutes=10), panic=True)
+                changes.append(FakeChange("ADDED", late))
+            for change in changes:
+                if change.type.name == "ADDED":
+                    self.sent[change.document.id] = change.document.data["timestamp"]
+            self.callback([], changes, datetime.now(timezone.utc))
+            previous = doc
+
+class FakeQuery:
+    """Just enough Firestore for the dashboard: a stop list, a backfill of `docs` (oldest first) and, when
+    `feed_interval` is set, a FakeWatch pushing new readings to a snapshot listener on the readings"""
+
+    def __init__(self, stop_id, docs, feed_interval=None, name=None):
+        self.stop_id = stop_id
+        self.docs = docs
+        self.feed_interval = feed_interval
+        self.name = name
+        self.watches = []
+
+    def collection(self, name):
+        query = FakeQuery(self.stop_id, self.docs, self.feed_interval, name)
+        query.watches = self.watches  # shared, so the bench can reach the dashboard's listener
+        return query
+
+    def document(self, doc_id=None):
+        return self
+
+    def select(self, fields):
+        return FakeQuery(self.stop_id, [FakeDoc(self.stop_id, {})])
+
+    def _empty(self):
+        query = FakeQuery(self.stop_id, [], self.feed_interval, self.name)
+        query.watches = self.watches
+        return query
+
+    def where(self, *args, **kwargs):
+        return self._empty()
+
+    def order_by(self, *args, **kwargs):
+        return self
+
+    def start_after(self, cursor):
+        return self._empty()
+
+    def limit(self, count):
+        return FakeQuery(self.stop_id, self.docs[::-1][:count])  # the backfill asks for the newest first
+
+    def stream(self):
+        return iter(self.docs)
+
+    def on_snapshot(self, callback):
+        if self.feed_interval is None or self.name != "sensor_readings":
+            return types.SimpleNamespace(is_active=True, unsubscribe=lambda: None)  # e.g. the alerts: nothing to push
+        watch = FakeWatch(callback, self.stop_id, self.feed_interval)
+        self.watches.append(watch)
+        return watch
+
+def install_fake_firebase():
+    """Initialize firebase_admin with an anonymous credential so the dashboard skips firebasekey.json"""
+    import firebase_admin
+    from firebase_admin import credentials
+    from google.auth.credentials import AnonymousCredentials
+
+    class BenchCredential(credentials.Base):
+        def get_credential(self):
+            return AnonymousCredentials()
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(BenchCredential(), {"projectId": "bench"})
+
+def render_dataset(rows, reruns, root):
+    """Render dashboard.py headless over `rows` synthetic readings of the last day, held in a local hot store"""
+    from firebase_admin import firestore
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    stop_id = synthetic.stop_name(0)
+    end = datetime.now()
+    columns = synthetic.generate_stop(0, end - timedelta(days=1), end, interval=86400 / rows)
+    store = os.path.join(root, f"hotstore_{rows}")
+    writer = hotstore.HotStoreWriter(store)
+    writer.append_columns(stop_id, columns)
+    writer.close()
+    backfill = synthetic.to_records({name: values[-BACKFILL_ROWS:] for name, values in columns.items()}, stop_id)
+    firestore.client = lambda app=None: FakeQuery(stop_id, [FakeDoc(f"r{i}", row) for i, row in enumerate(backfill)])
+    hotstore.HOTSTORE_DIR = store  # absolute: the dashboard's HOTSTORE_PATH join resolves to it
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    at = AppTest.from_file(DASHBOARD_SCRIPT, default_timeout=600)
+    at.session_state["source_mode"] = "poll"  # no snapshot listener on the fake client
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    deadline = time.monotonic() + 30
+    while at.session_state["fetch_counter"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.2)
+        at.run()
+    # The backfill bumped the data version: this rerun rebuilds every cached frame and chart
+    start = time.perf_counter()
+    at.run()
+    new_data = time.perf_counter() - start
+    steady = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        steady.append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    sections = {name: statistics.median(list(samples)[-reruns:]) for name, samples in at.session_state["section_times"].items()}
+    return {'rows': len(columns["timestamp"]), 'first_s': first, 'new_data_s': new_data,
+            'steady_ms': statistics.median(steady) * 1000, 'sections': sections}
+
+def quiet_streamlit():
+    import streamlit.testing.v1  # creates streamlit's loggers
+    # AppTest warns about running without a server; streamlit sets each logger's level itself
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+def run_render(row_counts, reruns):
+    quiet_streamlit()
+    install_fake_firebase()
+    root = tempfile.mkdtemp(prefix="bench_render_")
+    try:
+        return [render_dataset(rows, reruns, root) for rows in row_counts]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def run_listener(seconds, interval, root):
+    """Dashboard in Push mode against a FakeWatch: lag from change event to history, late and replayed readings"""
+    from firebase_admin import firestore
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    stop_id = synthetic.stop_name(0)
+    end = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=5)  # UTC, older than every live reading
+    columns = synthetic.generate_stop(0, end - timedelta(hours=1), end)
+    backfill = synthetic.to_records({name: values[-BACKFILL_ROWS:] for name, values in columns.items()}, stop_id)
+    client = FakeQuery(stop_id, [FakeDoc(f"r{i}", row) for i, row in enumerate(backfill)], feed_interval=interval)
+    firestore.client = lambda app=None: client
+    hotstore.HOTSTORE_DIR = os.path.join(root, "no_hotstore")
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    at = AppTest.from_file(DASHBOARD_SCRIPT, default_timeout=600)
+    at.session_state["source_mode"] = "listener"
+    at.run()
+    # The first fetch cycle backfills, the next one subscribes
+    deadline = time.monotonic() + 30
+    while not client.watches and time.monotonic() < deadline:
+        time.sleep(0.2)
+        at.run()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        at.run()
+    for watch in client.watches:
+        watch.unsubscribe()
+    time.sleep(interval)
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    sent = {}
+    for watch in client.watches:
+        sent.update(watch.sent)
+    timestamps = at.session_state["cached_data"]["timestamp"]
+    newest_live = max((ts for doc_id, ts in sent.items() if doc_id.startswith("live")), default=None)
+    # The dashboard's own lag samples: one per reading that arrived after the backfill, the late one included
+    lags = sorted(at.session_state["lag_samples"])
+    return {
+        'added': len(sent), 'late': sum(doc_id.startswith("late") for doc_id in sent),
+        'stored': len(timestamps) - len(backfill), 'ordered': bool(np.all(np.diff(timestamps) >= 0)),
+        'newest_is_live': newest_live is not None and timestamps[-1] == (newest_live - datetime(1970, 1, 1)).total_seconds(),
+        'panic': at.session_state["last_panic_state"],
+        'lag_samples': len(lags),
+        'lag_p50_ms': lags[len(lags) // 2] * 1000 if lags else float("nan"),
+        'lag_max_s': lags[-1] if lags else float("nan"),
+    }
+
+# ================= DIRECT MQTT LIVE FEED =================
+LIVE_ENCODINGS = ("json", "struct", "msgpack")
+
+class FakeMqttClient:
+    """paho Client stand-in for the dashboard's live feed: the bench hands it messages with deliver()"""
+
+    def __init__(self, *args, **kwargs):
+        self.on_connect = None
+        self.on_message = None
+        self.topics = []
+        self.handler_seconds = []
+        FAKE_MQTT_CLIENTS.append(self)
+
+    def connect_async(self, host, port, keepalive=60):
+        self.address = (host, port)
+
+    def loop_start(self):
+        self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, topics):
+        self.topics = [topic for topic, _ in topics]
+
+    def deliver(self, topic, payload):
+        """One broker message through the dashboard's on_message, on the caller's thread"""
+        started = time.perf_counter()
+        self.on_message(self, None, types.SimpleNamespace(topic=topic, payload=payload))
+        self.handler_seconds.append(time.perf_counter() - started)
+
+FAKE_MQTT_CLIENTS = []
+
+def live_messages(stop_id, count):
+    """(topic, payload, smoke or None when the dashboard must reject it): encodings in turn, three bad payloads midway"""
+    end = datetime.now()
+    columns = synthetic.generate_stop(0, end - timedelta(seconds=synthetic.SAMPLE_INTERVAL * count), end)
+    columns = {name: values[:count] for name, values in columns.items()}
+    columns["smoke"] = np.arange(1000, 1000 + len(columns["smoke"]), dtype=columns["smoke"].dtype)  # one tile value per message
+    encodings = [encoding for encoding in LIVE_ENCODINGS if encoding != "msgpack" or payloads.msgpack is not None]
+    encoded = {encoding: synthetic.to_payloads(columns, stop_id, encoding) for encoding in encodings}
+    messages = []
+    for i, smoke in enumerate(columns["smoke"].tolist()):
+        topic, payload = encoded[encodings[i % len(encodings)]][i]
+        messages.append((topic, payload, smoke))
+        if i == len(columns["smoke"]) // 2:
+            messages.append((topic, b'{"smoke": ', None))  # truncated JSON
+            messages.append((topic, b'{"smoke": 99999, "air": 1, "light": 1}', None))  # outside the ADC range
+            messages.append((topic, b'{"smoke": 2000}', None))  # air and light missing
+    return messages
+
+def run_live_feed(count, broker=None):
+    """Dashboard with the live tiles on: each message, then a rerun that must show it (or keep the previous one)"""
+    import paho.mqtt.client as paho
+    from firebase_admin import firestore
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    stop_id = synthetic.stop_name(0)
+    end = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=5)
+    columns = synthetic.generate_stop(0, end - timedelta(hours=1), end)
+    backfill = synthetic.to_records({name: values[-BACKFILL_ROWS:] for name, values in columns.items()}, stop_id)
+    firestore.client = lambda app=None: FakeQuery(stop_id, [FakeDoc(f"r{i}", row) for i, row in enumerate(backfill)])
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    del FAKE_MQTT_CLIENTS[:]
+    original = paho.Client
+    publisher = None
+    if broker is None:
+        paho.Client = FakeMqttClient
+    else:
+        publisher = paho.Client()
+        publisher.connect(*broker)
+        publisher.loop_start()
+    try:
+        at = AppTest.from_file(DASHBOARD_SCRIPT, default_timeout=600)
+        at.session_state["source_mode"] = "poll"
+        at.run()
+        next(box for box in at.checkbox if box.label == "Live tiles from MQTT broker").check()
+        if broker is not None:
+            next(box for box in at.text_input if box.label == "Broker Host").set_value(broker[0])
+            next(box for box in at.number_input if box.label == "Broker Port").set_value(broker[1])
+            at.run()
+            time.sleep(1)  # the dashboard's subscription
+        at.run()
+        shown = None
+        correct = rejected = 0
+        messages = live_messages(stop_id, count)
+        for topic, payload, smoke in messages:
+            if broker is None:
+                FAKE_MQTT_CLIENTS[-1].deliver(topic, payload)
+            else:
+                publisher.publish(topic, payload, qos=1).wait_for_publish()
+                time.sleep(0.1)
+            at.run()
+            tile = next(metric.value for metric in at.metric if metric.label == "💨 Smoke Sensor")
+            if smoke is None:
+                rejected += tile.split()[0] == str(shown)
+            else:
+                shown = smoke
+                correct += tile.split()[0] == str(smoke)
+        live_caption = any(caption.value.startswith("📡 Live from MQTT broker") for caption in at.caption)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    finally:
+        paho.Client = original
+        if publisher is not None:
+            publisher.loop_stop()
+            publisher.disconnect()
+    handler = sorted(FAKE_MQTT_CLIENTS[-1].handler_seconds) if FAKE_MQTT_CLIENTS else []
+    return {
+        'valid': sum(smoke is not None for _, _, smoke in messages), 'correct': correct,
+        'invalid': sum(smoke is None for _, _, smoke in messages), 'rejected': rejected, 'caption': live_caption,
+        'handler_p50_us': handler[len(handler) // 2] * 1e6 if handler else float("nan"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera preview benchmark: full-frame PIL per rerun vs cached downscaled JPEG")
+    parser.add_argument("--sessions", type=int, default=10, help="browser sessions rerunning on the same frame")
+    parser.add_argument("--repeat", type=int, default=30, help="encodes timed per path and resolution")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--capture-seconds", type=float, default=8.0,
+                        help="length of each adaptive capture run and of its recording (0 to skip)")
+    parser.add_argument("--render-rows", type=int, nargs="*", default=[50, 10000, 1000000],
+                        help="dataset sizes for the headless rerun benchmark (none to skip)")
+    parser.add_argument("--reruns", type=int, default=5, help="steady-state reruns timed per dataset")
+    parser.add_argument("--listener-seconds", type=float, default=15.0,
+                        help="length of the snapshot listener run against a fake watch (0 to skip)")
+    parser.add_argument("--feed-interval", type=float, default=0.5, help="seconds between the fake watch's change events")
+    parser.add_argument("--live-messages", type=int, default=12,
+                        help="MQTT messages sent to the dashboard's live feed, one rerun each (0 to skip)")
+    parser.add_argument("--broker", default=None, metavar="HOST:PORT",
+                        help="send the live feed's messages through a real broker (e.g. a local Mosquitto) instead of a fake client")
+    args = parser.parse_args()
+
+    print(f"Camera preview ({PREVIEW_WIDTH} px wide), {args.sessions} sessions rerunning on the same frame")
+    print(f"  {'':<6} {'PIL encode':>12} {'preview':>12} {'cache hit':>11} "
+          f"{'PIL/rerun':>11} {'cached/rerun':>13} {'JPEG KB (PIL/preview)':>22} {'old RGB convert':>16}")
+    for name in args.resolutions:
+        width, height = RESOLUTIONS[name]
+        r = run_resolution(width, height, args.sessions, args.repeat)
+        print(f"  {name:<6} {r['pil_ms']:>9.2f} ms {r['encode_ms']:>9.2f} ms {r['hit_us']:>8.2f} us "
+              f"{r['pil_rerun_ms']:>8.1f} ms {r['cached_rerun_ms']:>10.1f} ms "
+              f"{r['size_pil'] / 1024:>13.0f} / {r['size_cv2'] / 1024:<6.0f} {r['convert_ms']:>10.2f} ms")
+    print("  PIL encode = old full-frame JPEG per session per rerun; preview = downscale + JPEG once per new frame;")
+    print("  per rerun = CPU for all sessions showing one frame; old RGB convert = per captured frame, now skipped")
+
+    if args.capture_seconds > 0:
+        width, height = RESOLUTIONS["720p"]
+        print(f"Adaptive capture, 720p device at 30 fps, {args.capture_seconds:.0f}s per run")
+        for name, moving in (("static", False), ("moving", True)):
+            r = run_capture(width, height, moving, args.capture_seconds)
+            print(f"  {name:<7} CPU {r['cpu_pct']:>5.1f}%  decoded {r['decoded']:>4}  published {r['fps']:>5.1f} fps  "
+                  f"recording {r['frames']:>4} frames, {r['video_kb']:>7.0f} KB, plays {r['playback_s']:.1f}s "
+                  f"of {r['captured_s']:.1f}s captured")
+        r = run_camera_loss(width, height, args.capture_seconds)
+        print(f"  camera lost 1s into a {args.capture_seconds:.0f}s recording: ended after {r['elapsed_s']:.1f}s, "
+              f"{r['frames']} frames, CPU {r['cpu_pct']:.1f}% meanwhile")
+
+    if args.render_rows:
+        # The dashboard and its fetcher print as they go; keep that out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            renders = run_render(args.render_rows, args.reruns)
+        print(f"Dashboard reruns (AppTest, Day view from the hot store, median of {args.reruns} steady reruns)")
+        print(f"  {'rows':>9} {'first run':>10} {'new data':>10} {'steady':>10} {'script':>8}  slowest sections when steady")
+        for r in renders:
+            slowest = sorted((item for item in r['sections'].items() if item[0] != 'rerun'), key=lambda item: -item[1])[:3]
+            print(f"  {r['rows']:>9,} {r['first_s']:>8.2f} s {r['new_data_s']:>8.2f} s {r['steady_ms']:>7.0f} ms "
+                  f"{r['sections'].get('rerun', 0) * 1000:>5.0f} ms  "
+                  + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in slowest))
+        print("  first run = cold caches; new data = the rerun after the backfill (every cached frame rebuilt);")
+        print("  steady = reruns with nothing new, as every 5 s autorefresh between readings (AppTest's own polling included);")
+        print("  script = the dashboard script's own time for that rerun")
+
+    if args.listener_seconds > 0:
+        quiet_streamlit()
+        install_fake_firebase()
+        root = tempfile.mkdtemp(prefix="bench_listener_")
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                r = run_listener(args.listener_seconds, args.feed_interval, root)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        print(f"Snapshot listener (fake watch, a change event every {args.feed_interval:g}s for {args.listener_seconds:.0f}s)")
+        print(f"  {r['added']} readings added ({r['late']} late by 10 min), {r['stored']} in history, "
+              f"in timestamp order: {r['ordered']}, newest is the newest live reading: {r['newest_is_live']}, "
+              f"panic from a late reading: {r['panic']}")
+        print(f"  dashboard Data Lag: {r['lag_samples']} samples (none from the backfill: {r['lag_samples'] == r['added']}), "
+              f"p50 {r['lag_p50_ms']:.2f} ms, max {r['lag_max_s']:.0f} s (the late reading)")
+
+    if args.live_messages > 0:
+        quiet_streamlit()
+        install_fake_firebase()
+        broker = None
+        if args.broker:
+            host, _, port = args.broker.partition(":")
+            broker = (host, int(port or 1883))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            r = run_live_feed(args.live_messages, broker)
+        print(f"Direct MQTT live feed ({args.broker or 'fake client'}, {', '.join(LIVE_ENCODINGS)} in turn, a rerun after each message)")
+        print(f"  smoke tile showed {r['correct']}/{r['valid']} valid readings, kept the previous one for "
+              f"{r['rejected']}/{r['invalid']} malformed payloads, live caption: {r['caption']}")
+        if not args.broker:
+            print(f"  on_message (decode + schema + shared state) p50 {r['handler_p50_us']:.1f} us")
+
+if __name__ == "__main__":
+    main()
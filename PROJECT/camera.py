@@ -0,0 +1,279 @@
+# Process-wide camera capture: each device is opened once and its frames are shared
+#
+# Dashboard sessions and the emergency recorder subscribe to a CameraService and
+# ask for the newest frame since the last frame_id they saw. A published frame is
+# a fresh array that is never written to again, so every subscriber gets the same
+# object without copying. The service also keeps the last few seconds of frames in
+# a preallocated ring so an emergency recording can start before the panic press;
+# the recorder takes that ring over as it is and capture carries on in a new one.
+# The capture resolution is a property of the device, not of a session: it is the
+# largest size any current subscriber asks for, so sessions with different
+# settings do not make the capture loop re-apply a size (and restart the ring)
+# on alternate reruns.
+#
+# Two outputs come from each capture: the full-resolution BGR frame exactly as the
+# device delivers it (evidence: the ring and the emergency recorder, which writes
+# BGR without any conversion) and a preview downscaled to PREVIEW_WIDTH before it
+# is JPEG-encoded, so the preview costs about the same at any capture resolution.
+#
+# The publish rate adapts to the scene: each decoded frame is shrunk to a tiny
+# grayscale thumbnail and compared with the last published one. While something
+# changes (or the PIR sensor reports motion) frames are published at ACTIVE_FPS;
+# a static scene drops to IDLE_FPS and frames in between are grabbed but never
+# decoded, which also thins out the pre-event ring and the recordings.
+
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+CAMERA_FPS = 10  # requested from the device
+CAMERA_WARMUP_FRAMES = 10
+SUBSCRIBER_TIMEOUT = 60  # seconds a session subscription lasts without being renewed
+PRE_EVENT_SECONDS = 5  # footage kept from before a panic press (~140 MB at 720p, ~310 MB at 1080p)
+PRE_EVENT_FPS = 10  # same rate as the emergency recording
+PREVIEW_QUALITY = 85  # JPEG quality of the dashboard preview
+PREVIEW_WIDTH = 680  # pixels; the width the dashboard shows the feed at
+ACTIVE_FPS = 30  # publish rate while the scene changes (capped by the device)
+IDLE_FPS = 1  # publish rate of a static scene
+ACTIVE_HOLD = 3.0  # seconds the full rate is kept after the last change or motion hint
+CHANGE_SIZE = (64, 36)  # thumbnail compared between frames
+CHANGE_PIXEL_DELTA = 12  # gray levels a thumbnail pixel must move by to count as changed (above sensor noise)
+CHANGE_THRESHOLD = 0.005  # share of changed thumbnail pixels (~12 of 2304) that counts as a change
+
+def change_thumbnail(frame):
+    """Tiny grayscale copy of a BGR frame for change detection (~0.5 ms at 720p)"""
+    # Striding first keeps INTER_AREA's averaging (sensor noise cancels out) but over ~16x fewer pixels
+    step = max(1, frame.shape[1] // (CHANGE_SIZE[0] * 4))
+    small = cv2.resize(frame[::step, ::step], CHANGE_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+class FrameRing:
+    """Fixed-capacity ring of equally shaped frames in one preallocated array"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.frames = None  # (capacity, height, width, 3) uint8, allocated on the first push
+        self.times = np.zeros(capacity)
+        self.head = 0  # next slot to write
+        self.count = 0
+
+    def push(self, frame, timestamp):
+        if self.frames is None or self.frames.shape[1:] != frame.shape:
+            # First frame or a resolution change: start over at the new size
+            self.frames = np.empty((self.capacity,) + frame.shape, dtype=np.uint8)
+            self.head = self.count = 0
+        self.frames[self.head] = frame
+        self.times[self.head] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        """(frame, timestamp) oldest first, read straight from the slots: only once nothing pushes to the ring"""
+        start = (self.head - self.count) % self.capacity
+        for i in range(self.count):
+            slot = (start + i) % self.capacity
+            yield self.frames[slot], float(self.times[slot])
+
+    def clear(self):
+        self.head = self.count = 0
+
+class CameraService:
+    """One capture thread per device, running while at least one subscriber is attached"""
+
+    def __init__(self, source, width=1280, height=720, pre_event_seconds=PRE_EVENT_SECONDS, preview_width=PREVIEW_WIDTH):
+        self.source = source
+        self.size = (width, height)  # what the capture loop applies: the largest in self.sizes
+        self.sizes = {}  # subscriber -> (width, height) it asked for
+        self.cond = threading.Condition()
+        self.ring = FrameRing(max(1, int(pre_event_seconds * PRE_EVENT_FPS)))
+        self.ring_time = 0.0
+        self.frame = None
+        self.frame_id = -1  # id of self.frame, increases by one per published frame
+        self.frame_time = None
+        self.subscribers = {}  # subscriber -> last renewal (monotonic), None when pinned
+        self.thread = None
+        self.last_thread = None
+        self.state = 'stopped'  # 'starting', 'online', 'offline' (could not be opened or failed) or 'stopped'
+        self.active_until = 0.0  # monotonic time until which frames are published at ACTIVE_FPS
+        self.change = 0.0  # share of thumbnail pixels that changed in the last decoded frame
+        self.publish_times = deque(maxlen=ACTIVE_FPS * 2)
+        self.preview_width = preview_width
+        self.preview_lock = threading.Lock()
+        self.preview_cache = (-1, None)  # (frame_id, JPEG bytes) of the last encoded preview
+        self.previews_encoded = 0
+
+    def subscribe(self, subscriber, width=None, height=None, pinned=False):
+        """Add or renew a subscriber (sessions renew on every rerun; pinned ones never expire)"""
+        with self.cond:
+            self.subscribers[subscriber] = None if pinned else time.monotonic()
+            # Without a size of its own a subscriber (e.g. the recorder) holds the current one
+            self.sizes[subscriber] = (width, height) if width and height else self.sizes.get(subscriber, self.size)
+            self._resize()
+            if self.thread is None:
+                self.state = 'starting'
+                self.thread = threading.Thread(target=self._capture_loop, args=(self.last_thread,), daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self.cond:
+            self.subscribers.pop(subscriber, None)
+            self.sizes.pop(subscriber, None)
+            self._resize()
+
+    def latest(self, since_id=-1):
+        """(frame_id, full-resolution BGR frame) for the newest frame, or (since_id, None) if nothing newer has arrived"""
+        with self.cond:
+            if self.frame is not None and self.frame_id > since_id:
+                return self.frame_id, self.frame
+            return since_id, None
+
+    def wait(self, since_id, timeout=1.0):
+        """latest(), but blocks up to timeout for a frame newer than since_id"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame_id > since_id or self.thread is None, timeout)
+        return self.latest(since_id)
+
+    def preview(self):
+        """(frame_id, downscaled JPEG bytes) of the newest frame, encoded once per frame_id however many sessions ask"""
+        frame_id, frame = self.latest()
+        if frame is None:
+            return frame_id, None
+        with self.preview_lock:
+            cached_id, jpeg = self.preview_cache
+            if cached_id != frame_id:
+                height, width = frame.shape[:2]
+                if width > self.preview_width:
+                    frame = cv2.resize(frame, (self.preview_width, round(height * self.preview_width / width)),
+                                       interpolation=cv2.INTER_LINEAR)
+                ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_QUALITY])
+                if not ok:
+                    return frame_id, None
+                jpeg = buffer.tobytes()
+                self.preview_cache = (frame_id, jpeg)
+                self.previews_encoded += 1
+            return frame_id, jpeg
+
+    def hint_motion(self, seconds=ACTIVE_HOLD):
+        """Capture at the full rate for the next few seconds (PIR motion, an emergency recording)"""
+        with self.cond:
+            self.active_until = max(self.active_until, time.monotonic() + seconds)
+
+    def stats(self):
+        """Current publish rate, whether the scene counts as active and its last change score"""
+        with self.cond:
+            times = list(self.publish_times)
+            active = time.monotonic() < self.active_until
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        return {'fps': fps, 'active': active, 'change': self.change}
+
+    def take_pre_event(self):
+        """Hand over the ring of the last few seconds (sampled at PRE_EVENT_FPS) and keep filling a new one"""
+        with self.cond:
+            # No copy under the lock: the new ring's array is only reserved here and its pages
+            # are touched frame by frame, so memory grows by one frame per push, not by a ring
+            ring, self.ring = self.ring, FrameRing(self.ring.capacity)
+            return ring
+
+    def _resize(self):
+        """Caller holds the lock"""
+        if self.sizes:
+            self.size = max(self.sizes.values(), key=lambda size: size[0] * size[1])
+
+    def _publish(self, frame):
+        with self.cond:
+            self.frame = frame
+            self.frame_id += 1
+            self.frame_time = time.time()
+            self.publish_times.append(self.frame_time)
+            if self.frame_time - self.ring_time >= 1 / PRE_EVENT_FPS:
+                self.ring.push(frame, self.frame_time)
+                self.ring_time = self.frame_time
+            self.cond.notify_all()
+
+    def _keep_running(self):
+        with self.cond:
+            cutoff = time.monotonic() - SUBSCRIBER_TIMEOUT
+            for subscriber in [s for s, seen in self.subscribers.items() if seen is not None and seen < cutoff]:
+                del self.subscribers[subscriber]
+                self.sizes.pop(subscriber, None)
+            self._resize()
+            if self.subscribers:
+                return True
+            self.last_thread, self.thread = self.thread, None
+            return False
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source, cv2.CAP_DSHOW)
+        time.sleep(0.3)
+        if not cap.isOpened():
+            cap.release()
+            cap = cv2.VideoCapture(self.source)
+            time.sleep(0.3)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+        return cap
+
+    def _capture_loop(self, previous):
+        if previous is not None:
+            previous.join()  # the device must be released before it is opened again
+        cap = None
+        try:
+            cap = self._open()
+            if cap is None:
+                print(f"Camera error: source {self.source} could not be opened")
+                return
+            self.state = 'online'
+            print(f"📷 Camera {self.source} opened")
+            applied = None
+            reference = None  # thumbnail of the last published frame
+            last_publish = 0.0
+            while self._keep_running():
+                if self.size != applied:
+                    applied = self.size
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, applied[0])
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, applied[1])
+                    for _ in range(CAMERA_WARMUP_FRAMES):
+                        cap.read()
+                    reference = None
+                # grab() keeps the device queue current; only frames we publish are decoded
+                if not cap.grab():
+                    time.sleep(0.05)
+                    continue
+                now = time.monotonic()
+                # 0.9: a device running at exactly ACTIVE_FPS jitters around the interval
+                if now - last_publish < 0.9 / (ACTIVE_FPS if now < self.active_until else IDLE_FPS):
+                    continue
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                thumbnail = change_thumbnail(frame)
+                if reference is not None:
+                    self.change = np.count_nonzero(cv2.absdiff(thumbnail, reference) > CHANGE_PIXEL_DELTA) / thumbnail.size
+                if reference is None or self.change >= CHANGE_THRESHOLD:
+                    self.hint_motion()
+                reference = thumbnail
+                last_publish = now
+                self._publish(frame)
+        except Exception as e:
+            print(f"Camera error: {e}")
+        finally:
+            if cap is not None:
+                cap.release()
+            with self.cond:
+                self.state = 'stopped'
+                if self.thread is threading.current_thread():
+                    # Failed to open or crashed: the next subscribe() starts a fresh attempt
+                    self.last_thread, self.thread = self.thread, None
+                    self.state = 'offline'
+                self.frame = None
+                self.ring.clear()
+                self.cond.notify_all()
+            print(f"📷 Camera {self.source} released")
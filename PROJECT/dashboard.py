@@ -1,15 +1,33 @@
 # type: ignore
-import cv2
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 import pandas as pd
+import os
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import numpy as np
-from collections import deque
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 import threading
+import uuid
+import synthetic
+from schema import EPOCH, Reading, ReadingColumns, SchemaError, columns_frame, from_columns
+from payloads import decode_payload
+from hotstore import HotStore, HOTSTORE_DIR
+from camera import CameraService, PREVIEW_WIDTH
+from recorder import EmergencyRecorder, RECORD_SECONDS
+from rollups import ROLLUP_FIELDS, bucket_id, rollup_collection
+from rules import RuleEngine, alert_collection, SMOKE_WARNING, SMOKE_DANGER, AIR_WARNING, AIR_DANGER
+# Optional: direct MQTT live feed for the status tiles (pip install paho-mqtt)
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+# Streamlit re-executes this whole script on every refresh; the performance panel times each run from here
+RERUN_START = time.perf_counter()
 
 # ================= PAGE CONFIG =================
 st.set_page_config(
@@ -24,11 +42,55 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(cred)
 db = firestore.client()
 
+# Delta fetch: backfill once, then only read documents newer than the newest one held
+HISTORY_MAXLEN = 20000  # rows kept in memory per dashboard (~1 day at one reading per 5 s)
+INITIAL_BACKFILL = 500
+DELTA_PAGE_SIZE = 500
+LIVE_TRENDS_ROWS = 200
+
+# Week/Month views read the bridge's hourly/daily rollups (~720 docs per month) instead of raw rows
+ROLLUP_PERIODS = ("Week", "Month")
+ROLLUP_DAYS = 31
+
+# Direct MQTT live feed: live tiles/panic come from the broker, Firestore only serves history
+LIVE_MQTT_PORT = 1883
+LIVE_MAX_AGE = 30  # seconds a live reading overrides Firestore's newest row
+LIVE_REFRESH_SECONDS = 1  # status tiles re-render on their own at this rate while the feed is on
+
+# Sensor alerts come from the bridge's rule engine (stops/<stop_id>/alerts), not from this page
+ALERT_DAYS = 7  # alerts updated within this window are loaded when a stop is opened
+ALERTS_KEPT = 100
+ALERTS_POLL_INTERVAL = 30  # seconds between alert queries when polling instead of listening
+
+# Readings are partitioned per bus stop by the bridge: stops/<stop_id>/sensor_readings
+STOPS_COLLECTION = "stops"
+DEFAULT_STOP_ID = "stop-01"
+# The bridge stamps each reading with Firestore's commit time; new readings are paged on it, not on
+# the reading's own timestamp, because a spool replay commits readings older than ones already read
+COMMIT_FIELD = "committed_at"
+STOP_LIST_TTL = 600  # seconds the stop list is cached for all sessions
+
+# One fetcher per server process and stop; a session counts as a viewer while it keeps rerunning
+SESSION_TIMEOUT = 60
+
+# Performance panel: rolling per-section timings of this session's reruns
+PROFILE_WINDOW = 100
+
+# Demo mode streams synthetic readings (synthetic.py) after backfilling this much history
+DEMO_HISTORY_HOURS = 24
+
+# Local hot store written by the bridge (present when the dashboard runs next to it or a synced copy)
+HOTSTORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), HOTSTORE_DIR)
+
+def stop_readings(db_ref, stop_id):
+    """Collection reference holding one stop's sensor readings"""
+    return db_ref.collection(STOPS_COLLECTION).document(stop_id).collection("sensor_readings")
+
 # ================= SESSION STATE INITIALIZATION =================
 if 'last_fetch_time' not in st.session_state:
     st.session_state.last_fetch_time = None
 if 'cached_data' not in st.session_state:
-    st.session_state.cached_data = []
+    st.session_state.cached_data = {}
 if 'fetch_counter' not in st.session_state:
     st.session_state.fetch_counter = 0
 if 'daily_reads' not in st.session_state:
@@ -37,39 +99,28 @@ if 'last_reset' not in st.session_state:
     st.session_state.last_reset = datetime.now().date()
 if 'motion_log' not in st.session_state:
     st.session_state.motion_log = deque(maxlen=1000)
-if 'camera_cap' not in st.session_state:
-    st.session_state.camera_cap = None
-if 'camera_frame' not in st.session_state:
-    st.session_state.camera_frame = None
-if 'camera_thread_running' not in st.session_state:
-    st.session_state.camera_thread_running = False
-if 'camera_stop_flag' not in st.session_state:
-    st.session_state.camera_stop_flag = threading.Event()
-if 'camera_frame_container' not in st.session_state:
-    st.session_state.camera_frame_container = {'frame': None}
+if 'energy_view' not in st.session_state:
+    st.session_state.energy_view = (0.0, None)  # (built at (monotonic), energy metrics and chart)
+if 'camera_sources' not in st.session_state:
+    st.session_state.camera_sources = []  # sources this session is subscribed to
+if 'camera_states' not in st.session_state:
+    st.session_state.camera_states = {}  # source -> last camera state seen, for online/offline alerts
 # session states for emergency recording
-if 'emergency_recording' not in st.session_state:
-    st.session_state.emergency_recording = False
-if 'emergency_record_start' not in st.session_state:
-    st.session_state.emergency_record_start = None
-if 'emergency_frames' not in st.session_state:
-    st.session_state.emergency_frames = []
-if 'saved_recordings' not in st.session_state:
-    st.session_state.saved_recordings = []
+if 'recordings_seen' not in st.session_state:
+    st.session_state.recordings_seen = {}  # source -> newest recorder sequence number already logged as an alert
 if 'last_panic_state' not in st.session_state:
     st.session_state.last_panic_state = False
 if 'panic_cooldown' not in st.session_state:
     st.session_state.panic_cooldown = None
-# emergency recording thread state
-if 'emergency_recording_thread_running' not in st.session_state:
-    st.session_state.emergency_recording_thread_running = False
-if 'emergency_stop_flag' not in st.session_state:
-    st.session_state.emergency_stop_flag = threading.Event()
 # missing alerts session states
 if 'alerts_log' not in st.session_state:
     st.session_state.alerts_log = deque(maxlen=100)
 if 'last_alert_state' not in st.session_state:
     st.session_state.last_alert_state = {}
+if 'stop_alerts' not in st.session_state:
+    st.session_state.stop_alerts = {}  # alert id -> the bridge's alert document, from the shared fetcher
+if 'alerts_cleared_at' not in st.session_state:
+    st.session_state.alerts_cleared_at = None
 if 'quota_exceeded' not in st.session_state:
     st.session_state.quota_exceeded = False
 if 'quota_exceeded_time' not in st.session_state:
@@ -82,49 +133,42 @@ if 'last_data_update' not in st.session_state:
     st.session_state.last_data_update = datetime.now()
 if 'last_analytics_update' not in st.session_state:
     st.session_state.last_analytics_update = datetime.now()
-if 'component_refresh_log' not in st.session_state:
-    st.session_state.component_refresh_log = {}
-if 'fetch_thread_started' not in st.session_state:
-    st.session_state.fetch_thread_started = False
-
-# ================= SHARED STATE FOR BACKGROUND THREAD =================
-if 'shared_data' not in st.session_state:
-    st.session_state.shared_data = {
-        'cached_data': [],
-        'last_fetch_time': None,
-        'daily_reads': 0,
-        'fetch_counter': 0,
-        'quota_exceeded': False,
-        'quota_exceeded_time': None,
-        'failed_fetch_count': 0,
-        'last_data_update': None,
-        'last_reset': datetime.now().date(),
-    }
-if 'data_lock' not in st.session_state:
-    st.session_state.data_lock = threading.Lock()
+if 'stop_id' not in st.session_state:
+    st.session_state.stop_id = DEFAULT_STOP_ID
+if 'source_mode' not in st.session_state:
+    st.session_state.source_mode = 'listener'
+if 'live_config' not in st.session_state:
+    st.session_state.live_config = None
+if 'session_uid' not in st.session_state:
+    st.session_state.session_uid = uuid.uuid4().hex
+if 'fetcher_key' not in st.session_state:
+    st.session_state.fetcher_key = None
+if 'lag_samples' not in st.session_state:
+    st.session_state.lag_samples = []
+if 'rollups' not in st.session_state:
+    st.session_state.rollups = {'hour': {}, 'day': {}}
+if 'section_times' not in st.session_state:
+    st.session_state.section_times = {}  # section -> seconds of its last PROFILE_WINDOW runs
 
 # ================= COMPONENT REFRESH TIMING CONSTANTS =================
+# Derived frames and charts are recomputed at most this often, and only once new data arrived
 STATUS_INTERVAL = 5
 TRENDS_INTERVAL = 10
 ANALYTICS_INTERVAL = 60
+ANALYTICS_CACHE_SIZE = 128  # cached components across all stops and periods (LRU)
 
 # ================= HELPER FUNCTIONS =================
-def should_update_component(component_name, interval_seconds):
-    """Check if component needs update based on interval"""
-    now = datetime.now()
-    last_update = st.session_state.component_refresh_log.get(component_name, datetime.now() - timedelta(seconds=interval_seconds))
-    elapsed = (now - last_update).total_seconds()
-    if elapsed >= interval_seconds:
-        st.session_state.component_refresh_log[component_name] = now
-        return True
-    return False
+def record_section(name, seconds):
+    st.session_state.section_times.setdefault(name, deque(maxlen=PROFILE_WINDOW)).append(seconds)
 
-def get_time_until_refresh(component_name, interval_seconds):
-    """Get seconds until next component refresh"""
-    now = datetime.now()
-    last_update = st.session_state.component_refresh_log.get(component_name, datetime.now() - timedelta(seconds=interval_seconds))
-    elapsed = (now - last_update).total_seconds()
-    return max(0, interval_seconds - elapsed)
+@contextmanager
+def timed_section(name):
+    """Time a part of the script into this session's rolling per-section samples"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_section(name, time.perf_counter() - start)
 
 def calculate_energy_usage(motion_detected, duration_minutes=1):
     """Calculate energy usage based on motion detection"""
@@ -142,47 +186,29 @@ def filter_data_by_period(df, period):
         df['timestamp'] = pd.to_datetime(df['timestamp'])
     if df['timestamp'].dt.tz is not None:
         df['timestamp'] = df['timestamp'].dt.tz_convert('UTC').dt.tz_localize(None)
-    now = datetime.now()
+    start_time = period_start(period)
+    if start_time is None:
+        return df
+    return df[df['timestamp'] >= start_time]
+
+def period_start(period):
+    """Start of the Day/Week/Month window ending now, in naive UTC like the readings"""
+    now = utc_now()
     if period == "Day":
-        start_time = now - timedelta(days=1)
+        return now - timedelta(days=1)
     elif period == "Week":
-        start_time = now - timedelta(weeks=1)
+        return now - timedelta(weeks=1)
     elif period == "Month":
-        start_time = now - timedelta(days=30)
-    else:
-        return df
-    return df[df['timestamp'] >= start_time]
+        return now - timedelta(days=30)
+    return None
 
-def generate_mock_data(num_records=50):
-    """Generate realistic mock sensor data for demo mode across multiple days"""
-    import random
-    mock_data = []
-    base_time = datetime.now()
-    for i in range(num_records):
-        # Spread data across multiple days (each record ~2-6 hours apart)
-        hours_offset = i * random.randint(2, 6)
-        timestamp = base_time - timedelta(hours=hours_offset)
-        
-        # Simulate day/night cycle for LDR based on hour
-        hour_of_day = timestamp.hour
-        if 6 <= hour_of_day <= 18:  # Daytime
-            ldr_value = random.randint(2000, 4000)
-        else:  # Nighttime
-            ldr_value = random.randint(100, 500)
-        
-        mock_record = {
-            'timestamp': timestamp,
-            'smoke': random.randint(500, 3500),
-            'air': random.randint(800, 3000),
-            'motion_detected': random.random() < 0.3,
-            'rain': random.random() < 0.1,
-            'ldr': ldr_value,
-            'window': "CLOSED" if random.random() < 0.8 else "OPEN",
-            'emergency': "false",
-            'panic': "false",
-        }
-        mock_data.append(mock_record)
-    return mock_data
+def load_history(hot_store, stop_id, period):
+    """Readings for the selected period from the local hot store (no Firestore reads)"""
+    try:
+        return hot_store.query_frame(stop_id, period_start(period), utc_now() + timedelta(seconds=1))
+    except Exception as e:
+        print(f"Hot store error: {e}")
+        return pd.DataFrame()
 
 def log_alert(event_type, trigger_source, details=""):
     """Log sensor and system alerts with deduplication"""
@@ -191,7 +217,7 @@ def log_alert(event_type, trigger_source, details=""):
     if alert_key not in st.session_state.last_alert_state or \
        st.session_state.last_alert_state[alert_key] != current_state:
         alert = {
-            'timestamp': datetime.now(),
+            'timestamp': utc_now(),  # sorted in with the bridge's alerts
             'event_type': event_type,
             'trigger_source': trigger_source,
             'details': details
@@ -202,7 +228,7 @@ def log_alert(event_type, trigger_source, details=""):
 def get_alert_icon(event_type):
     """Return appropriate icon for alert type"""
     icons = {
-        'smoking': '🚬', 'fire_risk': '🔥', 'panic': '🚨',
+        'smoking': '🚬', 'fire_risk': '🔥', 'panic': '🚨', 'bad_air': '🌫️', 'rain': '🌧️',
         'emergency': '🆘', 'panic_button': '🔴',
         'camera_offline': '📷❌', 'camera_online': '📷✅',
         'recording_started': '⏺️', 'recording_saved': '💾'
@@ -210,130 +236,36 @@ def get_alert_icon(event_type):
     return icons.get(event_type, '📍')
 
 # ================= EMERGENCY RECORDING FUNCTIONS =================
-def emergency_recording_thread(frame_container, frames_list, stop_flag, duration=30):
-    """Background thread for continuous emergency recording"""
-    start_time = time.time()
-    frame_count = 0
-    print(f"🔴 Emergency recording thread started - Recording for {duration} seconds")
-    
-    while not stop_flag.is_set() and (time.time() - start_time) < duration:
-        current_frame = frame_container.get('frame')
-        if current_frame is not None:
-            frames_list.append(current_frame.copy())
-            frame_count += 1
-        time.sleep(0.1)  # Capture ~10 frames per second
-    
-    elapsed = time.time() - start_time
-    print(f"⏹️ Emergency recording thread ended - Captured {frame_count} frames in {elapsed:.1f}s")
-
 def start_emergency_recording():
-    """Start recording frames for emergency"""
-    if not st.session_state.emergency_recording:
-        st.session_state.emergency_recording = True
-        st.session_state.emergency_record_start = datetime.now()
-        st.session_state.emergency_frames = []
-        st.session_state.emergency_stop_flag.clear()
-        
-        log_alert('recording_started', 'Emergency Camera', 'Auto-recording started due to panic button (30 seconds)')
-        print("🔴 Emergency recording started")
-        
-        # Start background recording thread if camera is available
-        if st.session_state.camera_frame_container.get('frame') is not None:
-            st.session_state.emergency_recording_thread_running = True
-            record_thread = threading.Thread(
-                target=emergency_recording_thread,
-                args=(
-                    st.session_state.camera_frame_container,
-                    st.session_state.emergency_frames,
-                    st.session_state.emergency_stop_flag,
-                    30  # 30 seconds recording duration
-                ),
-                daemon=True
-            )
-            record_thread.start()
-            
-            # Start a timer thread to stop recording after 30 seconds
-            def stop_after_duration():
-                time.sleep(30)
-                if st.session_state.emergency_recording:
-                    stop_emergency_recording()
-            
-            timer_thread = threading.Thread(target=stop_after_duration, daemon=True)
-            timer_thread.start()
-
-def stop_emergency_recording():
-    """Stop recording and save video"""
-    if st.session_state.emergency_recording:
-        st.session_state.emergency_recording = False
-        st.session_state.emergency_recording_thread_running = False
-        st.session_state.emergency_stop_flag.set()
-        
-        # Wait a moment for thread to finish
-        time.sleep(0.2)
-        
-        frames = st.session_state.emergency_frames.copy()
-        st.session_state.emergency_frames = []
-        
-        if len(frames) > 0:
-            save_emergency_video(frames)
-        else:
-            print("⚠️ No frames captured for emergency recording")
-            log_alert('recording_error', 'Emergency Camera', 'No frames captured - ensure camera is enabled')
-        
-        print(f"⏹️ Emergency recording stopped - {len(frames)} frames captured")
+    """Start every live camera's shared recorder at once (no-ops while a recording is running)"""
+    for source, camera in cameras.items():
+        if camera.latest()[1] is None:
+            continue  # a dead camera must not hold up the others
+        pre_seconds = recorders[source].start(RECORD_SECONDS)
+        if pre_seconds is not None:
+            log_alert('recording_started', f'Emergency Camera {source}',
+                      f'Auto-recording started due to panic button ({RECORD_SECONDS} seconds, plus {pre_seconds:.0f}s before the alarm)')
 
-def save_emergency_video(frames):
-    """Save recorded frames as video file"""
-    import os
-    
-    # Create recordings directory
-    recordings_dir = os.path.join(os.path.dirname(__file__), "emergency_recordings")
-    os.makedirs(recordings_dir, exist_ok=True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"emergency_{timestamp}.avi"
-    filepath = os.path.join(recordings_dir, filename)
-    
-    try:
-        if len(frames) > 0:
-            height, width = frames[0].shape[:2]
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            out = cv2.VideoWriter(filepath, fourcc, 10.0, (width, height))
-            
-            for frame in frames:
-                # Convert RGB back to BGR for saving
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                out.write(frame_bgr)
-            
-            out.release()
-            
-            recording_info = {
-                'filename': filename,
-                'filepath': filepath,
-                'timestamp': datetime.now(),
-                'duration': len(frames) / 10,  # Approximate duration in seconds
-                'frame_count': len(frames),
-                'type': 'PANIC_EMERGENCY'
-            }
-            st.session_state.saved_recordings.insert(0, recording_info)
-            # Keep only last 20 recordings in memory
-            st.session_state.saved_recordings = st.session_state.saved_recordings[:20]
-            
-            log_alert('recording_saved', 'Emergency Camera', f'Recording saved: {filename}')
-            print(f"💾 Emergency video saved: {filepath}")
-    except Exception as e:
-        print(f"Error saving video: {e}")
-        log_alert('recording_error', 'Emergency Camera', f'Failed to save: {str(e)}')
+def sync_recording_alerts():
+    """Log the recordings the shared recorders finished, and camera state changes, since this session last looked"""
+    for source, recorder in recorders.items():
+        for recording in recorder.finished_since(st.session_state.recordings_seen.get(source, 0)):
+            if recording['error'] is None:
+                log_alert('recording_saved', f'Emergency Camera {source}', f"Recording saved: {recording['filename']}")
+            else:
+                log_alert('recording_error', f'Emergency Camera {source}', recording['error'])
+            st.session_state.recordings_seen[source] = recording['seq']
+    for source, camera in cameras.items():
+        state = camera.state
+        if state != st.session_state.camera_states.get(source) and state in ('online', 'offline'):
+            log_alert(f'camera_{state}', f'Camera {source}', f'Camera {source} is {state}')
+        st.session_state.camera_states[source] = state
 
 def check_and_handle_panic(latest_data):
     """Check for panic state and trigger appropriate actions"""
     
-    panic_value = latest_data.get('panic', False)
-    emergency_value = latest_data.get('emergency', False)
-    
-    # Handle string "true" or boolean True
-    is_panic = (panic_value == True or panic_value == "true" or 
-                emergency_value == True or emergency_value == "true")
+    # Readings are normalized by the schema: panic is a real bool whatever the firmware sent
+    is_panic = bool(latest_data.get('panic', False))
     
     # Check cooldown (prevent repeated triggers within 60 seconds)
     cooldown_active = False
@@ -343,12 +275,9 @@ def check_and_handle_panic(latest_data):
     
     # Detect new panic event (transition from False to True)
     if is_panic and not st.session_state.last_panic_state and not cooldown_active:
-        # Log the panic alert
-        log_alert('panic_button', 'PANIC BUTTON', '🚨 EMERGENCY! Panic button activated!')
-        log_alert('emergency', 'Security System', 'Emergency mode activated - Window closed, alarm triggered')
-        
-        # Start emergency recording if camera is available
-        if st.session_state.camera_frame_container.get('frame') is not None:
+        # The alert itself is logged by the bridge's rule engine; this session only starts the cameras
+        # Start emergency recording on every available camera
+        if camera_available():
             start_emergency_recording()
         
         st.session_state.panic_cooldown = datetime.now()
@@ -359,35 +288,23 @@ def check_and_handle_panic(latest_data):
     
     return is_panic
 
-def capture_emergency_frame():
-    """Capture current frame for emergency recording (fallback if thread not running)"""
-    if st.session_state.emergency_recording and not st.session_state.emergency_recording_thread_running:
-        # Fallback: capture frame during page refresh if thread isn't running
-        current_frame = st.session_state.camera_frame_container.get('frame')
-        if current_frame is not None:
-            st.session_state.emergency_frames.append(current_frame.copy())
-    
-    # Check if 30 seconds have passed and stop recording
-    if st.session_state.emergency_recording and st.session_state.emergency_record_start:
-        elapsed = (datetime.now() - st.session_state.emergency_record_start).total_seconds()
-        if elapsed >= 30:
-            stop_emergency_recording()
-
 def display_emergency_recordings():
     """Display saved emergency recordings"""
     st.subheader("📹 Emergency Recordings")
     
-    if st.session_state.emergency_recording:
-        elapsed = 0
-        if st.session_state.emergency_record_start:
-            elapsed = (datetime.now() - st.session_state.emergency_record_start).total_seconds()
-        remaining = max(0, 30 - elapsed)
-        st.error(f"⏺️ **RECORDING IN PROGRESS** - {remaining:.0f}s remaining")
-        st.progress(min(elapsed / 30, 1.0))
-        st.caption(f"📊 Frames captured: {len(st.session_state.emergency_frames)}")
+    for source, recorder in recorders.items():
+        current = recorder.status()
+        if current is not None:
+            elapsed = (datetime.now() - current['started']).total_seconds()
+            remaining = max(0, current['duration_limit'] - elapsed)
+            st.error(f"⏺️ **RECORDING IN PROGRESS** (camera {source}) - {remaining:.0f}s remaining")
+            st.progress(min(elapsed / current['duration_limit'], 1.0))
+            st.caption(f"📊 Frames captured: {current['frame_count']} ({current['pre_event_frames']} from before the alarm)")
     
-    if len(st.session_state.saved_recordings) > 0:
-        for idx, recording in enumerate(st.session_state.saved_recordings[:5]):
+    saved_recordings = sorted((recording for recorder in recorders.values() for recording in recorder.history()
+                               if recording['error'] is None), key=lambda recording: recording['timestamp'], reverse=True)
+    if len(saved_recordings) > 0:
+        for idx, recording in enumerate(saved_recordings[:5]):
             col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
                 st.write(f"📁 **{recording['filename']}**")
@@ -404,6 +321,32 @@ def display_emergency_recordings():
     else:
         st.info("No emergency recordings yet")
 
+def naive_utc(timestamp):
+    """Firestore returns aware UTC timestamps; naive ones (demo readings, utc_now()) are UTC already"""
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def stop_alert_entries(stop_alerts, cleared_at=None):
+    """The bridge's alert documents as alerts-log entries, skipping those last updated before cleared_at"""
+    entries = []
+    for alert in stop_alerts.values():
+        updated = naive_utc(alert.get('updated'))
+        if cleared_at is not None and updated is not None and updated < cleared_at:
+            continue
+        if alert.get('active'):
+            state = "ACTIVE"
+        else:
+            ended = naive_utc(alert.get('ended'))
+            state = f"cleared {ended.strftime('%H:%M:%S')}" if ended is not None else "cleared"
+        entries.append({
+            'timestamp': naive_utc(alert.get('started')) or updated,
+            'event_type': alert.get('rule', 'alert'),
+            'trigger_source': f"Sensors ({alert.get('severity', 'info')})",
+            'details': f"{alert.get('message', '')} ({state}, peak {alert.get('peak', 0):.0f})",
+        })
+    return entries
+
 def display_alerts_log():
     """Display scrollable alerts log with panic button alerts"""
     st.subheader("🚨 Alerts Log")
@@ -412,8 +355,11 @@ def display_alerts_log():
     if st.session_state.last_panic_state:
         st.error("🆘 **ACTIVE EMERGENCY** - Panic button has been activated!")
     
-    if len(st.session_state.alerts_log) > 0:
-        alerts_df = pd.DataFrame(list(st.session_state.alerts_log))
+    # This session's camera/recording events plus the stop's alerts from the bridge's rule engine
+    alerts = list(st.session_state.alerts_log) + stop_alert_entries(st.session_state.stop_alerts,
+                                                                    st.session_state.alerts_cleared_at)
+    if len(alerts) > 0:
+        alerts_df = pd.DataFrame(alerts)
         alerts_df['timestamp'] = pd.to_datetime(alerts_df['timestamp'])
         alerts_df = alerts_df.sort_values('timestamp', ascending=False)
         
@@ -443,110 +389,224 @@ def display_alerts_log():
                 col2.write(f"**{alert['trigger_source']}**")
                 col3.write(f"`{alert['event_type']}`")
         
-        st.caption(f"Total Alerts: {len(st.session_state.alerts_log)}")
+        st.caption(f"Total Alerts: {len(alerts)}")
         
-        # Clear alerts button
+        # Clear alerts button (the bridge keeps its alerts: they are only hidden from this session)
         if st.button("🗑️ Clear Alerts", key="clear_alerts"):
             st.session_state.alerts_log.clear()
             st.session_state.last_alert_state.clear()
+            st.session_state.alerts_cleared_at = utc_now()
             st.rerun()
     else:
         st.info("No alerts logged yet. All systems normal.")
 
-def generate_historical_charts(df):
+def readings_frame(columns):
+    """Fetched readings ({column: array}, oldest first) -> typed DataFrame, newest first"""
+    if not columns or not len(columns['timestamp']):
+        return pd.DataFrame()
+    return columns_frame({name: values[::-1] for name, values in columns.items()})
+
+def rollup_frames(rollups, period):
+    """(hourly, daily) rollup frames for the Week/Month window"""
+    start = period_start(period)
+    return rollup_frame(rollups['hour'], start), rollup_frame(rollups['day'], start.replace(hour=0))
+
+def history_frame(df, hot_store, stop_id, period):
+    """Raw rows for the period from the local hot store, or the fetched rows when it has none"""
+    hot_df = load_history(hot_store, stop_id, period)
+    if hot_df.empty:
+        return df
+    return hot_df.sort_values('timestamp', ascending=False)
+
+def air_quality_summary(hourly_df, history_df, period):
+    """(avg, max, min, chart_spec()) of air quality over the period, or None"""
+    if not hourly_df.empty and 'air_sum' in hourly_df.columns:
+        return (hourly_df['air_sum'].sum() / hourly_df['count'].sum(), hourly_df['air_max'].max(),
+                hourly_df['air_min'].min(), chart_spec(hourly_df[['bucket_start', 'air']].set_index('bucket_start'), 'area', 250))
+    if not history_df.empty and 'air' in history_df.columns:
+        filtered_df = filter_data_by_period(history_df.copy(), period)
+        if not filtered_df.empty:
+            return (filtered_df['air'].mean(), filtered_df['air'].max(), filtered_df['air'].min(),
+                    chart_spec(filtered_df[['timestamp', 'air']].set_index('timestamp'), 'area', 250))
+    return None
+
+def historical_chart_data(df):
+    """The series behind the historical charts, from raw readings"""
+    charts = {'records': len(df)}
+    if len(df) < 3:
+        return charts
+    if 'timestamp' in df.columns and 'air' in df.columns:
+        air_hist = df[['timestamp', 'air']].dropna().set_index('timestamp').sort_index()
+        if not air_hist.empty:
+            charts['air'] = (air_hist, df['air'].mean(), df['air'].max(), df['air'].min())
+    if 'timestamp' in df.columns and 'motion_detected' in df.columns:
+        motion_hist = df[['timestamp', 'motion_detected']].copy()
+        motion_hist['occupancy'] = motion_hist['motion_detected'].astype(int)
+        motion_hist = motion_hist.set_index('timestamp').sort_index()
+        if not motion_hist.empty:
+            charts['occupancy'] = motion_hist[['occupancy']]
+    if 'timestamp' in df.columns and 'ldr' in df.columns:
+        light_df = df[['timestamp', 'ldr']].copy()
+        light_df['hour'] = pd.to_datetime(light_df['timestamp']).dt.hour
+        hourly_light = light_df.groupby('hour')['ldr'].mean()
+        if not hourly_light.empty:
+            charts['light'] = hourly_light
+    if 'timestamp' in df.columns and 'motion_detected' in df.columns:
+        fan_df = df[['timestamp', 'motion_detected']].copy()
+        fan_df['date'] = pd.to_datetime(fan_df['timestamp']).dt.date
+        # Estimate fan duration: each motion detection = ~5 minutes of fan running
+        fan_df['fan_minutes'] = fan_df['motion_detected'].astype(int) * 5
+        daily_fan = fan_df.groupby('date')['fan_minutes'].sum()
+        if not daily_fan.empty:
+            charts['fan'] = daily_fan
+    return charts
+
+def rollup_chart_data(hourly, daily):
+    """The series behind the historical charts, from the bridge's hourly/daily rollups (Week/Month)"""
+    charts = {'records': int(hourly['count'].sum()) if 'count' in hourly.columns else 0}
+    if 'air' in hourly.columns:
+        charts['air'] = (hourly[['bucket_start', 'air']].set_index('bucket_start'),
+                         hourly['air_sum'].sum() / hourly['count'].sum(), hourly['air_max'].max(), hourly['air_min'].min())
+    if 'motion_detected' in hourly.columns:
+        occupancy = hourly[['bucket_start', 'motion_detected']].rename(columns={'motion_detected': 'occupancy'})
+        charts['occupancy'] = occupancy.set_index('bucket_start')
+    if 'ldr_sum' in hourly.columns:
+        by_hour = hourly.groupby(hourly['bucket_start'].dt.hour)[['ldr_sum', 'count']].sum()
+        charts['light'] = (by_hour['ldr_sum'] / by_hour['count']).rename('ldr').rename_axis('hour')
+    if not daily.empty and 'motion_detected' in daily.columns:
+        # Share of readings with motion x minutes in the day
+        daily_fan = (daily['motion_detected'] * 24 * 60).rename('fan_minutes')
+        daily_fan.index = daily['bucket_start'].dt.date
+        charts['fan'] = daily_fan
+    return charts
+
+CHART_MAX_POINTS = 2000  # rows per chart series; longer series are thinned evenly
+# Mark of each historical chart
+HISTORY_CHART_MARKS = {'air': 'line', 'occupancy': 'area', 'light': 'bar', 'fan': 'bar'}
+
+def chart_spec(data, mark, height):
+    """Wide frame or series (x = its index) -> (long frame, Vega-Lite spec) for show_chart(), built with the cached data"""
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    if len(frame) > CHART_MAX_POINTS:
+        # A chart is a few hundred pixels wide: a million raw rows would be serialized on every rerun
+        frame = frame.iloc[::-(-len(frame) // CHART_MAX_POINTS)]
+    x = frame.index.name or 'index'
+    long_df = frame.reset_index().melt(x, var_name='series', value_name='value')
+    x_type = 'temporal' if pd.api.types.is_datetime64_any_dtype(long_df[x]) else 'ordinal'
+    spec = {
+        'mark': {'type': mark, 'tooltip': True}, 'height': height,
+        'encoding': {
+            'x': {'field': x, 'type': x_type},
+            'y': {'field': 'value', 'type': 'quantitative', 'title': None},
+            'color': {'field': 'series', 'type': 'nominal', 'title': None},
+        },
+    }
+    return long_df, spec
+
+def with_chart_specs(charts, height=300):
+    """Chart data plus a chart_spec() per series, so a rerun only hands them to Streamlit"""
+    charts['specs'] = {key: chart_spec(charts[key][0] if key == 'air' else charts[key], mark, height)
+                       for key, mark in HISTORY_CHART_MARKS.items() if key in charts}
+    return charts
+
+def show_chart(chart):
+    """Render a chart_spec(): st.line_chart() and friends build and validate an Altair chart on every rerun (~100 ms)"""
+    long_df, spec = chart
+    st.vega_lite_chart(long_df, spec, width='stretch')
+
+def raw_table(df):
+    """The newest 20 readings with printable timestamps"""
+    display_df = df.head(20).copy()
+    if 'timestamp' in display_df.columns:
+        display_df['timestamp'] = display_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return display_df
+
+def generate_historical_charts(charts):
     """Generate historical analysis charts"""
     st.subheader("📊 Historical Charts")
-    if len(df) < 3:
-        st.info(f"⏳ Collecting historical data... ({len(df)} records)")
+    if charts['records'] < 3:
+        st.info(f"⏳ Collecting historical data... ({charts['records']} records)")
         return
     hist_tabs = st.tabs(["Air Quality", "Occupancy", "Lighting Usage", "Fan Duration"])
     with hist_tabs[0]:
-        if 'timestamp' in df.columns and 'air' in df.columns:
-            air_hist = df[['timestamp', 'air']].dropna().set_index('timestamp').sort_index()
-            if not air_hist.empty:
-                st.line_chart(air_hist, height=300)
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Avg Air Quality", f"{df['air'].mean():.1f}")
-                col2.metric("Max Reading", f"{df['air'].max():.1f}")
-                col3.metric("Min Reading", f"{df['air'].min():.1f}")
-                st.caption("📊 Lower values = Better air quality | Threshold: Good < 2000, Moderate < 3000, Poor ≥ 3000")
+        if 'air' in charts:
+            _, avg_air, max_air, min_air = charts['air']
+            show_chart(charts['specs']['air'])
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Avg Air Quality", f"{avg_air:.1f}")
+            col2.metric("Max Reading", f"{max_air:.1f}")
+            col3.metric("Min Reading", f"{min_air:.1f}")
+            st.caption("📊 Lower values = Better air quality | Threshold: Good < 2000, Moderate < 3000, Poor ≥ 3000")
+    with hist_tabs[1]:
+        if 'occupancy' in charts:
+            show_chart(charts['specs']['occupancy'])
+    with hist_tabs[2]:
+        if 'light' in charts:
+            show_chart(charts['specs']['light'])
+            st.caption("📊 Average light level (LDR) by hour of day - Higher = Brighter")
+    with hist_tabs[3]:
+        if 'fan' in charts:
+            daily_fan = charts['fan']
+            show_chart(charts['specs']['fan'])
+            col1, col2 = st.columns(2)
+            col1.metric("Total Fan Time", f"{daily_fan.sum():.0f} min")
+            col2.metric("Daily Average", f"{daily_fan.mean():.1f} min")
+            st.caption("📊 Estimated fan running time per day (based on motion detections)")
+
+def generate_rollup_charts(charts):
+    """Historical charts from the bridge's hourly/daily rollups (Week/Month)"""
+    st.subheader("📊 Historical Charts")
+    hist_tabs = st.tabs(["Air Quality", "Occupancy", "Lighting Usage", "Fan Duration"])
+    with hist_tabs[0]:
+        if 'air' in charts:
+            _, avg_air, max_air, min_air = charts['air']
+            show_chart(charts['specs']['air'])
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Avg Air Quality", f"{avg_air:.1f}")
+            col2.metric("Max Reading", f"{max_air:.1f}")
+            col3.metric("Min Reading", f"{min_air:.1f}")
+            st.caption("📊 Hourly averages | Lower values = Better air quality | Threshold: Good < 2000, Moderate < 3000, Poor ≥ 3000")
     with hist_tabs[1]:
-        if 'timestamp' in df.columns and 'motion_detected' in df.columns:
-            motion_hist = df[['timestamp', 'motion_detected']].copy()
-            motion_hist['occupancy'] = motion_hist['motion_detected'].astype(int)
-            motion_hist = motion_hist.set_index('timestamp').sort_index()
-            if not motion_hist.empty:
-                st.area_chart(motion_hist[['occupancy']], height=300)
+        if 'occupancy' in charts:
+            show_chart(charts['specs']['occupancy'])
+            st.caption("📊 Share of readings with motion, per hour")
     with hist_tabs[2]:
-        if 'timestamp' in df.columns and 'ldr' in df.columns:
-            light_df = df[['timestamp', 'ldr']].copy()
-            light_df['hour'] = pd.to_datetime(light_df['timestamp']).dt.hour
-            hourly_light = light_df.groupby('hour')['ldr'].mean()
-            if not hourly_light.empty:
-                st.bar_chart(hourly_light, height=300)
-                st.caption("📊 Average light level (LDR) by hour of day - Higher = Brighter")
+        if 'light' in charts:
+            show_chart(charts['specs']['light'])
+            st.caption("📊 Average light level (LDR) by hour of day - Higher = Brighter")
     with hist_tabs[3]:
-        if 'timestamp' in df.columns and 'motion_detected' in df.columns:
-            fan_df = df[['timestamp', 'motion_detected']].copy()
-            fan_df['date'] = pd.to_datetime(fan_df['timestamp']).dt.date
-            # Estimate fan duration: each motion detection = ~5 minutes of fan running
-            fan_df['fan_minutes'] = fan_df['motion_detected'].astype(int) * 5
-            daily_fan = fan_df.groupby('date')['fan_minutes'].sum()
-            if not daily_fan.empty:
-                st.bar_chart(daily_fan, height=300)
-                col1, col2 = st.columns(2)
-                col1.metric("Total Fan Time", f"{daily_fan.sum():.0f} min")
-                col2.metric("Daily Average", f"{daily_fan.mean():.1f} min")
-                st.caption("📊 Estimated fan running time per day (based on motion detections)")
+        if 'fan' in charts:
+            daily_fan = charts['fan']
+            show_chart(charts['specs']['fan'])
+            col1, col2 = st.columns(2)
+            col1.metric("Total Fan Time", f"{daily_fan.sum():.0f} min")
+            col2.metric("Daily Average", f"{daily_fan.mean():.1f} min")
+            st.caption("📊 Estimated fan running time per day (share of readings with motion × 24 h)")
 
 # ================= CAMERA FUNCTIONS =================
-def camera_capture_thread(camera_source, width, height, stop_flag, frame_container):
-    """Background thread for continuous camera capture"""
-    try:
-        cap = cv2.VideoCapture(camera_source, cv2.CAP_DSHOW)
-        time.sleep(0.3)
-        if not cap.isOpened():
-            cap.release()
-            cap = cv2.VideoCapture(camera_source)
-            time.sleep(0.3)
-        if cap.isOpened():
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-            cap.set(cv2.CAP_PROP_FPS, 10)
-            for _ in range(10):
-                cap.read()
-            frame_count = 0
-            while not stop_flag.is_set():
-                ret, frame = cap.read()
-                if ret:
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    frame_container['frame'] = frame_rgb
-                    frame_container['frame_id'] = frame_count
-                    frame_count += 1
-                    time.sleep(0.033)
-                else:
-                    time.sleep(0.05)
-            cap.release()
-    except Exception as e:
-        print(f"Camera error: {e}")
-
-def start_camera_thread(camera_source, width, height):
-    """Start the camera capture thread"""
-    if not st.session_state.camera_thread_running:
-        st.session_state.camera_thread_running = True
-        st.session_state.camera_stop_flag.clear()
-        thread = threading.Thread(
-            target=camera_capture_thread,
-            args=(camera_source, width, height, st.session_state.camera_stop_flag, st.session_state.camera_frame_container),
-            daemon=True
-        )
-        thread.start()
-
-def stop_camera_thread():
-    """Stop the camera capture thread"""
-    st.session_state.camera_thread_running = False
-    st.session_state.camera_stop_flag.set()
-    st.session_state.camera_frame_container['frame'] = None
+@st.cache_resource(show_spinner=False)
+def get_camera_service(camera_source):
+    """The process-wide capture service for a device: opened once however many sessions watch it"""
+    return CameraService(camera_source)
+
+def parse_camera_sources(text):
+    """"0, 1, rtsp://..." -> [0, 1, "rtsp://..."]: device indexes as ints, anything else as a URL/path"""
+    sources = []
+    for part in text.split(","):
+        part = part.strip()
+        if part:
+            source = int(part) if part.isdigit() else part
+            if source not in sources:
+                sources.append(source)
+    return sources
+
+@st.cache_resource(show_spinner=False)
+def get_recorder(camera_source):
+    """The process-wide emergency recorder for a device, shared like its capture service"""
+    return EmergencyRecorder(get_camera_service(camera_source))
+
+def camera_available():
+    return any(camera.latest()[1] is not None for camera in cameras.values())
 
 # ================= THREAD-SAFE FETCH FUNCTIONS =================
 def should_fetch_data_thread(shared, interval_seconds=5):
@@ -561,111 +621,553 @@ def should_fetch_data_thread(shared, interval_seconds=5):
         return True
     return (datetime.now() - last_fetch).total_seconds() >= interval_seconds
 
-def fetch_firestore_data_thread(shared, db_ref, limit=50):
-    """Thread-safe: Fetch data from Firestore"""
-    today = datetime.now().date()
-    if shared.get('last_reset') != today:
-        shared['daily_reads'] = 0
-        shared['last_reset'] = today
-    try:
+def utc_now():
+    """Naive UTC wall clock: reading timestamps are kept that way (schema.to_epoch, naive_utc)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def reading_lag(timestamp):
+    """Seconds from a reading's timestamp to now, both in UTC (the bridge stamps readings in UTC)"""
+    return (utc_now() - naive_utc(timestamp)).total_seconds()
+
+def take_new_rows(shared, docs):
+    """Caller holds the lock: rows of docs not yet in the history; moves the commit cursor past them"""
+    seen = shared['seen_ids']
+    rows = []
+    newest = None
+    for doc in docs:
+        row = doc.to_dict()
+        committed = row.pop(COMMIT_FIELD, None)
+        if committed is not None and (newest is None or committed >= newest[0]):
+            newest = (committed, doc)
+        if doc.id in seen:
+            continue  # a replay rewrote a reading the history already has
+        seen[doc.id] = True
+        rows.append(row)
+    while len(seen) > HISTORY_MAXLEN:
+        seen.popitem(last=False)
+    if newest is not None:
+        # The snapshot itself: readings of one batch share a commit time, and the cursor breaks ties by id
+        shared['commit_cursor'] = newest[1]
+    elif shared['commit_cursor'] is None:
+        # Only readings from before the bridge stamped commit times: start at the newest of them
+        shared['commit_cursor'] = {COMMIT_FIELD: max((row['timestamp'] for row in rows), default=EPOCH)}
+    return rows
+
+def append_readings(shared, history, rows, live=True):
+    """Caller holds the lock: push new readings (oldest first) into the history ring buffer"""
+    # Firestore bills every returned document, and one read for an empty query result
+    shared['daily_reads'] = shared.get('daily_reads', 0) + max(1, len(rows))
+    shared['fetch_counter'] = shared.get('fetch_counter', 0) + 1
+    if shared['daily_reads'] >= 49000:
+        shared['quota_exceeded'] = True
+        shared['quota_exceeded_time'] = datetime.now()
+    if not rows:
+        return
+    readings = []
+    for row in rows:
+        try:
+            readings.append(Reading.from_document(row))
+        except SchemaError as e:
+            print(f"Skipped malformed reading: {e}")
+    history.append(readings)
+    shared['data_version'] += 1
+    if history.newest() is not None:
+        # Late rows are merged in by timestamp, so the newest reading is never one of them
+        shared['high_water_mark'] = EPOCH + timedelta(seconds=history.newest())
+    shared['cached_data'] = history.columns()
+    shared['last_data_update'] = datetime.now()
+    if live:
+        # Not the first backfill: its rows can be hours old, which says nothing about the feed's lag
+        shared['lag_samples'].extend(reading_lag(row['timestamp']) for row in rows)
+
+def fetch_firestore_data_thread(shared, db_ref, limit=DELTA_PAGE_SIZE, lock=None):
+    """Thread-safe: Fetch only readings committed after the commit cursor into the history ring buffer"""
+    lock = lock or threading.Lock()
+    with lock:
+        today = datetime.now().date()
+        if shared.get('last_reset') != today:
+            shared['daily_reads'] = 0
+            shared['last_reset'] = today
         if shared.get('daily_reads', 0) >= 49000:
             shared['quota_exceeded'] = True
             shared['quota_exceeded_time'] = datetime.now()
             return shared.get('cached_data', [])
-        print(f"📡 Fetching from Firestore (quota: {shared.get('daily_reads', 0)}/50000)...")
-        docs = db_ref.collection("sensor_readings").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(limit).stream()
-        data_list = [doc.to_dict() for doc in docs]
-        if data_list:
-            shared['cached_data'] = data_list
+        stop_id = shared.get('stop_id', DEFAULT_STOP_ID)
+        cursor = shared.get('commit_cursor')
+        history = shared['history']
+    try:
+        print(f"📡 Fetching {stop_id} from Firestore (quota: {shared.get('daily_reads', 0)}/50000)...")
+        readings = stop_readings(db_ref, stop_id)
+        if cursor is None:
+            # First fetch: backfill the newest readings
+            docs = list(readings.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(INITIAL_BACKFILL).stream())[::-1]
+        else:
+            docs = list(readings.order_by(COMMIT_FIELD).start_after(cursor).limit(limit).stream())
+        with lock:
             shared['last_fetch_time'] = datetime.now()
-            shared['daily_reads'] = shared.get('daily_reads', 0) + limit
-            shared['fetch_counter'] = shared.get('fetch_counter', 0) + 1
-            print(f"✓ Fetched {len(data_list)} records")
-            return data_list
-        return shared.get('cached_data', [])
+            new_rows = take_new_rows(shared, docs)
+            append_readings(shared, history, new_rows, live=cursor is not None)
+            if new_rows:
+                print(f"✓ Fetched {len(new_rows)} new records ({len(history)} in history)")
+            return shared['cached_data']
     except Exception as e:
         print(f"Fetch error: {e}")
-        if "quota" in str(e).lower():
-            shared['quota_exceeded'] = True
-            shared['quota_exceeded_time'] = datetime.now()
-        return shared.get('cached_data', [])
+        with lock:
+            if "quota" in str(e).lower():
+                shared['quota_exceeded'] = True
+                shared['quota_exceeded_time'] = datetime.now()
+            return shared.get('cached_data', [])
+
+def start_snapshot_listener(shared, lock, db_ref):
+    """Subscribe once to readings committed after the commit cursor; Firestore pushes each new one"""
+    with lock:
+        stop_id = shared.get('stop_id', DEFAULT_STOP_ID)
+        cursor = shared['commit_cursor']
+        history = shared['history']
+
+    def on_snapshot(docs, changes, read_time):
+        # Runs on the Firestore watch thread. Replays of an existing reading arrive as MODIFIED: skip them.
+        added = [change.document for change in changes if change.type.name == 'ADDED']
+        with lock:
+            append_readings(shared, history, take_new_rows(shared, added))
+
+    query = stop_readings(db_ref, stop_id).order_by(COMMIT_FIELD).start_after(cursor)
+    watch = query.on_snapshot(on_snapshot)
+    with lock:
+        shared['watch'] = watch
+    print(f"✓ Snapshot listener started for {stop_id}")
+
+def stop_snapshot_listener(shared, lock, key='watch'):
+    with lock:
+        watch = shared.get(key)
+        shared[key] = None
+    if watch is not None:
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            print(f"Listener stop error: {e}")
+
+def merge_alerts(shared, docs):
+    """Caller holds the lock: fold alert documents into shared['alerts'] (replaced, never mutated), newest ALERTS_KEPT"""
+    if not docs:
+        return
+    alerts = {**shared['alerts'], **docs}
+    if len(alerts) > ALERTS_KEPT:
+        newest = sorted(alerts, key=lambda alert_id: naive_utc(alerts[alert_id]['updated']))[-ALERTS_KEPT:]
+        alerts = {alert_id: alerts[alert_id] for alert_id in newest}
+    shared['alerts'] = alerts
+    updated = max(alert['updated'] for alert in docs.values())
+    if shared['alerts_updated'] is None or naive_utc(updated) > naive_utc(shared['alerts_updated']):
+        shared['alerts_updated'] = updated
+
+def fetch_alerts_thread(shared, db_ref, lock):
+    """Thread-safe: read the stop's alert documents updated since the last poll (a handful of reads)"""
+    with lock:
+        stop_id = shared.get('stop_id', DEFAULT_STOP_ID)
+        since = shared['alerts_updated'] or utc_now() - timedelta(days=ALERT_DAYS)
+    try:
+        query = alert_collection(db_ref, stop_id).where("updated", ">", since).order_by("updated").limit(ALERTS_KEPT)
+        docs = {doc.id: doc.to_dict() for doc in query.stream()}
+    except Exception as e:
+        print(f"Alert fetch error: {e}")
+        return
+    with lock:
+        shared['daily_reads'] = shared.get('daily_reads', 0) + max(1, len(docs))
+        shared['alerts_fetch_time'] = datetime.now()
+        merge_alerts(shared, docs)
+
+def start_alerts_listener(shared, lock, db_ref):
+    """Subscribe to the stop's alert documents; the bridge's raises and clears are pushed as they are written"""
+    with lock:
+        stop_id = shared.get('stop_id', DEFAULT_STOP_ID)
+        since = shared['alerts_updated'] or utc_now() - timedelta(days=ALERT_DAYS)
+
+    def on_snapshot(docs, changes, read_time):
+        # A cleared alert arrives as MODIFIED with active=False; REMOVED only means it left the query
+        updates = {change.document.id: change.document.to_dict() for change in changes if change.type.name != 'REMOVED'}
+        with lock:
+            merge_alerts(shared, updates)
+
+    query = alert_collection(db_ref, stop_id).where("updated", ">", since).order_by("updated")
+    watch = query.on_snapshot(on_snapshot)
+    with lock:
+        shared['alerts_watch'] = watch
+    print(f"✓ Alerts listener started for {stop_id}")
+
+@st.cache_data(ttl=STOP_LIST_TTL, show_spinner=False)
+def fetch_stop_ids(_db_ref):
+    """List bus stops that have reported at least once (one read per stop, shared by all sessions)"""
+    try:
+        stop_ids = [doc.id for doc in _db_ref.collection(STOPS_COLLECTION).select([]).stream()]
+        return stop_ids or [DEFAULT_STOP_ID]
+    except Exception as e:
+        print(f"Stop list error: {e}")
+        return [DEFAULT_STOP_ID]
+
+def fetch_rollups_thread(shared, db_ref, lock):
+    """Thread-safe: refresh hourly/daily rollups, re-reading only buckets from the newest cached one on"""
+    with lock:
+        stop_id = shared.get('stop_id', DEFAULT_STOP_ID)
+        cached = shared['rollups']
+    cutoff = bucket_id(utc_now() - timedelta(days=ROLLUP_DAYS), "day")
+    fetched = {}
+    try:
+        for resolution in ('hour', 'day'):
+            docs = cached[resolution]
+            if docs:
+                # The newest bucket is still filling up, so it is read again
+                since = docs[max(docs)]['bucket_start']
+            else:
+                since = utc_now() - timedelta(days=ROLLUP_DAYS)
+            query = rollup_collection(db_ref, stop_id, resolution).where("bucket_start", ">=", since)
+            fetched[resolution] = {doc.id: doc.to_dict() for doc in query.stream()}
+    except Exception as e:
+        print(f"Rollup fetch error: {e}")
+        return
+    with lock:
+        shared['daily_reads'] = shared.get('daily_reads', 0) + sum(max(1, len(docs)) for docs in fetched.values())
+        shared['rollups'] = {
+            resolution: {key: doc for key, doc in {**cached[resolution], **fetched[resolution]}.items() if key >= cutoff}
+            for resolution in ('hour', 'day')
+        }
+        shared['rollup_fetch_time'] = datetime.now()
+        shared['data_version'] += 1
+    print(f"✓ Rollups for {stop_id}: {sum(len(docs) for docs in fetched.values())} buckets read")
+
+def rollup_frame(docs, start=None):
+    """Rollup documents -> DataFrame by bucket_start with per-bucket means (<field> = <field>_sum / count)"""
+    if not docs:
+        return pd.DataFrame()
+    df = pd.DataFrame(list(docs.values()))
+    df['bucket_start'] = pd.to_datetime(df['bucket_start'])
+    if df['bucket_start'].dt.tz is not None:
+        df['bucket_start'] = df['bucket_start'].dt.tz_convert('UTC').dt.tz_localize(None)
+    df = df.sort_values('bucket_start')
+    if start is not None:
+        df = df[df['bucket_start'] >= start.replace(minute=0, second=0, microsecond=0)]
+    counts = df['count'].where(df['count'] > 0)
+    for field in ROLLUP_FIELDS:
+        if f'{field}_sum' in df.columns:
+            df[field] = df[f'{field}_sum'] / counts
+    return df
+
+# ================= DIRECT MQTT LIVE FEED =================
+def normalize_live_reading(payload, stop_id):
+    """Firmware payload -> a row with the names and types the dashboard reads (raises SchemaError)"""
+    return Reading.from_payload(payload, stop_id, utc_now()).to_document()
+
+def start_live_feed(host, port, stop_id, shared, lock):
+    """Subscribe to one stop's telemetry on the broker; readings land in shared['live']"""
+    topics = [f"iot/{stop_id}/telemetry"]
+    if stop_id == DEFAULT_STOP_ID:
+        topics.append("iot")  # older firmware on the flat topic
+
+    def on_connect(client, userdata, flags, rc):
+        print(f"✓ Live feed connected to {host}:{port}")
+        client.subscribe([(topic, 0) for topic in topics])
+
+    def on_message(client, userdata, msg):
+        try:
+            data = normalize_live_reading(decode_payload(msg.payload)[1], stop_id)
+        except Exception as e:
+            print(f"Live feed error: {e}")
+            return
+        with lock:
+            shared['live'] = data
+            shared['live_count'] = shared.get('live_count', 0) + 1
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect_async(host, port, 60)
+    client.loop_start()
+    return client
+
+def stop_live_feed(client):
+    try:
+        client.loop_stop()
+        client.disconnect()
+    except Exception as e:
+        print(f"Live feed stop error: {e}")
+
+def live_latest(latest, live):
+    """Firestore's newest row overlaid with the direct MQTT reading while that is fresh"""
+    if live is None or reading_lag(live['timestamp']) > LIVE_MAX_AGE:
+        return latest
+    return {**latest, **live}
+
+# ================= PROCESS-WIDE DATA FETCHER =================
+def new_shared_data(stop_id):
+    """State one fetcher's background thread writes and every session reads"""
+    return {
+        'cached_data': {},  # history.columns(), replaced on every change
+        'last_fetch_time': None,
+        'daily_reads': 0,
+        'fetch_counter': 0,
+        'data_version': 0,  # bumped whenever cached_data or rollups change; keys the analytics cache
+        'quota_exceeded': False,
+        'quota_exceeded_time': None,
+        'failed_fetch_count': 0,
+        'last_data_update': None,
+        'last_reset': datetime.now().date(),
+        'stop_id': stop_id,
+        'history': ReadingColumns(HISTORY_MAXLEN),
+        'high_water_mark': None,  # timestamp of the newest reading in the history
+        'commit_cursor': None,  # the next fetch or listener starts after this commit (None: backfill first)
+        'seen_ids': OrderedDict(),  # ids of the readings in the history, oldest first
+        'watch': None,
+        'lag_samples': deque(maxlen=500),  # seconds from bridge timestamp to dashboard
+        'fetch_seconds': deque(maxlen=500),  # duration of each fetch cycle
+        'rollups': {'hour': {}, 'day': {}},  # bucket id -> rollup document, replaced on every refresh
+        'rollup_fetch_time': None,
+        'live': None,  # newest reading straight from the MQTT broker
+        'live_count': 0,
+        'alerts': {},  # alert id -> the bridge's alert document, replaced on every change
+        'alerts_updated': None,  # newest 'updated' seen: the next poll reads only later changes
+        'alerts_watch': None,
+        'alerts_fetch_time': None,
+    }
+
+class DataFetcher:
+    """One background fetch thread per server process and stop, shared by every browser session"""
+
+    def __init__(self, db_ref, stop_id, demo=False, interval=STATUS_INTERVAL):
+        self.db_ref = db_ref
+        self.stop_id = stop_id
+        self.demo = demo
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.shared = new_shared_data(stop_id)
+        self.sessions = {}  # session uid -> {'seen', 'source_mode', 'rollups', 'live'}; the reference count
+        self.thread = None
+        self.live_lock = threading.Lock()
+        self.live_client = None
+        self.live_config = None
+        self.demo_rules = RuleEngine() if demo else None  # demo mode: the bridge's rules run here, in memory
 
-# ================= SILENT DATA FETCH LOOP =================
-def silent_data_fetch_loop(interval, db_ref, demo_mode_getter):
-    """Background thread that fetches data every interval seconds"""
-    def fetch_loop(shared, lock, db_ref):
+    def attach(self, session_uid, source_mode='listener', rollups=False, live_config=None):
+        """Called on every rerun: refreshes the session's reference and starts the thread if idle"""
+        with self.lock:
+            self.sessions[session_uid] = {'seen': time.monotonic(), 'source_mode': source_mode, 'rollups': rollups,
+                                          'live': live_config}
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self._update_live_feed()
+
+    def detach(self, session_uid):
+        """The session switched stop or mode; closed tabs simply stop refreshing and expire"""
+        with self.lock:
+            self.sessions.pop(session_uid, None)
+        self._update_live_feed()
+
+    def snapshot(self):
+        """Cheap per-rerun view: cached_data and rollups are replaced, never mutated, so no copies"""
+        with self.lock:
+            shared = self.shared
+            return {
+                'cached_data': shared['cached_data'],
+                'fetch_counter': shared['fetch_counter'],
+                'data_version': shared['data_version'],
+                'daily_reads': shared['daily_reads'],
+                'quota_exceeded': shared['quota_exceeded'],
+                'quota_exceeded_time': shared['quota_exceeded_time'],
+                'lag_samples': list(shared['lag_samples']),
+                'fetch_seconds': list(shared['fetch_seconds']),
+                'rollups': shared['rollups'],
+                'alerts': shared['alerts'],
+                'viewers': len(self.sessions),
+            }
+
+    def live_reading(self):
+        with self.lock:
+            return self.shared['live']
+
+    def _active_sessions(self):
+        """Caller holds the lock: drop sessions that stopped rerunning, return how many remain"""
+        cutoff = time.monotonic() - SESSION_TIMEOUT
+        for session_uid in [uid for uid, session in self.sessions.items() if session['seen'] < cutoff]:
+            del self.sessions[session_uid]
+        return len(self.sessions)
+
+    def _update_live_feed(self):
+        """One broker subscription per fetcher, kept while any attached session wants the live feed"""
+        with self.lock:
+            wanted = [session['live'] for session in self.sessions.values() if session['live'] is not None]
+        config = wanted[0] if wanted and mqtt is not None else None
+        with self.live_lock:
+            if config == self.live_config:
+                return
+            if self.live_client is not None:
+                stop_live_feed(self.live_client)
+                self.live_client = None
+            with self.lock:
+                self.shared['live'] = None
+            if config is not None:
+                self.live_client = start_live_feed(*config, self.stop_id, self.shared, self.lock)
+            self.live_config = config
+
+    def _run(self):
+        print(f"✓ Background fetch thread started for {self.stop_id}")
         while True:
+            with self.lock:
+                if not self._active_sessions():
+                    # Last viewer gone: hand the listeners over for shutdown and let attach() start afresh
+                    watches = [self.shared['watch'], self.shared['alerts_watch']]
+                    self.shared['watch'] = self.shared['alerts_watch'] = None
+                    self.thread = None
+                    break
+            started = time.perf_counter()
             try:
-                # Check demo mode from shared state (thread-safe read)
-                with lock:
-                    is_demo = shared.get('demo_mode', False)
-                
-                if is_demo:
-                    # Use mock data - NO Firebase fetch
-                    import random
-                    mock_data = []
-                    base_time = datetime.now()
-                    for i in range(50):
-                        # Spread data across multiple days (each record ~2-6 hours apart)
-                        hours_offset = i * random.randint(2, 6)
-                        timestamp = base_time - timedelta(hours=hours_offset)
-                        
-                        # Simulate day/night cycle for LDR based on hour
-                        hour_of_day = timestamp.hour
-                        if 6 <= hour_of_day <= 18:  # Daytime
-                            ldr_value = random.randint(2000, 4000)
-                        else:  # Nighttime
-                            ldr_value = random.randint(100, 500)
-                        
-                        mock_data.append({
-                            'timestamp': timestamp,
-                            'smoke': random.randint(500, 3500),
-                            'air': random.randint(800, 3000),
-                            'motion_detected': random.random() < 0.3,
-                            'rain': random.random() < 0.1,
-                            'ldr': ldr_value,
-                            'window': "CLOSED" if random.random() < 0.8 else "OPEN",
-                            'emergency': "false",
-                            'panic': "false",
-                        })
-                    with lock:
-                        shared['cached_data'] = mock_data
-                        shared['fetch_counter'] = shared.get('fetch_counter', 0) + 1
-                        shared['last_data_update'] = datetime.now()
-                    print("🎮 Demo mode: Using mock data (no Firebase fetch)")
+                if self.demo:
+                    self._load_mock()
                 else:
-                    # Live mode - fetch from Firebase
-                    with lock:
-                        should_fetch = should_fetch_data_thread(shared, interval)
-                    if should_fetch:
-                        # Fetch outside lock to avoid blocking
-                        data = fetch_firestore_data_thread(shared, db_ref, 50)
-                        with lock:
-                            shared['last_data_update'] = datetime.now()
+                    self._fetch()
             except Exception as e:
                 print(f"Fetch loop error: {e}")
-            time.sleep(interval)
-
-    if not st.session_state.get('fetch_thread_started', False):
-        shared = st.session_state.shared_data
-        lock = st.session_state.data_lock
-        fetch_thread = threading.Thread(target=fetch_loop, args=(shared, lock, db_ref), daemon=True)
-        fetch_thread.start()
-        st.session_state.fetch_thread_started = True
-        print("✓ Background fetch thread started")
-
-# Start the background fetch loop
-silent_data_fetch_loop(STATUS_INTERVAL, db, lambda: st.session_state.demo_mode)
-
-# ================= SYNC SHARED DATA TO SESSION STATE =================
-with st.session_state.data_lock:
-    st.session_state.cached_data = st.session_state.shared_data.get('cached_data', [])
-    st.session_state.fetch_counter = st.session_state.shared_data.get('fetch_counter', 0)
-    st.session_state.daily_reads = st.session_state.shared_data.get('daily_reads', 0)
-    st.session_state.quota_exceeded = st.session_state.shared_data.get('quota_exceeded', False)
-    st.session_state.quota_exceeded_time = st.session_state.shared_data.get('quota_exceeded_time')
-    # Sync demo_mode to shared_data for the background thread
-    st.session_state.shared_data['demo_mode'] = st.session_state.demo_mode
+            with self.lock:
+                self.shared['fetch_seconds'].append(time.perf_counter() - started)
+            time.sleep(self.interval)
+        for watch in watches:
+            if watch is None:
+                continue
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"Listener stop error: {e}")
+        self._update_live_feed()
+        print(f"⏹️ Fetch thread for {self.stop_id} stopped: no viewers left")
+
+    def _load_mock(self):
+        # Demo mode - NO Firebase fetch: a day of synthetic history, then the readings a stop would have sent since
+        now = utc_now()  # in UTC like the bridge's readings
+        with self.lock:
+            last = self.shared['high_water_mark']
+        start = now - timedelta(hours=DEMO_HISTORY_HOURS) if last is None else last + timedelta(seconds=synthetic.SAMPLE_INTERVAL)
+        columns = synthetic.generate_stop(synthetic.stop_index(self.stop_id), start, now)
+        count = len(columns['timestamp'])
+        for reading in from_columns(columns, self.stop_id):
+            self.demo_rules.evaluate(reading)
+        with self.lock:
+            self.shared['fetch_counter'] += 1
+            if count:
+                self.shared['alerts'] = self.demo_rules.recent(self.stop_id)
+                self.shared['history'].extend(columns)
+                self.shared['high_water_mark'] = EPOCH + timedelta(seconds=float(columns['timestamp'][-1]))
+                self.shared['cached_data'] = self.shared['history'].columns()
+                self.shared['data_version'] += 1
+                self.shared['last_data_update'] = datetime.now()
+        if last is None:
+            print(f"🎮 Demo mode: {count} synthetic readings (no Firebase fetch)")
+
+    def _fetch(self):
+        # Live mode - push from a snapshot listener, or poll Firebase as the fallback
+        shared, lock, db_ref = self.shared, self.lock, self.db_ref
+        with lock:
+            # The listener stays up while any viewer wants Push, so tabs on different modes do not restart it
+            wants_listener = any(session['source_mode'] == 'listener' for session in self.sessions.values())
+            use_listener = wants_listener and not shared.get('quota_exceeded')
+            watch = shared.get('watch')
+            stale = watch is not None and not getattr(watch, 'is_active', True)
+            backfilled = shared.get('commit_cursor') is not None
+        if watch is not None and (stale or not use_listener):
+            stop_snapshot_listener(shared, lock)
+            watch = None
+        if use_listener and watch is None and backfilled:
+            try:
+                start_snapshot_listener(shared, lock, db_ref)
+                watch = shared.get('watch')
+            except Exception as e:
+                print(f"Listener error, polling instead: {e}")
+        if watch is None:
+            with lock:
+                should_fetch = should_fetch_data_thread(shared, self.interval)
+            if should_fetch:
+                # Query runs outside the lock; the function locks only to update state
+                fetch_firestore_data_thread(shared, db_ref, DELTA_PAGE_SIZE, lock)
+        # Week/Month: refresh the rollups once per ANALYTICS_INTERVAL while any session shows them
+        with lock:
+            last_rollups = shared.get('rollup_fetch_time')
+            want_rollups = (any(session['rollups'] for session in self.sessions.values()) and not shared.get('quota_exceeded')
+                            and (last_rollups is None or (datetime.now() - last_rollups).total_seconds() >= ANALYTICS_INTERVAL))
+        if want_rollups:
+            fetch_rollups_thread(shared, db_ref, lock)
+        self._fetch_alerts(use_listener)
+
+    def _fetch_alerts(self, use_listener):
+        """The stop's alert stream: a listener alongside the readings', else a poll every ALERTS_POLL_INTERVAL"""
+        shared, lock, db_ref = self.shared, self.lock, self.db_ref
+        with lock:
+            watch = shared.get('alerts_watch')
+            stale = watch is not None and not getattr(watch, 'is_active', True)
+        if watch is not None and (stale or not use_listener):
+            stop_snapshot_listener(shared, lock, 'alerts_watch')
+            watch = None
+        if use_listener and watch is None:
+            try:
+                start_alerts_listener(shared, lock, db_ref)
+                return
+            except Exception as e:
+                print(f"Alerts listener error, polling instead: {e}")
+        if watch is None:
+            with lock:
+                last = shared.get('alerts_fetch_time')
+                due = not shared.get('quota_exceeded') and (last is None or (datetime.now() - last).total_seconds() >= ALERTS_POLL_INTERVAL)
+            if due:
+                fetch_alerts_thread(shared, db_ref, lock)
+
+@st.cache_resource(show_spinner=False)
+def get_data_fetcher(stop_id, demo=False):
+    """The process-wide fetcher for a stop (demo sessions share a mock-data fetcher of their own)"""
+    return DataFetcher(db, stop_id, demo)
+
+@st.cache_resource(show_spinner=False)
+def get_hot_store():
+    return HotStore(HOTSTORE_PATH) if os.path.isdir(HOTSTORE_PATH) else None
+
+# ================= ANALYTICS CACHE =================
+class AnalyticsCache:
+    """Process-wide memo of derived frames and chart data, keyed by component, stop, mode and period"""
+
+    def __init__(self, max_entries=ANALYTICS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (data version, computed at (monotonic), value), least recent first
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, interval, compute):
+        """Cached value for key (shared by every session: never mutate it), recomputed when stale"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                cached_version, computed_at, value = entry
+                age = now - computed_at
+                # New data waits out the component's interval; unchanged data is still recomputed
+                # after ANALYTICS_INTERVAL because the Day/Week/Month windows slide with the clock
+                if age < interval or (cached_version == version and age < ANALYTICS_INTERVAL):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+        # Outside the lock: two sessions may occasionally compute the same entry, which is harmless
+        value = compute()
+        with self.lock:
+            self.entries[key] = (version, now, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+@st.cache_resource(show_spinner=False)
+def get_analytics_cache():
+    return AnalyticsCache()
 
 # ================= CUSTOM CSS =================
 st.markdown("""
@@ -689,18 +1191,39 @@ with st.sidebar:
                            help="When enabled, uses generated mock data instead of fetching from Firebase to preserve daily quota")
     if demo_mode != st.session_state.demo_mode:
         st.session_state.demo_mode = demo_mode
-        # Immediately sync to shared data for background thread
-        with st.session_state.data_lock:
-            st.session_state.shared_data['demo_mode'] = demo_mode
         if demo_mode:
             st.toast("🎮 Demo mode enabled - Using mock data", icon="✅")
         else:
             st.toast("📡 Live mode enabled - Fetching from Firebase", icon="✅")
+    source_label = st.radio("🔄 Live Updates", ["Push (listener)", "Polling"],
+                            index=0 if st.session_state.source_mode == 'listener' else 1, horizontal=True,
+                            help="Push receives new readings as Firestore commits them; polling queries every few seconds. "
+                                 "Tabs on the same stop share one fetcher: it listens while any of them asks for Push")
+    source_mode = 'listener' if source_label.startswith("Push") else 'poll'
+    if source_mode != st.session_state.source_mode:
+        st.session_state.source_mode = source_mode
+    st.markdown("**🚏 Bus Stop**")
+    stop_options = [DEFAULT_STOP_ID] if st.session_state.demo_mode else fetch_stop_ids(db)
+    if st.session_state.stop_id not in stop_options:
+        stop_options = [st.session_state.stop_id] + stop_options
+    stop_id = st.selectbox("Stop", stop_options, index=stop_options.index(st.session_state.stop_id),
+                           help="Only this stop's readings are fetched")
+    st.session_state.stop_id = stop_id
+    st.markdown("**📡 Direct MQTT Live Feed**")
+    live_enabled = st.checkbox("Live tiles from MQTT broker", value=False, disabled=mqtt is None,
+                               help="Status tiles and panic come straight from the broker (no Firestore reads)")
+    live_host = st.text_input("Broker Host", "127.0.0.1", disabled=not live_enabled)
+    live_port = st.number_input("Broker Port", 1, 65535, LIVE_MQTT_PORT, disabled=not live_enabled)
+    if mqtt is None:
+        st.caption("Install paho-mqtt to enable the live feed")
+    st.session_state.live_config = (live_host, int(live_port)) if live_enabled and mqtt is not None else None
     st.markdown("---")
     camera_enabled = st.checkbox("Enable Live Camera", value=False)
     st.markdown("**🎥 Camera Settings**")
-    camera_source = st.number_input("Camera Source", 0, 10, 0)
-    resolution_option = st.selectbox("Resolution", ["720p (1280x720)", "1080p (1920x1080)", "480p (640x480)"], index=0)
+    camera_sources = parse_camera_sources(st.text_input("Camera Sources", "0",
+                                                        help="Comma-separated device indexes or stream URLs, e.g. 0, 1"))
+    resolution_option = st.selectbox("Recording Resolution", ["720p (1280x720)", "1080p (1920x1080)", "480p (640x480)"], index=0,
+                                     help=f"Emergency recordings keep this resolution; the live preview is always scaled to {PREVIEW_WIDTH} px")
     if "1080p" in resolution_option:
         cam_width, cam_height = 1920, 1080
     elif "720p" in resolution_option:
@@ -710,6 +1233,35 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("📊 Data Analysis")
     time_period = st.selectbox("Time Period", ["Day", "Week", "Month"])
+    hot_store = get_hot_store()
+    if hot_store is not None:
+        st.caption("🗄️ History served from the local hot store")
+    show_perf = st.checkbox("⏱️ Performance Panel", value=False,
+                            help="Rolling p50/p95 time of each dashboard section, fetch latency and camera frame rates")
+
+# ================= ATTACH TO THE SHARED FETCHER =================
+# Every session of this server process reads the same fetcher for its stop: Firestore reads
+# and fetch threads stay constant however many browsers are watching.
+with timed_section("fetcher"):
+    fetcher_key = (st.session_state.stop_id, st.session_state.demo_mode)
+    if st.session_state.fetcher_key not in (None, fetcher_key):
+        get_data_fetcher(*st.session_state.fetcher_key).detach(st.session_state.session_uid)
+    st.session_state.fetcher_key = fetcher_key
+    fetcher = get_data_fetcher(*fetcher_key)
+    fetcher.attach(st.session_state.session_uid, st.session_state.source_mode,
+                   rollups=time_period in ROLLUP_PERIODS, live_config=st.session_state.live_config)
+    snapshot = fetcher.snapshot()
+    st.session_state.cached_data = snapshot['cached_data']
+    st.session_state.fetch_counter = snapshot['fetch_counter']
+    st.session_state.daily_reads = snapshot['daily_reads']
+    st.session_state.quota_exceeded = snapshot['quota_exceeded']
+    st.session_state.quota_exceeded_time = snapshot['quota_exceeded_time']
+    st.session_state.lag_samples = snapshot['lag_samples']
+    st.session_state.rollups = snapshot['rollups']
+    st.session_state.stop_alerts = snapshot['alerts']
+    live_on = st.session_state.live_config is not None
+
+with st.sidebar:
     st.markdown("---")
     st.subheader("📈 System Stats")
     if st.session_state.demo_mode:
@@ -719,6 +1271,13 @@ with st.sidebar:
     else:
         st.success("✓ **LIVE MODE**")
     st.metric("Total Fetches", st.session_state.fetch_counter)
+    st.metric("👥 Viewers", snapshot['viewers'], help="Browser sessions sharing this stop's fetcher")
+    cache_stats = get_analytics_cache().stats()
+    st.caption(f"🧮 Analytics cache: {cache_stats['entries']} entries, {cache_stats['hit_rate']:.0%} hits")
+    if len(st.session_state.lag_samples) > 0:
+        lags = np.array(st.session_state.lag_samples)
+        st.metric("⏱️ Data Lag (p50 / p95)", f"{np.percentile(lags, 50):.1f}s / {np.percentile(lags, 95):.1f}s",
+                  help="Bridge timestamp to dashboard visibility")
     reads_percentage = (st.session_state.daily_reads / 50000) * 100
     st.metric("Daily Reads", f"{st.session_state.daily_reads:,} / 50,000")
     st.progress(min(reads_percentage / 100, 1.0))
@@ -726,60 +1285,106 @@ with st.sidebar:
         st.caption("💡 Daily reads frozen in demo mode")
 
 # ================= CAMERA MANAGEMENT =================
+# Sessions renew their subscriptions on every rerun; a device closes once nobody is subscribed.
+# Each camera has its own capture thread, ring and recorder, so a dead one never stalls the rest.
+cameras = {}
+recorders = {source: get_recorder(source) for source in camera_sources}
+for source in st.session_state.camera_sources:
+    if not camera_enabled or source not in camera_sources:
+        get_camera_service(source).unsubscribe(st.session_state.session_uid)
 if camera_enabled:
-    start_camera_thread(camera_source, cam_width, cam_height)
-else:
-    stop_camera_thread()
+    for source in camera_sources:
+        cameras[source] = get_camera_service(source)
+        cameras[source].subscribe(st.session_state.session_uid, cam_width, cam_height)
+st.session_state.camera_sources = list(cameras)
 
 # ================= MAIN CONTENT =================
 st.markdown('<h1 class="main-header">🚌 Smart Bus Stop Dashboard</h1>', unsafe_allow_html=True)
 
-# Get data from session state (synced from background thread)
-data_list = st.session_state.cached_data
-df = pd.DataFrame(data_list) if data_list else pd.DataFrame()
-if not df.empty and 'timestamp' in df.columns:
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.sort_values('timestamp', ascending=False)
-latest = df.iloc[0].to_dict() if not df.empty else {}
-
-# ========== CHECK FOR PANIC BUTTON ==========
-is_panic_active = check_and_handle_panic(latest)
-
-# ========== CAPTURE EMERGENCY FRAMES ==========
-capture_emergency_frame()
-
-# ========== EMERGENCY BANNER ==========
-if is_panic_active:
-    st.markdown("""
-    <div style="background-color: #f44336; color: white; padding: 20px; border-radius: 10px; text-align: center; margin-bottom: 20px; animation: pulse 1s infinite;">
-        <h2 style="margin: 0;">🚨 EMERGENCY ALERT 🚨</h2>
-        <p style="margin: 10px 0 0 0; font-size: 18px;">Panic button has been activated! Emergency recording in progress.</p>
-    </div>
-    <style>
-        @keyframes pulse {
-            0%, 100% { opacity: 1; }
-            50% { opacity: 0.7; }
-        }
-    </style>
-    """, unsafe_allow_html=True)
-
-# ========== CURRENT STATUS ==========
-st.markdown("### 📊 Live Sensor Status")
-col1, col2, col3, col4 = st.columns(4)
-rain_val = latest.get('rain', False)
-smoke_val = latest.get('smoke', 0)
-air_val = latest.get('air', 0)
-ldr_val = latest.get('ldr', 0)
-smoke_color = "🟢" if smoke_val < 2000 else "🟡" if smoke_val < 3000 else "🔴"
-air_color = "🟢" if air_val < 2000 else "🟡" if air_val < 3000 else "🔴"
-ldr_color = "🌑" if ldr_val < 500 else "🌘" if ldr_val < 1500 else "🌗" if ldr_val < 2500 else "🌕"
-
-col1.metric("🌧️ Rain Detected", "YES ☔" if rain_val else "NO ☀️")
-col2.metric("💨 Smoke Sensor", f"{smoke_val} {smoke_color}")
-col3.metric("🌫️ Air Quality", f"{air_val} {air_color}")
-col4.metric("💡 LDR Sensor", f"{ldr_val} {ldr_color}")
+# Derived frames and chart data come from the process-wide analytics cache: a rerun without new
+# readings, or within a component's refresh interval, reuses them instead of recomputing
+with timed_section("frames"):
+    analytics = get_analytics_cache()
+    data_version = snapshot['data_version']
+    view_key = (st.session_state.stop_id, st.session_state.demo_mode)
+    history_columns = st.session_state.cached_data
+    # The status tiles and panic check read this frame, so it follows every new version at once
+    df = analytics.get(('frame',) + view_key, data_version, 0, lambda: readings_frame(history_columns))
+    latest = df.iloc[0].to_dict() if not df.empty else {}
+
+    # Week/Month: hourly and daily rollups from the bridge instead of raw readings
+    hourly_df = daily_df = pd.DataFrame()
+    if time_period in ROLLUP_PERIODS and not st.session_state.demo_mode:
+        rollups = st.session_state.rollups
+        hourly_df, daily_df = analytics.get(('rollups', time_period) + view_key, data_version, ANALYTICS_INTERVAL,
+                                            lambda: rollup_frames(rollups, time_period))
+
+    # Otherwise raw rows: from the local hot store when available, else the fetched rows
+    history_df = df
+    if hot_store is not None and not st.session_state.demo_mode and hourly_df.empty:
+        history_df = analytics.get(('history', time_period) + view_key, data_version, ANALYTICS_INTERVAL,
+                                   lambda: history_frame(df, hot_store, st.session_state.stop_id, time_period))
+
+def render_live_status():
+    """Panic check, emergency banner and status tiles (re-runs on its own while the live feed is on)"""
+    current = latest
+    if live_on:
+        current = live_latest(latest, fetcher.live_reading())
+
+    # ========== CHECK FOR PANIC BUTTON ==========
+    is_panic_active = check_and_handle_panic(current)
+
+    # ========== RECORDING ALERTS ==========
+    sync_recording_alerts()
+
+    # ========== PIR MOTION HINT ==========
+    # A fresh PIR detection puts the camera at its full frame rate before the picture changes
+    if current.get('motion_detected') and 'timestamp' in current and reading_lag(current['timestamp']) < LIVE_MAX_AGE:
+        for camera in cameras.values():
+            camera.hint_motion()
+
+    # ========== EMERGENCY BANNER ==========
+    if is_panic_active:
+        st.markdown("""
+        <div style="background-color: #f44336; color: white; padding: 20px; border-radius: 10px; text-align: center; margin-bottom: 20px; animation: pulse 1s infinite;">
+            <h2 style="margin: 0;">🚨 EMERGENCY ALERT 🚨</h2>
+            <p style="margin: 10px 0 0 0; font-size: 18px;">Panic button has been activated! Emergency recording in progress.</p>
+        </div>
+        <style>
+            @keyframes pulse {
+                0%, 100% { opacity: 1; }
+                50% { opacity: 0.7; }
+            }
+        </style>
+        """, unsafe_allow_html=True)
+
+    # ========== CURRENT STATUS ==========
+    st.markdown("### 📊 Live Sensor Status")
+    col1, col2, col3, col4 = st.columns(4)
+    rain_val = current.get('rain', False)
+    smoke_val = current.get('smoke', 0)
+    air_val = current.get('air', 0)
+    ldr_val = current.get('ldr', 0)
+    smoke_color = "🟢" if smoke_val < SMOKE_WARNING else "🟡" if smoke_val < SMOKE_DANGER else "🔴"
+    air_color = "🟢" if air_val < AIR_WARNING else "🟡" if air_val < AIR_DANGER else "🔴"
+    ldr_color = "🌑" if ldr_val < 500 else "🌘" if ldr_val < 1500 else "🌗" if ldr_val < 2500 else "🌕"
+
+    col1.metric("🌧️ Rain Detected", "YES ☔" if rain_val else "NO ☀️")
+    col2.metric("💨 Smoke Sensor", f"{smoke_val} {smoke_color}")
+    col3.metric("🌫️ Air Quality", f"{air_val} {air_color}")
+    col4.metric("💡 LDR Sensor", f"{ldr_val} {ldr_color}")
+    if current is not latest:
+        st.caption(f"📡 Live from MQTT broker · {current['timestamp'].strftime('%H:%M:%S')}")
+
+with timed_section("live status"):
+    if live_on and hasattr(st, "fragment"):
+        st.fragment(run_every=LIVE_REFRESH_SECONDS)(render_live_status)()
+    else:
+        render_live_status()
 
 # Update energy log
+if live_on:
+    latest = live_latest(latest, fetcher.live_reading())
 motion_val = latest.get('motion_detected', False)
 energy_used = calculate_energy_usage(motion_val, duration_minutes=STATUS_INTERVAL/60)
 st.session_state.motion_log.append({'timestamp': datetime.now(), 'motion': motion_val, 'energy': energy_used})
@@ -787,94 +1392,141 @@ st.session_state.motion_log.append({'timestamp': datetime.now(), 'motion': motio
 st.markdown("---")
 
 # ========== ALERTS LOG ==========
-display_alerts_log()
+with timed_section("alerts"):
+    display_alerts_log()
 
 # ========== EMERGENCY RECORDINGS ==========
-display_emergency_recordings()
+with timed_section("recordings"):
+    display_emergency_recordings()
 
 st.markdown("---")
 
 # ========== CAMERA FEED ==========
-st.markdown("### 📹 Live CCTV Feed")
-current_frame = st.session_state.camera_frame_container.get('frame')
-if current_frame is not None:
-    from PIL import Image
-    import io
-    pil_image = Image.fromarray(current_frame.astype('uint8'))
-    img_bytes = io.BytesIO()
-    pil_image.save(img_bytes, format='JPEG', quality=85)
-    img_bytes.seek(0)
-    # Use columns to constrain width - camera in center column
-    cam_col1, cam_col2, cam_col3 = st.columns([1, 2, 1])
-    with cam_col2:
-        st.image(img_bytes, channels="RGB", width=680)
-else:
-    cam_col1, cam_col2, cam_col3 = st.columns([1, 2, 1])
-    with cam_col2:
-        st.info("📷 Camera not available or disabled")
+with timed_section("camera feed"):
+    st.markdown("### 📹 Live CCTV Feed")
+    # Encoded once per new frame by the shared camera service; reruns reuse the bytes
+    if len(cameras) <= 1:
+        # Use columns to constrain width - camera in center column
+        cam_col1, cam_col2, cam_col3 = st.columns([1, 2, 1])
+        feed_columns = [cam_col2]
+    else:
+        feed_columns = st.columns(min(len(cameras), 3))
+    if cameras:
+        for idx, (source, camera) in enumerate(cameras.items()):
+            with feed_columns[idx % len(feed_columns)]:
+                preview = camera.preview()[1]
+                if preview is not None:
+                    st.image(preview, width=PREVIEW_WIDTH if len(cameras) == 1 else 'stretch')
+                    camera_stats = camera.stats()
+                    st.caption(f"📷 {source} · {'🏃 Activity' if camera_stats['active'] else '💤 Static scene'} · "
+                               f"{camera_stats['fps']:.0f} fps captured")
+                elif camera.state == 'offline':
+                    st.warning(f"📷 Camera {source} is offline")
+                else:
+                    st.info(f"📷 Camera {source} is starting...")
+    else:
+        with feed_columns[0]:
+            st.info("📷 Camera not available or disabled")
 
 st.markdown("---")
 
 # ========== LIVE TRENDS ==========
-st.markdown("### 📈 Live Trends")
-if not df.empty and 'smoke' in df.columns and 'air' in df.columns:
-    chart_df = df[['timestamp', 'smoke', 'air']].set_index('timestamp')
-    st.line_chart(chart_df, height=300)
-else:
-    st.info("Collecting data for trends...")
+with timed_section("trends"):
+    st.markdown("### 📈 Live Trends")
+    if not df.empty and 'smoke' in df.columns and 'air' in df.columns:
+        show_chart(analytics.get(('trends',) + view_key, data_version, TRENDS_INTERVAL,
+                                 lambda: chart_spec(df.head(LIVE_TRENDS_ROWS)[['timestamp', 'smoke', 'air']].set_index('timestamp'),
+                                                    'line', 300)))
+    else:
+        st.info("Collecting data for trends...")
 
 # ========== ENERGY MONITOR ==========
-st.markdown("### ⚡ Energy Monitor")
-if len(st.session_state.motion_log) > 0:
-    energy_df = pd.DataFrame(list(st.session_state.motion_log))
-    energy_df['cumulative_energy'] = energy_df['energy'].cumsum()
-    col1, col2 = st.columns(2)
-    col1.metric("⚡ Total Energy Used", f"{energy_df['cumulative_energy'].iloc[-1]:.2f} Wh")
-    col1.metric("⏱️ Active Time", f"{energy_df['motion'].sum() * (STATUS_INTERVAL / 60):.1f} min")
-    avg_power = energy_df['cumulative_energy'].iloc[-1] / (len(energy_df) * STATUS_INTERVAL / 3600) if len(energy_df) > 0 else 0
-    savings = (50 - 5) * (len(energy_df) - energy_df['motion'].sum()) * (STATUS_INTERVAL / 3600)
-    col2.metric("📊 Avg Power", f"{avg_power:.1f} W")
-    col2.metric("💰 Energy Saved", f"{savings:.2f} Wh")
-    st.line_chart(energy_df.set_index('timestamp')['cumulative_energy'], height=250)
-else:
-    st.info("Collecting energy data...")
+with timed_section("energy"):
+    st.markdown("### ⚡ Energy Monitor")
+    if len(st.session_state.motion_log) > 0:
+        # The log grows by one sample per rerun: its frame and chart are rebuilt once per TRENDS_INTERVAL
+        built_at, energy = st.session_state.energy_view
+        if energy is None or time.monotonic() - built_at >= TRENDS_INTERVAL:
+            energy_df = pd.DataFrame(list(st.session_state.motion_log))
+            energy_df['cumulative_energy'] = energy_df['energy'].cumsum()
+            total = energy_df['cumulative_energy'].iloc[-1]
+            active = energy_df['motion'].sum()
+            energy = {
+                'total': total, 'active_minutes': active * (STATUS_INTERVAL / 60),
+                'avg_power': total / (len(energy_df) * STATUS_INTERVAL / 3600),
+                'savings': (50 - 5) * (len(energy_df) - active) * (STATUS_INTERVAL / 3600),
+                'chart': chart_spec(energy_df.set_index('timestamp')['cumulative_energy'], 'line', 250),
+            }
+            st.session_state.energy_view = (time.monotonic(), energy)
+        col1, col2 = st.columns(2)
+        col1.metric("⚡ Total Energy Used", f"{energy['total']:.2f} Wh")
+        col1.metric("⏱️ Active Time", f"{energy['active_minutes']:.1f} min")
+        col2.metric("📊 Avg Power", f"{energy['avg_power']:.1f} W")
+        col2.metric("💰 Energy Saved", f"{energy['savings']:.2f} Wh")
+        show_chart(energy['chart'])
+    else:
+        st.info("Collecting energy data...")
 
 # ========== AIR QUALITY ANALYSIS ==========
-st.markdown("### 🌡️ Air Quality Analysis")
-if not df.empty and 'air' in df.columns:
-    filtered_df = filter_data_by_period(df.copy(), time_period)
-    if not filtered_df.empty:
+with timed_section("air quality"):
+    st.markdown("### 🌡️ Air Quality Analysis")
+    air_summary = analytics.get(('air', time_period) + view_key, data_version, ANALYTICS_INTERVAL,
+                                lambda: air_quality_summary(hourly_df, history_df, time_period))
+    if air_summary is not None:
+        avg_air, max_air, min_air, air_chart = air_summary
         col1, col2, col3 = st.columns(3)
-        avg_air = filtered_df['air'].mean()
         col1.metric(f"📊 Avg ({time_period})", f"{avg_air:.1f}")
-        col2.metric("📈 Maximum", f"{filtered_df['air'].max():.1f}")
-        col3.metric("📉 Minimum", f"{filtered_df['air'].min():.1f}")
-        air_chart_df = filtered_df[['timestamp', 'air']].set_index('timestamp')
-        st.area_chart(air_chart_df, height=250)
+        col2.metric("📈 Maximum", f"{max_air:.1f}")
+        col3.metric("📉 Minimum", f"{min_air:.1f}")
+        show_chart(air_chart)
         if avg_air < 100:
             st.success(f"✅ Air quality is GOOD for the past {time_period.lower()}")
         elif avg_air < 200:
             st.warning(f"⚠️ Air quality is MODERATE for the past {time_period.lower()}")
         else:
             st.error(f"❌ Air quality is POOR for the past {time_period.lower()}")
-else:
-    st.info("No air quality data available")
+    else:
+        st.info("No air quality data available")
 
 st.markdown("---")
 
 # ========== HISTORICAL CHARTS ==========
-if not df.empty:
-    generate_historical_charts(df)
+with timed_section("historical charts"):
+    if not hourly_df.empty:
+        generate_rollup_charts(analytics.get(('rollup_charts', time_period) + view_key, data_version, ANALYTICS_INTERVAL,
+                                             lambda: with_chart_specs(rollup_chart_data(hourly_df, daily_df))))
+    elif not history_df.empty:
+        generate_historical_charts(analytics.get(('charts', time_period) + view_key, data_version, ANALYTICS_INTERVAL,
+                                                 lambda: with_chart_specs(historical_chart_data(history_df))))
 
 # ========== RAW DATA TABLE ==========
-with st.expander("🗂️ Raw Sensor Data", expanded=False):
-    if not df.empty:
-        display_df = df.head(20).copy()
-        if 'timestamp' in display_df.columns:
-            display_df['timestamp'] = display_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
-        st.dataframe(display_df, width='stretch', height=300)
-    else:
-        st.info("No data available")
+with timed_section("raw table"):
+    with st.expander("🗂️ Raw Sensor Data", expanded=False):
+        if not df.empty:
+            st.dataframe(analytics.get(('raw',) + view_key, data_version, STATUS_INTERVAL, lambda: raw_table(df)),
+                         width='stretch', height=300)
+        else:
+            st.info("No data available")
+
+# ================= PERFORMANCE PANEL =================
+record_section("rerun", time.perf_counter() - RERUN_START)
+if show_perf:
+    with st.sidebar:
+        st.markdown("---")
+        st.subheader("⏱️ Performance")
+        perf_df = pd.DataFrame([
+            {'section': name, 'p50 ms': np.percentile(samples, 50) * 1000, 'p95 ms': np.percentile(samples, 95) * 1000,
+             'last ms': samples[-1] * 1000}
+            for name, samples in st.session_state.section_times.items()
+        ]).set_index('section').round(1)
+        st.dataframe(perf_df, width='stretch')
+        st.caption(f"Rolling over this session's last {PROFILE_WINDOW} reruns")
+        if snapshot['fetch_seconds']:
+            fetch_ms = np.array(snapshot['fetch_seconds']) * 1000
+            st.metric("📡 Fetch Cycle (p50 / p95)", f"{np.percentile(fetch_ms, 50):.0f} / {np.percentile(fetch_ms, 95):.0f} ms",
+                      help="One pass of the shared fetcher: listener check, delta query or demo generation, rollups")
+        for source, camera in cameras.items():
+            st.caption(f"📷 {source}: {camera.stats()['fps']:.0f} fps captured, {camera.previews_encoded} previews encoded")
 
 # ================= AUTO-REFRESH USING STREAMLIT-AUTOREFRESH =================
 # Install: pip install streamlit-autorefresh
@@ -0,0 +1,179 @@
+# Local time-series hot store: one directory per stop per day, one raw column file per field
+#
+#   hotstore/<stop_id>/<YYYY-MM-DD>/timestamp.f8, smoke.i4, ... (little-endian, append-only)
+#
+# The bridge appends every reading; the dashboard answers Day/Week/Month queries
+# from local disk instead of Firestore. Only today's segment, the one still growing,
+# stays memory-mapped between queries; closed days are read whole with np.fromfile,
+# so a long-running dashboard holds a handful of maps and file descriptors, not one
+# per column file it has ever queried.
+# Timestamps are seconds since 1970-01-01 UTC (the bridge stamps readings with
+# datetime.now(timezone.utc)), and day segments are UTC days.
+
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import schema
+from schema import EPOCH, to_epoch
+
+HOTSTORE_DIR = "hotstore"
+HOTSTORE_FLUSH_INTERVAL = 1.0  # seconds between appends to the column files
+HOTSTORE_RETENTION_DAYS = 45
+
+# (column, payload keys it may come from, dtype), in schema.COLUMNS order
+COLUMNS = (("timestamp", ("timestamp",), "<f8"),) + schema.FIELDS
+
+def _file_name(column, dtype):
+    return f"{column}.{np.dtype(dtype).str[1:]}"
+
+class HotStoreWriter:
+    """Buffers readings in memory and appends them to the day segments once per flush interval"""
+
+    def __init__(self, root=HOTSTORE_DIR, flush_interval=HOTSTORE_FLUSH_INTERVAL, retention_days=HOTSTORE_RETENTION_DAYS):
+        self.root = root
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.pending = {}  # (stop_id, day) -> list of rows
+        self.written = 0
+        self.last_prune = None
+        self.stop_flag = threading.Event()
+        self.flush_interval = flush_interval
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, reading):
+        """Cheap: one schema.Reading row appended to an in-memory list"""
+        row = reading.row()
+        day = reading.timestamp.strftime("%Y-%m-%d")
+        with self.lock:
+            self.pending.setdefault((reading.stop_id, day), []).append(row)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for (stop_id, day), rows in pending.items():
+            self._write_segment(stop_id, day, list(zip(*rows)))
+
+    def append_columns(self, stop_id, columns):
+        """Bulk path for backfills: {column: array} sorted by timestamp (epoch seconds), written at once"""
+        days = (np.asarray(columns["timestamp"]) // 86400).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(days)]):
+            if end > start:
+                day = (EPOCH + timedelta(days=int(days[start]))).strftime("%Y-%m-%d")
+                self._write_segment(stop_id, day, [columns[column][start:end] for column, _, _ in COLUMNS])
+
+    def _write_segment(self, stop_id, day, values):
+        segment = os.path.join(self.root, stop_id, day)
+        os.makedirs(segment, exist_ok=True)
+        for (column, _, dtype), column_values in zip(COLUMNS, values):
+            with open(os.path.join(segment, _file_name(column, dtype)), "ab") as f:
+                f.write(np.asarray(column_values, dtype=dtype).tobytes())
+        self.written += len(values[0])
+
+    def close(self):
+        self.stop_flag.set()
+        self.thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def prune(self):
+        """Delete day segments older than the retention window"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        for stop_id in _list_dirs(self.root):
+            for day in _list_dirs(os.path.join(self.root, stop_id)):
+                if day < cutoff:
+                    shutil.rmtree(os.path.join(self.root, stop_id, day), ignore_errors=True)
+
+    def _flush_loop(self):
+        while not self.stop_flag.wait(self.flush_interval):
+            try:
+                self.flush()
+                today = datetime.now(timezone.utc).date()
+                if self.last_prune != today:
+                    self.prune()
+                    self.last_prune = today
+            except Exception as e:
+                print(f"Hot store error: {e}")
+
+class HotStore:
+    """Read side: range queries by stop and time window over the day segments"""
+
+    def __init__(self, root=HOTSTORE_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        self.maps = {}  # file path in today's segments -> (size, memmap); re-mapped when the file grows
+
+    def stops(self):
+        return _list_dirs(self.root)
+
+    def query(self, stop_id, start, end, columns=None):
+        """Column arrays for readings with start <= timestamp < end, oldest first"""
+        names = [column for column, _, _ in COLUMNS if columns is None or column in columns or column == "timestamp"]
+        parts = {name: [] for name in names}
+        start_ts, end_ts = to_epoch(start), to_epoch(end)
+        day = start.date()
+        while day <= end.date():
+            segment = self._segment(stop_id, day.strftime("%Y-%m-%d"), names)
+            if segment:
+                ts = segment["timestamp"]
+                mask = (ts >= start_ts) & (ts < end_ts)
+                for name in names:
+                    parts[name].append(segment[name][mask])
+            day += timedelta(days=1)
+        dtypes = {column: dtype for column, _, dtype in COLUMNS}
+        result = {name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtypes[name]) for name in names}
+        order = np.argsort(result["timestamp"], kind="stable")
+        return {name: values[order] for name, values in result.items()}
+
+    def query_frame(self, stop_id, start, end, columns=None):
+        """query() as a DataFrame shaped like the Firestore rows the dashboard uses"""
+        return schema.columns_frame(self.query(stop_id, start, end, columns))
+
+    def _segment(self, stop_id, day, names):
+        segment = os.path.join(self.root, stop_id, day)
+        if not os.path.isdir(segment):
+            return None
+        dtypes = {column: dtype for column, _, dtype in COLUMNS}
+        arrays = {}
+        for name in names:
+            array = self._load(os.path.join(segment, _file_name(name, dtypes[name])), dtypes[name], day)
+            if array is None:
+                return None
+            arrays[name] = array
+        # A crash between column appends can leave columns of unequal length: use the common prefix
+        rows = min(len(array) for array in arrays.values())
+        return {name: array[:rows] for name, array in arrays.items()}
+
+    def _load(self, path, dtype, day):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        count = size // np.dtype(dtype).itemsize
+        if count == 0:
+            return None
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        with self.lock:
+            # Yesterday's maps (and those of days prune() has deleted since) go once the date rolls over
+            for stale in [key for key, (_, _, map_day) in self.maps.items() if map_day != today]:
+                del self.maps[stale]
+            if day == today:
+                cached = self.maps.get(path)
+                if cached is None or cached[0] != count:
+                    cached = (count, np.memmap(path, dtype=dtype, mode="r", shape=(count,)), day)
+                    self.maps[path] = cached
+                return cached[1]
+        try:
+            return np.fromfile(path, dtype=dtype, count=count)
+        except OSError:  # deleted by prune() since the size check
+            return None
+
+def _list_dirs(path):
+    try:
+        return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+    except OSError:
+        return []
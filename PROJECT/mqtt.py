@@ -1,47 +1,363 @@
-#nano mqtt_firebase.py in VM GCP 
+#nano mqtt_firebase.py in VM GCP
 
-import json
+import re
+import threading
+import time
+from collections import deque
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 import paho.mqtt.client as mqtt
-from datetime import datetime
+from datetime import datetime, timezone
+from spool import Spool, SpoolReplayer
+from hotstore import HotStoreWriter
+from rollups import RollupAggregator
+from metrics import BridgeMetrics, start_metrics_server
+from schema import Reading
+from payloads import decode_payload
+from rules import RuleEngine
 
 # ================= CONFIGURATION =================
-CRED_PATH = "firebase_key.json" 
-MQTT_TOPIC = "iot"
+CRED_PATH = "firebase_key.json"
+# Devices publish to iot/<stop_id>/telemetry; old firmware still on the flat "iot" topic
+# is treated as DEFAULT_STOP_ID.
+MQTT_TOPICS = ["iot/+/telemetry", "iot"]
+DEFAULT_STOP_ID = "stop-01"
+STOP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Readings are partitioned per stop: stops/<stop_id>/sensor_readings/<doc>
+STOPS_COLLECTION = "stops"
+COLLECTION = "sensor_readings"
+# Firestore's commit time, stamped on every reading: the dashboard pages on it, so a reading
+# committed late (spool replay, spilled or dropped from the queue) is still read once
+COMMIT_FIELD = "committed_at"
 
-# ================= SETUP =================
-# 1. Connect to Firestore
-cred = credentials.Certificate(CRED_PATH)
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Batched writes: commit when either limit is hit. Firestore allows max 500 writes per
+# batch and each batch also touches one parent document per stop, so stay at <= 250 readings.
+BATCH_MAX_SIZE = 200
+BATCH_MAX_LINGER = 2.0  # seconds a reading may wait before its batch is committed
+
+# Ingest queue between the MQTT network thread and the Firestore writers
+QUEUE_MAX_SIZE = 10000
+QUEUE_WORKERS = 4
+# When full: "block" the MQTT thread, "drop_oldest" from memory, or "spill" (leave the new
+# reading in the spool). Dropped and spilled readings are still replayed from the spool.
+QUEUE_POLICY = "spill"
+STATS_INTERVAL = 60  # seconds between stats lines
+
+# Prometheus text endpoint (http://METRICS_HOST:METRICS_PORT/metrics); local only by default, None turns it off
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# ================= BATCH WRITER =================
+class BatchWriter:
+    """Accumulates readings and commits them as Firestore write batches"""
+
+    def __init__(self, db, collection=COLLECTION, max_size=BATCH_MAX_SIZE, max_linger=BATCH_MAX_LINGER, spool=None,
+                 metrics=None):
+        self.db = db
+        self.collection = collection
+        self.max_size = min(max_size, 250)
+        self.max_linger = max_linger
+        self.spool = spool
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.pending = []
+        self.oldest = None
+        self.committed = 0
+        self.batches = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=5000)  # receive -> commit seconds, most recent
+        self.stop_flag = threading.Event()
+        self.flusher = threading.Thread(target=self._linger_loop, daemon=True)
+        self.flusher.start()
+
+    def add(self, data, received_at=None, seq=None):
+        """Queue one reading; commits inline when the batch is full"""
+        if received_at is None:
+            received_at = time.monotonic()
+        with self.lock:
+            self.pending.append((data, received_at, seq))
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if len(self.pending) < self.max_size:
+                return
+            batch = self._take()
+        self.commit(batch)
+
+    def flush(self):
+        """Commit whatever is pending right now"""
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self.commit(batch)
+
+    def close(self):
+        """Stop the linger thread and flush the last partial batch"""
+        self.stop_flag.set()
+        self.flusher.join(timeout=self.max_linger + 1)
+        self.flush()
+
+    def commit(self, records):
+        """Write (data, received_at, seq) records as one batch; acks or releases them in the spool"""
+        seqs = [seq for _, _, seq in records if seq is not None]
+        started = time.monotonic()
+        try:
+            batch = self.db.batch()
+            last_seen = {}
+            for data, _, seq in records:
+                stop_id = data["stop_id"]
+                collection = self._stop_collection(stop_id)
+                # Spooled readings get a stable id so a replay overwrites instead of duplicating
+                doc_ref = collection.document(self.spool.doc_id(seq)) if seq is not None else collection.document()
+                batch.set(doc_ref, {**data, COMMIT_FIELD: firestore.SERVER_TIMESTAMP})
+                last_seen[stop_id] = max(last_seen.get(stop_id, data["timestamp"]), data["timestamp"])
+            # One small parent document per stop so the dashboard can list stops
+            for stop_id, timestamp in last_seen.items():
+                batch.set(self.db.collection(STOPS_COLLECTION).document(stop_id), {"last_seen": timestamp}, merge=True)
+            batch.commit()
+        except Exception as e:
+            self.failed += len(records)
+            if self.metrics is not None:
+                self.metrics.batch_failed(len(records), time.monotonic() - started)
+            if seqs:
+                self.spool.release(seqs)
+            print(f"Error: batch of {len(records)} failed: {e}")
+            return False
+        if seqs:
+            self.spool.ack(seqs)
+        now = time.monotonic()
+        latencies = [now - received_at for _, received_at, _ in records]
+        self.latencies.extend(latencies)
+        if self.metrics is not None:
+            self.metrics.batch_committed(now - started, latencies)
+        self.committed += len(records)
+        self.batches += 1
+        print(f" -> Saved {len(records)} readings to Firestore")
+        return True
+
+    def _stop_collection(self, stop_id):
+        return self.db.collection(STOPS_COLLECTION).document(stop_id).collection(self.collection)
+
+    def _take(self):
+        batch, self.pending, self.oldest = self.pending, [], None
+        return batch
+
+    def _linger_loop(self):
+        while not self.stop_flag.wait(min(self.max_linger / 4, 0.25)):
+            with self.lock:
+                expired = self.oldest is not None and time.monotonic() - self.oldest >= self.max_linger
+                batch = self._take() if expired else []
+            if batch:
+                self.commit(batch)
+
+# ================= INGEST QUEUE =================
+class IngestQueue:
+    """Bounded queue drained by a pool of writer workers, off the MQTT network thread"""
+
+    def __init__(self, writer, spool=None, max_size=QUEUE_MAX_SIZE, workers=QUEUE_WORKERS, policy=QUEUE_POLICY):
+        if policy not in ("block", "drop_oldest", "spill"):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        if policy == "spill" and spool is None:
+            raise ValueError("The spill policy needs a spool")
+        self.writer = writer
+        self.spool = spool
+        self.max_size = max_size
+        self.policy = policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closing = False
+        # counters
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def put(self, data, seq=None):
+        """Called from on_message: never does storage I/O"""
+        item = (data, time.monotonic(), seq)
+        released = None
+        with self.cond:
+            if len(self.items) >= self.max_size:
+                if self.policy == "block":
+                    while len(self.items) >= self.max_size and not self.closing:
+                        self.cond.wait()
+                elif self.policy == "drop_oldest":
+                    released = self.items.popleft()[2]
+                    self.dropped += 1
+                else:
+                    released = seq
+                    item = None
+                    self.spilled += 1
+            if item is not None:
+                self.items.append(item)
+                self.enqueued += 1
+                self.max_depth = max(self.max_depth, len(self.items))
+                self.cond.notify()
+        if released is not None:
+            # Still on disk: the spool replayer commits it once the backlog clears
+            self.spool.release([released])
+
+    def close(self, timeout=10):
+        """Let the workers drain what is queued, then stop them"""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=timeout)
+
+    def stats(self):
+        with self.cond:
+            depth = len(self.items)
+            avg_wait = self.wait_total / self.dequeued if self.dequeued else 0.0
+            return {
+                'depth': depth, 'max_depth': self.max_depth, 'enqueued': self.enqueued,
+                'dequeued': self.dequeued, 'dropped': self.dropped, 'spilled': self.spilled,
+                'avg_wait_ms': avg_wait * 1000, 'max_wait_ms': self.wait_max * 1000,
+            }
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.items and not self.closing:
+                    self.cond.wait()
+                if not self.items:
+                    return
+                data, received_at, seq = self.items.popleft()
+                waited = time.monotonic() - received_at
+                self.dequeued += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                self.cond.notify_all()
+            self.writer.add(data, received_at=received_at, seq=seq)
+
+# ================= MQTT CALLBACKS =================
+def stop_id_from_topic(topic):
+    """iot/<stop_id>/telemetry -> stop_id, flat "iot" -> DEFAULT_STOP_ID, anything else -> None"""
+    parts = topic.split("/")
+    if topic == "iot":
+        return DEFAULT_STOP_ID
+    if len(parts) == 3 and parts[0] == "iot" and parts[2] == "telemetry" and STOP_ID_PATTERN.match(parts[1]):
+        return parts[1]
+    return None
 
-# 2. MQTT Callbacks
 def on_connect(client, userdata, flags, rc):
     print("Connected to Mosquitto! Listening...")
-    client.subscribe(MQTT_TOPIC)
+    client.subscribe([(topic, 0) for topic in MQTT_TOPICS])
+    if userdata.get("metrics") is not None:
+        userdata["metrics"].connected()
+
+def on_disconnect(client, userdata, rc):
+    print(f"Disconnected from Mosquitto (rc={rc}), reconnecting...")
+    if userdata.get("metrics") is not None:
+        userdata["metrics"].disconnected()
 
 def on_message(client, userdata, msg):
+    metrics = userdata.get("metrics")
     try:
-        payload = msg.payload.decode()
-        print(f"Received: {payload}")
-        data = json.loads(payload)
-        
-        # Add Server Timestamp
-        data["timestamp"] = datetime.now()
-
-        # Save to Firestore (Collection: 'sensor_readings')
-        db.collection("sensor_readings").add(data)
-        print(" -> Saved to Firestore")
-        
+        stop_id = stop_id_from_topic(msg.topic)
+        if stop_id is None:
+            print(f"Ignored message on unexpected topic: {msg.topic}")
+            if metrics is not None:
+                metrics.ignored_topic()
+            return
+        if metrics is not None:
+            metrics.message(stop_id)
+        try:
+            # JSON, struct or MessagePack, whichever this device sends
+            encoding, payload = decode_payload(msg.payload)
+            print(f"Received [{stop_id}] {encoding}: {payload}")
+            # Server timestamp, the stop it came from, and canonical typed fields from here on
+            reading = Reading.from_payload(payload, stop_id, datetime.now(timezone.utc))
+        except ValueError as e:  # also UnicodeDecodeError and schema.SchemaError
+            print(f"Error: rejected payload from {stop_id}: {e}")
+            if metrics is not None:
+                metrics.decode_failed()
+            return
+        if metrics is not None:
+            metrics.decoded(encoding)
+        data = reading.to_document()
+
+        # Persist locally first, then hand off to the writer pool (stops/<stop_id>/sensor_readings).
+        # The put comes straight after: a seq the spool marks in flight must reach the queue even if
+        # a local consumer below raises, or the replayer would never claim it until a restart.
+        seq = userdata["spool"].append(data)
+        userdata["queue"].put(data, seq)
+        userdata["hotstore"].append(reading)
+        userdata["rollups"].add(reading)
+        userdata["rules"].evaluate(reading)
+
     except Exception as e:
         print(f"Error: {e}")
+        if metrics is not None:
+            metrics.handler_error()
 
 # ================= MAIN LOOP =================
-client = mqtt.Client()
-client.on_connect = on_connect
-client.on_message = on_message
+def main():
+    # 1. Connect to Firestore
+    cred = credentials.Certificate(CRED_PATH)
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+
+    # 2. Spool -> ingest queue -> worker pool -> batched writer; the replayer drains leftovers
+    spool = Spool()
+    metrics = BridgeMetrics()
+    writer = BatchWriter(db, spool=spool, metrics=metrics)
+    queue = IngestQueue(writer, spool=spool)
+    replayer = SpoolReplayer(spool, writer)
+    # Local day-segmented copy for fast dashboard history queries
+    hotstore = HotStoreWriter()
+    # Minute/hour/day aggregates per stop for the dashboard's long periods
+    rollups = RollupAggregator(db)
+    # Alert rules per stop, written to stops/<stop_id>/alerts whether or not a dashboard is open
+    rules = RuleEngine(db)
+    metrics.watch(queue=queue, spool=spool, replayer=replayer, rules=rules)
+    metrics_server = None
+    if METRICS_PORT is not None:
+        try:
+            metrics_server = start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+            print(f"📈 Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            # Observability must not stop ingest: run on without the endpoint
+            print(f"Metrics endpoint disabled, {METRICS_HOST}:{METRICS_PORT} unavailable: {e}")
+    stop_flag = threading.Event()
+
+    def stats_loop():
+        while not stop_flag.wait(STATS_INTERVAL):
+            s = queue.stats()
+            spooled = spool.stats()
+            print(f"📊 queue depth={s['depth']} (max {s['max_depth']}) dropped={s['dropped']} "
+                  f"spilled={s['spilled']} avg wait={s['avg_wait_ms']:.1f}ms | "
+                  f"committed={writer.committed} failed={writer.failed} | "
+                  f"spool rows={spooled['rows']} replayed={replayer.replayed} | alerts active={rules.stats()['active']}")
+
+    threading.Thread(target=stats_loop, daemon=True).start()
+
+    client = mqtt.Client(userdata={"queue": queue, "spool": spool, "hotstore": hotstore, "rollups": rollups,
+                                   "rules": rules, "metrics": metrics})
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+
+    try:
+        client.connect("127.0.0.1", 1883, 60)
+        client.loop_forever()
+    finally:
+        stop_flag.set()
+        queue.close()
+        writer.close()
+        replayer.stop()
+        spool.close()
+        hotstore.close()
+        rollups.close()
+        rules.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
-client.connect("127.0.0.1", 1883, 60)
-client.loop_forever()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Payload decoders for the bridge and the dashboard's live feed, chosen per message
+#
+# Devices may publish any of the registered encodings on the same topic, so a fleet
+# can move from JSON to a compact format one stop at a time. decode_payload() asks
+# each decoder in turn whether the first bytes look like its format:
+#
+#   struct   8 bytes: 0xB1 magic, smoke/air/light as little-endian uint16, flag byte
+#            (see arduino.cpp BINARY_PAYLOAD)
+#   msgpack  a MessagePack map with the JSON field names (pip install msgpack)
+#   json     the firmware's default, ~110 bytes
+#
+# Decoders only turn bytes into a dict of fields; schema.Reading.from_payload() does
+# the aliasing, coercion and validation for every format alike.
+#
+#   python bench_bridge.py   # prints bytes and decode time per format
+
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+STRUCT_MAGIC = 0xB1  # never the first byte of JSON text or of a MessagePack map
+STRUCT_LAYOUT = struct.Struct("<BHHHB")
+# Flag byte bits of the struct payload
+FLAG_RAIN = 0x01
+FLAG_MOTION = 0x02
+FLAG_WINDOW_CLOSED = 0x04
+FLAG_EMERGENCY = 0x08
+
+class PayloadError(ValueError):
+    """Bytes that no registered decoder accepts"""
+
+def _is_struct(raw):
+    return raw[0] == STRUCT_MAGIC
+
+def _decode_struct(raw):
+    _, smoke, air, light, flags = STRUCT_LAYOUT.unpack(raw)
+    return {"smoke": smoke, "air": air, "ldr": light, "rain": bool(flags & FLAG_RAIN),
+            "motion_detected": bool(flags & FLAG_MOTION), "window_closed": bool(flags & FLAG_WINDOW_CLOSED),
+            "panic": bool(flags & FLAG_EMERGENCY)}
+
+def _is_msgpack(raw):
+    return 0x80 <= raw[0] <= 0x8F or raw[0] in (0xDE, 0xDF)  # fixmap, map 16, map 32
+
+def _decode_msgpack(raw):
+    return msgpack.unpackb(raw, raw=False, strict_map_key=True)
+
+def _is_json(raw):
+    return True  # the fallback: json.loads reports anything that is not JSON
+
+def _decode_json(raw):
+    return json.loads(raw)
+
+# (name, detect(raw) -> bool, decode(raw) -> fields), tried in order; JSON goes last
+DECODERS = [("struct", _is_struct, _decode_struct)]
+if msgpack is not None:
+    DECODERS.append(("msgpack", _is_msgpack, _decode_msgpack))
+DECODERS.append(("json", _is_json, _decode_json))
+
+def register_decoder(name, detect, decode):
+    """Add a format, tried before the JSON fallback; detect() must only look at cheap leading bytes"""
+    DECODERS.insert(len(DECODERS) - 1, (name, detect, decode))
+
+def decode_payload(raw):
+    """MQTT payload bytes -> (format name, field dict); raises ValueError when undecodable"""
+    if not raw:
+        raise PayloadError("empty payload")
+    for name, detect, decode in DECODERS:
+        if detect(raw):
+            try:
+                return name, decode(raw)
+            except ValueError:
+                raise
+            except Exception as e:  # e.g. msgpack's own exception types
+                raise PayloadError(f"{name}: {e}") from e
+    raise PayloadError(f"unknown payload format (first byte 0x{raw[0]:02x})")
+
+def encode_struct(smoke, air, light, rain=False, motion=False, window_closed=False, emergency=False):
+    """One reading in the struct layout, as the firmware packs it"""
+    flags = ((FLAG_RAIN if rain else 0) | (FLAG_MOTION if motion else 0)
+             | (FLAG_WINDOW_CLOSED if window_closed else 0) | (FLAG_EMERGENCY if emergency else 0))
+    return STRUCT_LAYOUT.pack(STRUCT_MAGIC, smoke, air, light, flags)
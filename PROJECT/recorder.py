@@ -0,0 +1,175 @@
+# Emergency recordings encoded to disk as the frames arrive, on a worker thread
+#
+# One EmergencyRecorder per camera is shared by every dashboard session. A
+# recording opens with the camera's pre-event footage and then follows the live
+# feed at RECORD_FPS for the requested duration. The pre-event frames are encoded
+# straight from the ring the camera hands over (never copied) and the ring is
+# dropped once written; after that only the frame being encoded is held in
+# memory. stop() just signals the worker, which closes the file.
+#
+# The camera publishes a static scene at a low rate, so frames can arrive sparser
+# than RECORD_FPS. Each frame is held, written again once per RECORD_FPS slot, until
+# the next one's capture time, so the file plays back in real time (XVID stores a
+# repeated frame in a few bytes). Each video also gets a <name>.timestamps.csv with
+# the capture time of every frame it contains.
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+
+from camera import PRE_EVENT_FPS
+
+RECORD_FPS = PRE_EVENT_FPS
+RECORD_SECONDS = 30
+RECORDINGS_KEPT = 20  # finished recordings listed on the dashboard
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emergency_recordings")
+
+def timestamps_path(filepath):
+    """Sidecar listing each frame's capture time (Unix seconds) for a recording"""
+    return os.path.splitext(filepath)[0] + ".timestamps.csv"
+
+class EmergencyRecorder:
+    """Streams one camera's emergency footage into an XVID .avi, one recording at a time"""
+
+    def __init__(self, camera, directory=RECORDINGS_DIR):
+        self.camera = camera
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.current = None  # the recording in progress
+        self.pre_ring = None  # the camera's pre-event ring, handed to the worker, which drops it once written
+        self.stop_flag = threading.Event()
+        self.recordings = deque(maxlen=RECORDINGS_KEPT)  # finished recordings, newest first
+        self.saved = 0  # sequence number of the newest finished recording
+
+    def start(self, duration=RECORD_SECONDS):
+        """Begin a recording unless one is running; returns the seconds of pre-event footage, or None"""
+        with self.lock:
+            if self.current is not None:
+                return None
+            pre_ring = self.camera.take_pre_event()
+            last_id = self.camera.latest()[0]  # anything older is already in the pre-event footage
+            started = datetime.now()
+            # Every camera records the same panic at once: the source keeps the file names apart
+            camera_tag = re.sub(r"[^A-Za-z0-9]+", "_", str(self.camera.source)).strip("_")
+            filename = f"emergency_{started.strftime('%Y%m%d_%H%M%S')}_cam{camera_tag}.avi"
+            self.current = {
+                'camera': self.camera.source,
+                'filename': filename,
+                'filepath': os.path.join(self.directory, filename),
+                'started': started,
+                'duration_limit': duration,
+                'frame_count': 0,
+                'pre_event_frames': len(pre_ring),
+            }
+            self.pre_ring = pre_ring
+            self.stop_flag.clear()
+            self.camera.subscribe(self, pinned=True)
+            self.camera.hint_motion()  # full rate right away; afterwards the scene decides
+            threading.Thread(target=self._encode, args=(self.current, last_id, duration), daemon=True).start()
+        print(f"🔴 Emergency recording started: {filename}")
+        return len(pre_ring) / RECORD_FPS
+
+    def stop(self):
+        """Ask the worker to finish; returns at once"""
+        self.stop_flag.set()
+
+    def status(self):
+        """Copy of the recording in progress, or None"""
+        with self.lock:
+            return dict(self.current) if self.current is not None else None
+
+    def history(self):
+        """Finished recordings (including failed ones), newest first"""
+        with self.lock:
+            return list(self.recordings)
+
+    def finished_since(self, seq):
+        """Finished recordings (including failed ones) with a sequence number above seq, oldest first"""
+        with self.lock:
+            return [recording for recording in reversed(self.recordings) if recording['seq'] > seq]
+
+    def _write(self, writer, info, frame, timestamp):
+        if writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            writer = {'video': cv2.VideoWriter(info['filepath'], fourcc, float(RECORD_FPS), (width, height)),
+                      'timestamps': open(timestamps_path(info['filepath']), "w"), 'frame': None, 'timestamp': None}
+            writer['timestamps'].write("frame,timestamp\n")
+            info['size'] = (width, height)
+            info['first_timestamp'] = timestamp
+        elif frame.shape[1::-1] != info['size']:
+            frame = cv2.resize(frame, info['size'])  # resolution changed mid-recording
+        self._hold(writer, info, timestamp)
+        writer['frame'], writer['timestamp'] = frame, timestamp
+        self._put(writer, info)
+        info['last_timestamp'] = timestamp
+        return writer
+
+    def _hold(self, writer, info, until):
+        """Repeat the last frame for every RECORD_FPS slot that starts before the capture time `until`"""
+        while writer['frame'] is not None and info['first_timestamp'] + (info['frame_count'] + 0.5) / RECORD_FPS < until:
+            self._put(writer, info)
+
+    def _put(self, writer, info):
+        # Camera frames are already BGR, as the writer wants them
+        writer['video'].write(writer['frame'])
+        writer['timestamps'].write(f"{info['frame_count']},{writer['timestamp']:.3f}\n")
+        info['frame_count'] += 1
+
+    def _encode(self, info, last_id, duration):
+        writer = None  # (cv2.VideoWriter, timestamps file), opened with the first frame
+        error = None
+        started = time.monotonic()
+        with self.lock:
+            pre_ring, self.pre_ring = self.pre_ring, None
+        try:
+            for frame, timestamp in pre_ring.items():
+                writer = self._write(writer, info, frame, timestamp)
+            if writer is not None:
+                writer['frame'] = writer['frame'].copy()  # a slot of the ring: holding it would keep the whole ring
+            frame = pre_ring = None  # release the pre-event ring before following the live feed
+            due = time.monotonic()
+            camera_lost = False
+            while not self.stop_flag.is_set() and time.monotonic() - started < duration:
+                last_id, frame = self.camera.wait(last_id, timeout=0.5)
+                now = time.monotonic()
+                if frame is None and self.camera.state in ('offline', 'stopped'):
+                    # wait() returns at once while no capture thread runs: stop instead of spinning
+                    camera_lost = True
+                    print(f"⚠️ Camera {self.camera.source} stopped mid-recording: {info['filename']} ends here")
+                    break
+                if frame is None or now < due:
+                    continue  # the camera delivers faster than RECORD_FPS
+                due = max(due + 1 / RECORD_FPS, now - 1 / RECORD_FPS)
+                writer = self._write(writer, info, frame, time.time())
+            if writer is not None and not camera_lost:
+                self._hold(writer, info, time.time())  # a static scene up to the end still plays in real time
+        except Exception as e:
+            error = str(e)
+            print(f"Error saving video: {e}")
+        finally:
+            if writer is not None:
+                writer['video'].release()
+                writer['timestamps'].close()
+            self.camera.unsubscribe(self)
+        if error is None and info['frame_count'] == 0:
+            error = "No frames captured - ensure camera is enabled"
+        with self.lock:
+            self.saved += 1
+            self.recordings.appendleft({
+                **info,
+                'seq': self.saved,
+                'timestamp': datetime.now(),
+                'duration': info['last_timestamp'] - info['first_timestamp'] if info['frame_count'] else 0.0,
+                'type': 'PANIC_EMERGENCY',
+                'error': error,
+            })
+            self.current = None
+        print(f"💾 Emergency video saved: {info['filepath']} ({info['frame_count']} frames)" if error is None
+              else f"⚠️ Emergency recording failed: {error}")
@@ -0,0 +1,141 @@
+# Minute/hour/day rollups per stop, maintained incrementally by the bridge
+#
+#   stops/<stop_id>/rollups_<resolution>/<bucket_id>
+#     bucket_start, count, last_timestamp, and per field <f>_sum, <f>_min, <f>_max, <f>_last
+#
+# Each flush sends only what changed since the previous flush, using Firestore
+# Increment/Minimum/Maximum transforms, so several bridges (or a restarted one)
+# add into the same bucket documents instead of overwriting each other.
+
+import threading
+from datetime import timedelta
+
+from firebase_admin import firestore
+
+from schema import EPOCH, to_epoch
+
+ROLLUP_FIELDS = ("smoke", "air", "ldr", "motion_detected", "rain")
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+ROLLUP_FLUSH_INTERVAL = 60  # seconds between rollup writes
+ROLLUP_BATCH_LIMIT = 500  # Firestore writes per batch
+STOPS_COLLECTION = "stops"
+
+def bucket_start(timestamp, resolution):
+    """Start of the bucket holding timestamp (day buckets start at midnight UTC)"""
+    size = RESOLUTIONS[resolution]
+    return EPOCH + timedelta(seconds=int(to_epoch(timestamp) // size * size))
+
+def bucket_id(start, resolution):
+    if resolution == "day":
+        return start.strftime("%Y%m%d")
+    if resolution == "hour":
+        return start.strftime("%Y%m%dT%H")
+    return start.strftime("%Y%m%dT%H%M")
+
+def rollup_collection(db, stop_id, resolution):
+    return db.collection(STOPS_COLLECTION).document(stop_id).collection(f"rollups_{resolution}")
+
+class RollupAggregator:
+    """Accumulates count/sum/min/max/last per stop, resolution and bucket; flushes deltas periodically"""
+
+    def __init__(self, db, flush_interval=ROLLUP_FLUSH_INTERVAL):
+        self.db = db
+        self.lock = threading.Lock()
+        self.deltas = {}  # (stop_id, resolution, bucket_start) -> accumulator dict
+        self.flushed = 0
+        self.failed = 0
+        self.stop_flag = threading.Event()
+        self.flush_interval = flush_interval
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def add(self, reading):
+        """O(fields x resolutions) in-memory update for one schema.Reading"""
+        values = {field: int(getattr(reading, field)) for field in ROLLUP_FIELDS}  # flags count as 0/1
+        timestamp = reading.timestamp
+        with self.lock:
+            for resolution in RESOLUTIONS:
+                key = (reading.stop_id, resolution, bucket_start(timestamp, resolution))
+                acc = self.deltas.get(key)
+                if acc is None:
+                    acc = self.deltas[key] = {"count": 0, "last_timestamp": timestamp}
+                    for field in ROLLUP_FIELDS:
+                        value = values[field]
+                        acc[field] = [0, value, value, value]  # sum, min, max, last
+                acc["count"] += 1
+                if timestamp >= acc["last_timestamp"]:
+                    acc["last_timestamp"] = timestamp
+                    newest = True
+                else:
+                    newest = False
+                for field in ROLLUP_FIELDS:
+                    value = values[field]
+                    stats = acc[field]
+                    stats[0] += value
+                    if value < stats[1]:
+                        stats[1] = value
+                    if value > stats[2]:
+                        stats[2] = value
+                    if newest:
+                        stats[3] = value
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+        items = list(deltas.items())
+        for i in range(0, len(items), ROLLUP_BATCH_LIMIT):
+            chunk = items[i:i + ROLLUP_BATCH_LIMIT]
+            try:
+                batch = self.db.batch()
+                for (stop_id, resolution, start), acc in chunk:
+                    doc_ref = rollup_collection(self.db, stop_id, resolution).document(bucket_id(start, resolution))
+                    batch.set(doc_ref, self._update(start, acc), merge=True)
+                batch.commit()
+                self.flushed += len(chunk)
+            except Exception as e:
+                self.failed += len(chunk)
+                print(f"Rollup flush error: {e}")
+                self._restore(chunk)
+
+    def close(self):
+        self.stop_flag.set()
+        self.thread.join(timeout=5)
+        self.flush()
+
+    def _update(self, start, acc):
+        update = {
+            "bucket_start": start,
+            "count": firestore.Increment(acc["count"]),
+            "last_timestamp": acc["last_timestamp"],
+        }
+        for field in ROLLUP_FIELDS:
+            total, low, high, last = acc[field]
+            update[f"{field}_sum"] = firestore.Increment(total)
+            update[f"{field}_min"] = firestore.Minimum(low)
+            update[f"{field}_max"] = firestore.Maximum(high)
+            update[f"{field}_last"] = last
+        return update
+
+    def _restore(self, chunk):
+        """Merge deltas from a failed flush back in so the next flush retries them"""
+        with self.lock:
+            for key, old in chunk:
+                acc = self.deltas.get(key)
+                if acc is None:
+                    self.deltas[key] = old
+                    continue
+                acc["count"] += old["count"]
+                newer = acc["last_timestamp"] >= old["last_timestamp"]
+                if not newer:
+                    acc["last_timestamp"] = old["last_timestamp"]
+                for field in ROLLUP_FIELDS:
+                    stats, previous = acc[field], old[field]
+                    stats[0] += previous[0]
+                    stats[1] = min(stats[1], previous[1])
+                    stats[2] = max(stats[2], previous[2])
+                    if not newer:
+                        stats[3] = previous[3]
+
+    def _flush_loop(self):
+        while not self.stop_flag.wait(self.flush_interval):
+            self.flush()
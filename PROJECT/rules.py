@@ -0,0 +1,221 @@
+# Streaming alert rules, evaluated by the bridge on every reading as it arrives
+#
+# Each rule watches one field of one stop through a rolling window of the last N
+# readings (a ring with a running sum: O(1) per reading, whatever N is) and has
+# hysteresis: it raises when the window mean reaches `on` and clears only once it
+# drops below `off`, so a sensor hovering at the threshold does not flap.
+#
+# Every raise opens one alert document, stops/<stop_id>/alerts/<rule>_<start time>,
+# and the clear updates the same document, so each episode is stored once however
+# many dashboards are open (or none). The dashboard reads this small collection
+# instead of deriving alerts from raw readings in each browser session.
+#
+# An alert still open when the bridge stops is closed by close(), and one left
+# open by a bridge that crashed is closed the first time a restarted bridge hears
+# from that stop, so no alert document stays active forever.
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from rollups import ROLLUP_BATCH_LIMIT
+
+SMOKE_WARNING = 2000  # smoke/air sensor levels the dashboard colours yellow and red
+SMOKE_DANGER = 3000
+AIR_WARNING = 2000
+AIR_DANGER = 3000
+
+# (rule, field, window in readings (5 s apart), raise at mean >=, clear at mean <, severity, message)
+RULES = (
+    ("smoking", "smoke", 3, SMOKE_WARNING, SMOKE_WARNING - 500, "warning", "Cigarette smoke detected inside the shelter"),
+    ("fire_risk", "smoke", 12, SMOKE_DANGER, SMOKE_DANGER - 500, "critical", "Smoke has stayed high for a minute: possible fire"),
+    ("bad_air", "air", 12, AIR_DANGER, AIR_DANGER - 500, "warning", "Poor outdoor air (haze or smoke): window closed"),
+    ("rain", "rain", 6, 0.5, 0.2, "info", "Rain detected: window closed"),
+    ("panic", "panic", 1, 1, 1, "critical", "Panic button pressed"),
+)
+ALERTS_COLLECTION = "alerts"
+STOPS_COLLECTION = "stops"
+ALERT_FLUSH_INTERVAL = 1.0  # seconds between alert writes (nothing is written while all is quiet)
+ALERTS_KEPT = 200  # newest alerts kept in memory for stats() and recent()
+
+def alert_collection(db, stop_id):
+    return db.collection(STOPS_COLLECTION).document(stop_id).collection(ALERTS_COLLECTION)
+
+class RuleState:
+    """One rule's rolling window and alert state for one stop"""
+
+    __slots__ = ("ring", "pos", "count", "total", "alert_id", "peak")
+
+    def __init__(self, window):
+        self.ring = [0] * window
+        self.pos = 0
+        self.count = 0
+        self.total = 0
+        self.alert_id = None  # the open alert while the rule is raised
+        self.peak = 0
+
+    def push(self, value):
+        """Add a value, drop the oldest; returns the window mean"""
+        self.total += value - self.ring[self.pos]
+        self.ring[self.pos] = value
+        self.pos = (self.pos + 1) % len(self.ring)
+        if self.count < len(self.ring):
+            self.count += 1
+        return self.total / self.count
+
+class RuleEngine:
+    """Evaluates RULES per stop on each reading; raises and clears become alert documents"""
+
+    def __init__(self, db=None, rules=RULES, flush_interval=ALERT_FLUSH_INTERVAL):
+        self.db = db  # None: alerts are only kept in memory (the dashboard's demo mode)
+        self.rules = rules
+        self.lock = threading.Lock()
+        self.states = {}  # stop_id -> [RuleState per rule]
+        self.pending = {}  # (stop_id, alert_id) -> fields to merge into the alert document
+        self.unchecked = []  # stops first heard from since the last flush: close what an earlier run left open
+        self.alerts = OrderedDict()  # (stop_id, alert_id) -> alert document, oldest first
+        self.raised = 0
+        self.cleared = 0
+        self.written = 0
+        self.failed = 0
+        self.stop_flag = threading.Event()
+        self.flush_interval = flush_interval
+        self.thread = None
+        if db is not None:
+            self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.thread.start()
+
+    def evaluate(self, reading):
+        """O(rules) per schema.Reading: update each window, raise or clear on the hysteresis thresholds"""
+        events = []
+        with self.lock:
+            states = self.states.get(reading.stop_id)
+            if states is None:
+                states = self.states[reading.stop_id] = [RuleState(rule[2]) for rule in self.rules]
+                if self.db is not None:
+                    self.unchecked.append(reading.stop_id)
+            for (rule, field, _, on, off, severity, message), state in zip(self.rules, states):
+                mean = state.push(int(getattr(reading, field)))
+                if state.alert_id is None:
+                    if mean >= on:
+                        events.append(self._raise(reading, rule, state, mean, severity, message))
+                elif mean < off:
+                    events.append(self._clear(reading.stop_id, reading.timestamp, rule, state, message))
+                elif mean > state.peak:
+                    state.peak = mean
+        for event in events:
+            state_word = "raised" if event['active'] else "cleared"
+            print(f"🚨 Alert {state_word} [{event['stop_id']}] {event['rule']}: {event['message']}")
+        return events
+
+    def recent(self, stop_id):
+        """Copies of one stop's newest alerts as {alert id: alert document}, like its alerts collection"""
+        with self.lock:
+            return {alert_id: dict(alert) for (alert_stop, alert_id), alert in self.alerts.items() if alert_stop == stop_id}
+
+    def stats(self):
+        with self.lock:
+            active = sum(state.alert_id is not None for states in self.states.values() for state in states)
+            return {'raised': self.raised, 'cleared': self.cleared, 'active': active,
+                    'written': self.written, 'failed': self.failed, 'pending': len(self.pending)}
+
+    def flush(self):
+        if self.db is None:
+            return
+        self._close_stale()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        items = list(pending.items())
+        for i in range(0, len(items), ROLLUP_BATCH_LIMIT):
+            chunk = items[i:i + ROLLUP_BATCH_LIMIT]
+            try:
+                batch = self.db.batch()
+                for (stop_id, alert_id), fields in chunk:
+                    batch.set(alert_collection(self.db, stop_id).document(alert_id), fields, merge=True)
+                batch.commit()
+                self.written += len(chunk)
+            except Exception as e:
+                self.failed += len(chunk)
+                print(f"Alert write error: {e}")
+                self._restore(chunk)
+
+    def close(self):
+        self.stop_flag.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_interval + 5)
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            closed = [self._clear(stop_id, now, rule, state, message)
+                      for stop_id, states in self.states.items()
+                      for (rule, _, _, _, _, _, message), state in zip(self.rules, states) if state.alert_id is not None]
+        if closed:
+            print(f"🚨 Closed {len(closed)} open alerts on shutdown")
+        self.flush()
+
+    def _raise(self, reading, rule, state, mean, severity, message):
+        """Caller holds the lock"""
+        state.alert_id = f"{rule}_{reading.timestamp.strftime('%Y%m%dT%H%M%S')}"
+        state.peak = mean
+        alert = {
+            'rule': rule, 'stop_id': reading.stop_id, 'severity': severity, 'message': message,
+            'active': True, 'started': reading.timestamp, 'ended': None, 'updated': reading.timestamp,
+            'value': mean, 'peak': mean,
+        }
+        self._record(reading.stop_id, state.alert_id, alert)
+        self.raised += 1
+        return alert
+
+    def _clear(self, stop_id, timestamp, rule, state, message):
+        """Caller holds the lock"""
+        key = (stop_id, state.alert_id)
+        update = {'active': False, 'ended': timestamp, 'updated': timestamp, 'peak': state.peak}
+        alert = self.alerts.get(key)
+        alert = {**alert, **update} if alert is not None else dict(update, stop_id=stop_id, rule=rule, message=message)
+        self._record(stop_id, state.alert_id, alert, update)
+        state.alert_id = None
+        self.cleared += 1
+        return alert
+
+    def _record(self, stop_id, alert_id, alert, update=None):
+        key = (stop_id, alert_id)
+        self.alerts[key] = alert
+        self.alerts.move_to_end(key)
+        while len(self.alerts) > ALERTS_KEPT:
+            self.alerts.popitem(last=False)
+        if self.db is not None:
+            self.pending[key] = {**self.pending.get(key, {}), **(update if update is not None else alert)}
+
+    def _restore(self, chunk):
+        """Merge fields from a failed write back in so the next flush retries them"""
+        with self.lock:
+            # Older fields first: anything newer that arrived meanwhile wins
+            for key, fields in chunk:
+                self.pending[key] = {**fields, **self.pending.get(key, {})}
+
+    def _close_stale(self):
+        """Close the active alerts of newly seen stops that this engine did not raise (a crashed run's)"""
+        with self.lock:
+            stops, self.unchecked = self.unchecked, []
+        for i, stop_id in enumerate(stops):
+            try:
+                docs = list(alert_collection(self.db, stop_id).where("active", "==", True).stream())
+            except Exception as e:
+                print(f"Alert check error: {e}")
+                with self.lock:
+                    self.unchecked.extend(stops[i:])
+                return
+            now = datetime.now(timezone.utc)
+            with self.lock:
+                open_ids = {state.alert_id for state in self.states.get(stop_id, ())}
+                for doc in docs:
+                    key = (stop_id, doc.id)
+                    if doc.id in open_ids or key in self.alerts or key in self.pending:
+                        continue
+                    update = {'active': False, 'ended': now, 'updated': now}
+                    self._record(stop_id, doc.id, {**doc.to_dict(), **update}, update)
+                    self.cleared += 1
+                    print(f"🚨 Alert closed [{stop_id}] {doc.id}: left open by an earlier run")
+
+    def _flush_loop(self):
+        while not self.stop_flag.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,209 @@
+# Typed reading schema, applied once where a reading enters the system
+#
+# The firmware publishes light/motion/emergency, with emergency as "true"/"false"
+# and window as "OPEN"/"CLOSED", and older Firestore rows hold that raw payload.
+# Reading.from_payload() maps those aliases to the names the rest of the project
+# uses (ldr, motion_detected, panic, window_closed), coerces every value to int or
+# bool and raises SchemaError for anything that is not a reading, including one
+# missing a sensor value (a flag the firmware left out reads False). The bridge then
+# spools, stores, rolls up and writes to the hot store clean values, and the
+# dashboard never has to compare against both True and "true".
+#
+# ReadingColumns is the dashboard's in-memory history: one preallocated NumPy array
+# per column used as a ring buffer, so a rerun gets typed columns (and a DataFrame
+# built straight from them) instead of a list of dicts.
+
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# (field, payload keys it may come from, dtype); "u1" fields are flags
+FIELDS = (
+    ("smoke", ("smoke",), "<i4"),
+    ("air", ("air",), "<i4"),
+    ("ldr", ("ldr", "light"), "<i4"),
+    ("rain", ("rain",), "u1"),
+    ("motion_detected", ("motion_detected", "motion"), "u1"),
+    ("panic", ("panic", "emergency"), "u1"),
+    ("window_closed", ("window_closed", "window"), "u1"),
+)
+FIELD_NAMES = tuple(name for name, _, _ in FIELDS)
+FLAGS = tuple(name for name, _, dtype in FIELDS if dtype == "u1")
+# (column, dtype) of the columnar form: epoch-seconds timestamp first, like the hot store's files
+COLUMNS = (("timestamp", "<f8"),) + tuple((name, dtype) for name, _, dtype in FIELDS)
+# Every reading must carry these: a stored 0 would look like clean air or a dark stop
+REQUIRED = ("smoke", "air", "ldr")
+ADC_MAX = 4095  # ESP32 12-bit analogRead: sensor values outside 0..ADC_MAX are corrupt
+TRUE_STRINGS = frozenset(("true", "1", "yes", "on", "closed"))
+FALSE_STRINGS = frozenset(("false", "0", "no", "off", "open", ""))
+EPOCH = datetime(1970, 1, 1)
+
+class SchemaError(ValueError):
+    """A payload that cannot be turned into a Reading"""
+
+def to_epoch(timestamp):
+    """Naive wall-clock seconds since 1970; aware timestamps (Firestore returns UTC) are taken in UTC"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH).total_seconds()
+
+def to_int(name, value):
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            raise SchemaError(f"{name}: not a number: {value!r}") from None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise SchemaError(f"{name}: not a number: {value!r}")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise SchemaError(f"{name}: not a finite number: {value!r}")
+    if not 0 <= value <= ADC_MAX:
+        raise SchemaError(f"{name}: {value} outside 0..{ADC_MAX}")
+    return int(value)
+
+def to_bool(name, value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in TRUE_STRINGS:
+            return True
+        if text in FALSE_STRINGS:
+            return False
+    elif isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    raise SchemaError(f"{name}: not a flag: {value!r}")
+
+class Reading:
+    """One normalized sensor reading of one stop"""
+
+    __slots__ = ("timestamp", "stop_id") + FIELD_NAMES
+
+    def __init__(self, timestamp, stop_id, smoke=0, air=0, ldr=0, rain=False, motion_detected=False,
+                 panic=False, window_closed=False):
+        self.timestamp = timestamp
+        self.stop_id = stop_id
+        self.smoke = smoke
+        self.air = air
+        self.ldr = ldr
+        self.rain = rain
+        self.motion_detected = motion_detected
+        self.panic = panic
+        self.window_closed = window_closed
+
+    @classmethod
+    def from_payload(cls, payload, stop_id, timestamp):
+        """Decoded JSON (firmware or stored field names) -> Reading; missing flags read False, missing sensors raise"""
+        if not isinstance(payload, dict):
+            raise SchemaError(f"payload is a {type(payload).__name__}, not an object")
+        reading = cls(timestamp, stop_id)
+        missing = []
+        for name, keys, dtype in FIELDS:
+            for key in keys:
+                value = payload.get(key)
+                if value is not None:
+                    setattr(reading, name, to_bool(name, value) if dtype == "u1" else to_int(name, value))
+                    break
+            else:
+                if name in REQUIRED:
+                    missing.append(name)
+        if missing:
+            raise SchemaError(f"missing {', '.join(missing)} in payload")
+        return reading
+
+    @classmethod
+    def from_document(cls, doc):
+        """A stored Firestore reading, written by this bridge or by one from before the schema"""
+        return cls.from_payload(doc, doc.get("stop_id"), doc["timestamp"])
+
+    def to_document(self):
+        """The Firestore document: canonical names and types (window stays "OPEN"/"CLOSED", as the firmware sends it)"""
+        return {
+            "timestamp": self.timestamp, "stop_id": self.stop_id,
+            "smoke": self.smoke, "air": self.air, "ldr": self.ldr, "rain": self.rain,
+            "motion_detected": self.motion_detected, "panic": self.panic,
+            "window": "CLOSED" if self.window_closed else "OPEN",
+        }
+
+    def row(self):
+        """Values in COLUMNS order, the timestamp as epoch seconds"""
+        return (to_epoch(self.timestamp), self.smoke, self.air, self.ldr, self.rain, self.motion_detected,
+                self.panic, self.window_closed)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"Reading({values})"
+
+def to_columns(readings):
+    """Readings -> {column: typed array}, in the given order"""
+    rows = [reading.row() for reading in readings]
+    if not rows:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+    return {name: np.array(values, dtype=dtype) for (name, dtype), values in zip(COLUMNS, zip(*rows))}
+
+def from_columns(columns, stop_id):
+    """{column: array} with epoch-seconds timestamps (e.g. synthetic.generate_stop()) -> Readings, in order"""
+    rows = zip(*(columns[name].tolist() for name, _ in COLUMNS))
+    return [Reading(EPOCH + timedelta(seconds=timestamp), stop_id, *values) for timestamp, *values in rows]
+
+def columns_frame(columns):
+    """{column: array} -> DataFrame as the dashboard reads it: datetime timestamps, bool flags, window as OPEN/CLOSED"""
+    import pandas as pd
+    df = pd.DataFrame({name: values.astype(bool) if name in FLAGS else values for name, values in columns.items()})
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
+    if "window_closed" in df.columns:
+        df["window"] = np.where(df.pop("window_closed"), "CLOSED", "OPEN")
+    return df
+
+class ReadingColumns:
+    """Ring buffer of the newest `capacity` readings, one typed array per column"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.arrays = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self.start = 0  # slot of the oldest reading
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, readings):
+        """Add readings, in any order"""
+        self.extend(to_columns(readings))
+
+    def newest(self):
+        """Epoch seconds of the newest buffered reading (None when empty)"""
+        if not self.size:
+            return None
+        return float(self.arrays["timestamp"][(self.start + self.size - 1) % self.capacity])
+
+    def extend(self, columns):
+        """Add {column: array} (e.g. synthetic.generate_stop()); the buffer stays in timestamp order, older readings fall out"""
+        timestamps = columns["timestamp"]
+        count = len(timestamps)
+        if count and ((self.size and timestamps[0] < self.newest()) or np.any(np.diff(timestamps) < 0)):
+            # Late readings (a spool replay after an outage): merge them in by timestamp, rarely taken
+            buffered = self.columns()
+            merged = {name: np.concatenate((buffered[name], columns[name])) for name, _ in COLUMNS}
+            order = np.argsort(merged["timestamp"], kind="stable")
+            columns = {name: values[order] for name, values in merged.items()}
+            count = len(order)
+            self.start = self.size = 0
+        if count >= self.capacity:
+            for name, array in self.arrays.items():
+                array[:] = columns[name][-self.capacity:]
+            self.start, self.size = 0, self.capacity
+            return
+        slots = (self.start + self.size + np.arange(count)) % self.capacity
+        for name, array in self.arrays.items():
+            array[slots] = columns[name]
+        overflow = max(0, self.size + count - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.size += count - overflow
+
+    def columns(self):
+        """Copy of the buffered readings as {column: array}, oldest first"""
+        slots = (self.start + np.arange(self.size)) % self.capacity
+        return {name: array[slots] for name, array in self.arrays.items()}
@@ -0,0 +1,148 @@
+# Durable write-ahead spool for the MQTT bridge (SQLite, one row per reading)
+#
+# Every decoded reading is appended here before on_message returns. A row is
+# deleted (acked) only once the Firestore batch holding it has committed, so
+# readings survive Firestore outages, quota exhaustion and bridge restarts.
+# Each row's Firestore document id is derived from its sequence number, which
+# makes a replay after a crash overwrite the same document instead of adding
+# a duplicate.
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+SPOOL_PATH = "bridge_spool.db"
+SPOOL_MAX_ROWS = 1_000_000  # ~200 MB of readings; the oldest are discarded past this
+SPOOL_REPLAY_BATCH = 250  # readings per replayed batch (Firestore caps a batch at 500 writes)
+SPOOL_REPLAY_INTERVAL = 5  # seconds between replay attempts when idle
+SPOOL_MAX_BACKOFF = 300  # seconds, cap for the replay backoff after failures
+
+def _encode(data):
+    return json.dumps(data, default=lambda o: o.isoformat() if isinstance(o, datetime) else str(o))
+
+def _decode(payload):
+    data = json.loads(payload)
+    if isinstance(data.get("timestamp"), str):
+        data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+        if data["timestamp"].tzinfo is None:  # spooled by a bridge that stamped naive UTC
+            data["timestamp"] = data["timestamp"].replace(tzinfo=timezone.utc)
+    return data
+
+class Spool:
+    """Append-only SQLite spool with in-flight tracking and bounded size"""
+
+    def __init__(self, path=SPOOL_PATH, max_rows=SPOOL_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        # Autocommit + WAL: an insert is one small append to the WAL and survives
+        # a process crash; synchronous=NORMAL skips the per-commit fsync.
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'spool_id'").fetchone()
+        if row is None:
+            self.spool_id = uuid.uuid4().hex[:12]
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('spool_id', ?)", (self.spool_id,))
+        else:
+            self.spool_id = row[0]
+        self.rows = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        self.inflight = set()  # seqs currently queued or being committed by the live path
+        self.discarded = 0
+
+    def doc_id(self, seq):
+        """Stable Firestore document id for a spooled reading"""
+        return f"{self.spool_id}-{seq:012d}"
+
+    def append(self, data):
+        """Persist one reading and mark it in flight; returns its sequence number"""
+        payload = _encode(data)
+        with self.lock:
+            seq = self.conn.execute(
+                "INSERT INTO entries (created, payload) VALUES (?, ?)", (time.time(), payload)
+            ).lastrowid
+            self.inflight.add(seq)
+            self.rows += 1
+            if self.rows > self.max_rows:
+                self._trim()
+        return seq
+
+    def ack(self, seqs):
+        """Readings are safely in Firestore: delete them"""
+        with self.lock:
+            deleted = self.conn.executemany("DELETE FROM entries WHERE seq = ?", [(seq,) for seq in seqs]).rowcount
+            self.inflight.difference_update(seqs)
+            self.rows -= deleted
+
+    def release(self, seqs):
+        """The live path gave up on these readings; leave them to the replayer"""
+        with self.lock:
+            self.inflight.difference_update(seqs)
+
+    def claim(self, limit=SPOOL_REPLAY_BATCH):
+        """Oldest readings nobody is handling, marked in flight for the replayer"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, payload FROM entries ORDER BY seq LIMIT ?", (limit + len(self.inflight),)
+            ).fetchall()
+            claimed = [(seq, payload) for seq, payload in rows if seq not in self.inflight][:limit]
+            self.inflight.update(seq for seq, _ in claimed)
+        return [(seq, _decode(payload)) for seq, payload in claimed]
+
+    def stats(self):
+        with self.lock:
+            return {'rows': self.rows, 'inflight': len(self.inflight), 'discarded': self.discarded}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _trim(self):
+        excess = self.rows - self.max_rows
+        self.conn.execute(
+            "DELETE FROM entries WHERE seq IN (SELECT seq FROM entries ORDER BY seq LIMIT ?)", (excess,)
+        )
+        self.rows -= excess
+        self.discarded += excess
+        print(f"⚠️ Spool full ({self.max_rows} rows): discarded {excess} oldest readings")
+
+class SpoolReplayer:
+    """Background thread that re-commits spooled readings once Firestore accepts writes again"""
+
+    def __init__(self, spool, writer, interval=SPOOL_REPLAY_INTERVAL, batch_size=SPOOL_REPLAY_BATCH):
+        self.spool = spool
+        self.writer = writer
+        self.interval = interval
+        self.batch_size = batch_size
+        self.replayed = 0
+        self.stop_flag = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_flag.set()
+        self.thread.join(timeout=5)
+
+    def _loop(self):
+        backoff = self.interval
+        while not self.stop_flag.wait(backoff):
+            # Drain in bulk while commits succeed, back off exponentially when they don't
+            while not self.stop_flag.is_set():
+                claimed = self.spool.claim(self.batch_size)
+                if not claimed:
+                    backoff = self.interval
+                    break
+                now = time.monotonic()
+                if not self.writer.commit([(data, now, seq) for seq, data in claimed]):
+                    backoff = min(backoff * 2, SPOOL_MAX_BACKOFF)
+                    break
+                self.replayed += len(claimed)
+                print(f" -> Replayed {len(claimed)} spooled readings")
@@ -0,0 +1,210 @@
+# Seeded, NumPy-vectorized synthetic sensor readings for demo mode, load tests and benchmarks
+#
+# Readings come out as columns (one array per field) named like the hot store's
+# column files: timestamp (epoch seconds in UTC, as the bridge stamps them),
+# smoke, air, ldr, rain, motion_detected, panic and window_closed.
+# to_records() turns them into the rows the dashboard reads from Firestore, and
+# to_payloads() into the JSON (or binary) payloads the ESP32 publishes.
+#
+# The model per stop:
+#   ldr       daylight curve (higher = brighter), dimmed by the day's cloud cover and by rain
+#   motion    passenger arrivals peaking at the morning and evening rush, scaled per stop
+#   air       per-stop baseline + rush-hour traffic + a slowly drifting haze level
+#   smoke     sensor noise plus short smoking episodes
+#   rain      whole episodes (tens of minutes), not independent samples
+#   panic     rare injected presses, held for the firmware's 15 s emergency mode
+#   window    closed on rain, bad air or panic, like the firmware
+#
+# Events (clouds, rain, haze, smoking, panic) are drawn per stop and calendar day
+# from their own seed, so the same stop and day look the same whichever range is
+# generated: a stream extended chunk by chunk stays consistent.
+#
+#   python synthetic.py --stops 1000 --days 30 --interval 60
+#   python synthetic.py --stops 5 --days 30 --hotstore hotstore   # a month of local history
+
+import argparse
+import json
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from schema import ADC_MAX, COLUMNS, FLAGS, to_epoch
+
+SAMPLE_INTERVAL = 5  # seconds between readings, as the firmware publishes
+RAIN_EPISODES_PER_DAY = 0.6
+RAIN_MEAN_MINUTES = 40
+SMOKING_EPISODES_PER_DAY = 1.5
+PANIC_EVENTS_PER_DAY = 0.05  # per stop
+PANIC_SECONDS = 15  # firmware emergencyDuration
+AIR_THRESHOLD = 4000  # firmware airQualityThreshold: the window closes above it
+DAY = 86400
+
+def stop_name(stop):
+    """Stop index -> stop id (0 -> "stop-01", the dashboard's default stop)"""
+    return f"stop-{stop + 1:02d}"
+
+def stop_index(stop_id):
+    """stop_name() reversed ("stop-01" -> 0); other ids get a stable index of their own"""
+    prefix, _, number = stop_id.rpartition("-")
+    if prefix == "stop" and number.isdigit():
+        return int(number) - 1
+    return zlib.crc32(stop_id.encode())
+
+def _within(t, starts, ends):
+    """Mask of the sorted times t that fall inside any [start, end) interval"""
+    edges = np.zeros(len(t) + 1, dtype=np.int32)
+    np.add.at(edges, np.searchsorted(t, starts), 1)
+    np.add.at(edges, np.searchsorted(t, ends), -1)
+    return np.cumsum(edges[:-1]) > 0
+
+def _day_events(seed, stop, days, busy):
+    """Per-day draws for the calendar days in `days` (day numbers since 1970), reproducible per stop and day"""
+    cloud = np.empty(len(days))
+    haze = np.empty(len(days))
+    rain, smoking, panic = [], [], []
+    for i, day in enumerate(days):
+        rng = np.random.default_rng([seed, stop, int(day)])
+        start = day * DAY
+        cloud[i] = rng.uniform(0.45, 1.0)
+        haze[i] = rng.normal(0, 250)
+        count = rng.poisson(RAIN_EPISODES_PER_DAY)
+        begins = start + rng.uniform(0, DAY, count)
+        rain.append(np.stack([begins, begins + rng.exponential(RAIN_MEAN_MINUTES * 60, count)]))
+        count = rng.poisson(SMOKING_EPISODES_PER_DAY * busy)
+        begins = start + rng.uniform(7 * 3600, 23 * 3600, count)
+        smoking.append(np.stack([begins, begins + rng.uniform(120, 300, count)]))
+        count = rng.poisson(PANIC_EVENTS_PER_DAY)
+        begins = start + rng.uniform(0, DAY, count)
+        panic.append(np.stack([begins, begins + PANIC_SECONDS]))
+    return cloud, haze, np.concatenate(rain, axis=1), np.concatenate(smoking, axis=1), np.concatenate(panic, axis=1)
+
+def generate_stop(stop, start, end, interval=SAMPLE_INTERVAL, seed=0):
+    """One stop's readings on the interval grid in [start, end) as {column: array}"""
+    t0 = np.ceil(to_epoch(start) / interval) * interval
+    t = t0 + np.arange(max(0, int(np.ceil((to_epoch(end) - t0) / interval)))) * interval
+    n = len(t)
+    if n == 0:
+        return {name: t if name == "timestamp" else np.empty(0, dtype=bool if name in FLAGS else np.int32) for name, _ in COLUMNS}
+    profile = np.random.default_rng([seed, stop])
+    busy = profile.lognormal(0, 0.4)  # how crowded this stop is
+    air_base = profile.normal(1100, 150)
+    rng = np.random.default_rng([seed, stop, int(t0)])
+
+    day_of = (t // DAY).astype(np.int64)
+    days = np.arange(day_of[0], day_of[-1] + 1)
+    cloud, haze, rain_spans, smoking_spans, panic_spans = _day_events(seed, stop, days, busy)
+    hour = (t % DAY) / 3600
+    rain = _within(t, *rain_spans)
+    smoking = _within(t, *smoking_spans)
+    panic = _within(t, *panic_spans)
+
+    sun = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, 1)
+    ldr = 200 + 3600 * sun * cloud[day_of - days[0]] * np.where(rain, 0.5, 1.0) + rng.normal(0, 60, n)
+
+    rush = np.exp(-((hour - 8) / 1.2) ** 2) + 0.9 * np.exp(-((hour - 18) / 1.5) ** 2)
+    daytime = ((hour >= 6) & (hour < 23)) * 0.15
+    motion = rng.random(n) < np.clip((0.02 + daytime + 0.6 * rush) * busy, 0, 0.95)
+
+    # Haze drifts smoothly between per-day levels drawn at noon
+    haze_level = np.interp(t, days * DAY + DAY / 2, haze)
+    air = air_base + 600 * rush + haze_level - 150 * rain + rng.normal(0, 40, n)
+    smoke = 600 + rng.normal(0, 50, n) + smoking * rng.uniform(1800, 3200, n)
+
+    columns = {
+        "timestamp": t,
+        "smoke": np.clip(smoke, 0, ADC_MAX).astype(np.int32),
+        "air": np.clip(air, 0, ADC_MAX).astype(np.int32),
+        "ldr": np.clip(ldr, 0, ADC_MAX).astype(np.int32),
+        "rain": rain,
+        "motion_detected": motion,
+        "panic": panic,
+    }
+    columns["window_closed"] = rain | (columns["air"] > AIR_THRESHOLD) | panic
+    return columns
+
+def iter_stops(stops, start, end, interval=SAMPLE_INTERVAL, seed=0):
+    """(stop_id, columns) for stops 0..stops-1, one at a time (constant memory however many stops)"""
+    for stop in range(stops):
+        yield stop_name(stop), generate_stop(stop, start, end, interval, seed)
+
+def to_records(columns, stop_id=None):
+    """Rows shaped like the dashboard's Firestore readings, oldest first"""
+    timestamps = (columns["timestamp"] * 1000).astype("datetime64[ms]").tolist()
+    panic = np.where(columns["panic"], "true", "false").tolist()
+    window = np.where(columns["window_closed"], "CLOSED", "OPEN").tolist()
+    records = [
+        {'timestamp': timestamp, 'smoke': smoke, 'air': air, 'ldr': ldr, 'rain': rain, 'motion_detected': motion,
+         'window': window_state, 'emergency': panic, 'panic': panic}
+        for timestamp, smoke, air, ldr, rain, motion, window_state, panic in zip(
+            timestamps, columns["smoke"].tolist(), columns["air"].tolist(), columns["ldr"].tolist(),
+            columns["rain"].tolist(), columns["motion_detected"].tolist(), window, panic)
+    ]
+    if stop_id is not None:
+        for record in records:
+            record['stop_id'] = stop_id
+    return records
+
+def to_payloads(columns, stop_id, encoding="json"):
+    """(topic, payload bytes) per reading, as the ESP32 publishes them: "json", "struct" or "msgpack" (see payloads.py)"""
+    topic = f"iot/{stop_id}/telemetry"
+    if encoding == "struct":
+        import payloads
+        # The whole batch packed at once, then cut into one fixed-size record per reading
+        packed = np.zeros(len(columns["timestamp"]), dtype=np.dtype(
+            [("magic", "u1"), ("smoke", "<u2"), ("air", "<u2"), ("light", "<u2"), ("flags", "u1")]))
+        packed["magic"] = payloads.STRUCT_MAGIC
+        packed["smoke"], packed["air"], packed["light"] = columns["smoke"], columns["air"], columns["ldr"]
+        packed["flags"] = (columns["rain"] * payloads.FLAG_RAIN | columns["motion_detected"] * payloads.FLAG_MOTION
+                           | columns["window_closed"] * payloads.FLAG_WINDOW_CLOSED | columns["panic"] * payloads.FLAG_EMERGENCY)
+        data, size = packed.tobytes(), packed.itemsize
+        return [(topic, data[i:i + size]) for i in range(0, len(data), size)]
+    window = np.where(columns["window_closed"], "CLOSED", "OPEN").tolist()
+    emergency = np.where(columns["panic"], "true", "false").tolist()
+    fields = [
+        {"smoke": smoke, "air": air, "light": light, "rain": rain, "motion": motion, "window": window_state, "emergency": panic}
+        for smoke, air, light, rain, motion, window_state, panic in zip(
+            columns["smoke"].tolist(), columns["air"].tolist(), columns["ldr"].tolist(), columns["rain"].tolist(),
+            columns["motion_detected"].tolist(), window, emergency)
+    ]
+    if encoding == "msgpack":
+        import msgpack
+        return [(topic, msgpack.packb(reading)) for reading in fields]
+    return [(topic, json.dumps(reading).encode()) for reading in fields]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic bus stop readings and report the generation rate")
+    parser.add_argument("--stops", type=int, default=1000)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=SAMPLE_INTERVAL, help="seconds between readings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hotstore", help="also write the readings into this hot store directory")
+    args = parser.parse_args()
+
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+    start = end - timedelta(days=args.days)
+    writer = None
+    if args.hotstore:
+        from hotstore import HotStoreWriter
+        writer = HotStoreWriter(args.hotstore)
+    rows = panics = rainy = nbytes = 0
+    started = time.perf_counter()
+    for stop_id, columns in iter_stops(args.stops, start, end, args.interval, args.seed):
+        rows += len(columns["timestamp"])
+        panics += int(np.count_nonzero(np.diff(columns["panic"].astype(np.int8), prepend=0) == 1))
+        rainy += int(np.count_nonzero(columns["rain"]))
+        nbytes += sum(array.nbytes for array in columns.values())
+        if writer is not None:
+            writer.append_columns(stop_id, columns)
+    elapsed = time.perf_counter() - started
+    if writer is not None:
+        writer.close()
+    print(f"{args.stops} stops x {args.days:g} days at {args.interval:g}s: {rows:,} readings in {elapsed:.1f}s "
+          f"({rows / max(elapsed, 1e-9) / 1e6:.1f} M rows/s, {nbytes / max(rows, 1):.0f} bytes/row in columns)")
+    print(f"  {panics} panic events, {rainy / max(rows, 1):.1%} of readings in rain")
+    if writer is not None:
+        print(f"  written to hot store {args.hotstore}")
+
+if __name__ == "__main__":
+    main()